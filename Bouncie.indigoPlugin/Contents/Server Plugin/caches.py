@@ -0,0 +1,209 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Small in-memory caches shared by the plugin.
+
+import json
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class TTLCache(object):
+
+	# bounded LRU cache whose entries expire ttl seconds after they were stored.
+	# entries are kept as key -> ( storedTime, value ) in least recently used order.
+
+	def __init__(self, maxSize, ttl, clock=time.time):
+		self.maxSize = max( 1, int( maxSize ) )
+		self.ttl = float( ttl )
+		self.clock = clock
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+		self.saveLock = threading.Lock()
+
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+
+	def _lookup(self, key, now):
+		# caller holds the lock. returns the entry, or None if missing or expired
+		entry = self.entries.pop( key, None )
+		if( entry == None ):
+			return None
+		if( now - entry[0] > self.ttl ):
+			return None
+		# reinsert to mark as most recently used
+		self.entries[ key ] = entry
+		return entry
+
+
+	def _store(self, key, value, storedTime):
+		# caller holds the lock
+		self.entries.pop( key, None )
+		self.entries[ key ] = ( storedTime, value )
+		while len( self.entries ) > self.maxSize:
+			self.entries.popitem( last=False )
+			self.evictions += 1
+
+
+	def get(self, key, default=None):
+		with self.lock:
+			entry = self._lookup( key, self.clock() )
+			if( entry == None ):
+				self.misses += 1
+				return default
+			self.hits += 1
+			return entry[1]
+
+
+	def age(self, key):
+		# seconds since the entry was stored, or None if it is missing or expired
+		with self.lock:
+			now = self.clock()
+			entry = self._lookup( key, now )
+			if( entry == None ):
+				return None
+			return now - entry[0]
+
+
+	def put(self, key, value):
+		with self.lock:
+			self._store( key, value, self.clock() )
+
+
+	def seen(self, key):
+		# True if key is already cached (a hit); otherwise remembers it and returns False
+		with self.lock:
+			now = self.clock()
+			if( self._lookup( key, now ) != None ):
+				self.hits += 1
+				return True
+			self.misses += 1
+			self._store( key, True, now )
+			return False
+
+
+	def pop(self, key, default=None):
+		with self.lock:
+			entry = self.entries.pop( key, None )
+			if( entry == None ):
+				return default
+			return entry[1]
+
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+
+	def __len__(self):
+		return len( self.entries )
+
+
+	def save(self, path):
+		# entries are written as [ key, storedTime, value ], so keys and values must be
+		# JSON serializable and the clock must be wall time for them to survive a restart
+		with self.lock:
+			now = self.clock()
+			data = [ [ key, entry[0], entry[1] ] for key, entry in self.entries.items() if now - entry[0] <= self.ttl ]
+
+		with self.saveLock:
+			tmpPath = path + ".tmp"
+			with open( tmpPath, "w" ) as f:
+				json.dump( data, f )
+			os.rename( tmpPath, path )
+
+
+	def load(self, path):
+		if( not os.path.exists( path ) ):
+			return 0
+		with open( path, "r" ) as f:
+			data = json.load( f )
+
+		with self.lock:
+			now = self.clock()
+			for key, storedTime, value in data:
+				if( now - storedTime <= self.ttl ):
+					self._store( key, value, storedTime )
+		return len( self.entries )
+
+
+	def stats(self):
+		return {
+			"size": len( self.entries ),
+			"hits": self.hits,
+			"misses": self.misses,
+			"evictions": self.evictions,
+		}
+
+
+class RefreshingValue(object):
+
+	# a single cached value with stale-while-revalidate. get() returns whatever is
+	# cached, starting one background reload once it is older than ttl; it only waits
+	# on the loader when nothing has been loaded yet. set() lets a caller that already
+	# has fresh data (e.g. the polling loop) populate it without a load.
+
+	def __init__(self, loader, logger, ttl, clock=time.time):
+		self.loader = loader
+		self.logger = logger
+		self.ttl = float( ttl )
+		self.clock = clock
+
+		self.value = None
+		self.updatedAt = None
+		self.refreshing = False
+		self.cond = threading.Condition()
+
+
+	def set(self, value):
+		with self.cond:
+			self.value = value
+			self.updatedAt = self.clock()
+
+
+	def get(self):
+		with self.cond:
+			if( self.value != None ):
+				if( self.clock() - self.updatedAt >= self.ttl and not self.refreshing ):
+					self.refreshing = True
+					t = threading.Thread( target=self._load, name="BouncieRefresh" )
+					t.daemon = True
+					t.start()
+				return self.value
+
+			if( not self.refreshing ):
+				self.refreshing = True
+				loadHere = True
+			else:
+				loadHere = False
+
+		if( loadHere ):
+			self._load()
+		else:
+			with self.cond:
+				while self.refreshing:
+					self.cond.wait( 30 )
+
+		with self.cond:
+			return self.value
+
+
+	def _load(self):
+		# caller has set self.refreshing
+		try:
+			value = self.loader()
+			with self.cond:
+				self.value = value
+				self.updatedAt = self.clock()
+		except Exception, e:
+			self.logger.warning( u"refresh failed, keeping cached value: %s" % e )
+		finally:
+			with self.cond:
+				self.refreshing = False
+				self.cond.notify_all()
@@ -0,0 +1,185 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Table-driven mapping of Bouncie JSON to device states.
+#
+# A spec is a list of ( source path, state id, converter ). Paths are dotted keys
+# into the payload; a converter of None passes the value through. Each spec is
+# compiled once into a tree of extractor closures that visits every nested object
+# a single time, emitting the key/value list updateStatesOnServer takes. Keys that
+# are missing from the payload are skipped, so a partial payload only touches the
+# states it has data for.
+
+from collections import OrderedDict
+
+
+def milOn(value):
+	# mil webhooks report "ON" / "OFF"
+	if( isinstance( value, basestring ) ):
+		return value.upper() == "ON"
+	return bool( value )
+
+
+VEHICLE_STATES = (
+	( "model.make", "model-make", None ),
+	( "model.name", "model-name", None ),
+	( "model.year", "model-year", None ),
+	( "nickname", "nickname", None ),
+	# the API spells it nickName
+	( "nickName", "nickname", None ),
+	( "standardEngine", "standardEngine", None ),
+	( "vin", "vin", None ),
+	( "imei", "imei", None ),
+	( "stats.localTimezone", "stats-localTimezone", None ),
+	( "stats.lastUpdated", "stats-lastUpdated", None ),
+	( "stats.location.lat", "stats-location-lat", None ),
+	( "stats.location.lon", "stats-location-long", None ),
+	( "stats.location.heading", "stats-location-heading", None ),
+	( "stats.location.address", "stats-location-address", None ),
+	( "stats.fuelLevel", "stats-fuelLevel", None ),
+	( "stats.isRunning", "stats-isRunning", None ),
+	( "stats.speed", "stats-speed", None ),
+	( "stats.mil.milOn", "mil-milOn", None ),
+	( "stats.mil.lastUpdated", "mil-lastUpdated", None ),
+	( "stats.battery.status", "battery-status", None ),
+	( "stats.battery.lastUpdated", "battery-lastUpdated", None ),
+)
+
+WEBHOOK_STATES = {
+	"connect": (
+		( "connect.timestamp", "connect-timestamp", None ),
+		( "connect.latitude", "stats-location-lat", float ),
+		( "connect.longitude", "stats-location-long", float ),
+	),
+	"disconnect": (
+		( "disconnect.timestamp", "disconnect-timestamp", None ),
+		( "disconnect.latitude", "stats-location-lat", float ),
+		( "disconnect.longitude", "stats-location-long", float ),
+	),
+	"battery": (
+		( "battery.value", "battery-status", None ),
+		( "battery.timestamp", "battery-lastUpdated", None ),
+	),
+	"mil": (
+		( "mil.value", "mil-milOn", milOn ),
+		( "mil.timestamp", "mil-lastUpdated", None ),
+		( "mil.codes", "mil-codes", None ),
+	),
+	"tripStart": (
+		( "start.timestamp", "tripStart-timestamp", None ),
+		( "start.odometer", "tripStart-odometer", float ),
+	),
+	# applied to the newest point of data[], see flattenWebhook
+	"tripData": (
+		( "timestamp", "stats-lastUpdated", None ),
+		( "speed", "stats-speed", None ),
+		( "gps.lat", "stats-location-lat", float ),
+		( "gps.lon", "stats-location-long", float ),
+		( "gps.heading", "stats-location-heading", None ),
+	),
+	"tripMetrics": (
+		( "metrics.timestamp", "tripMetrics-timestamp", None ),
+		( "metrics.tripTime", "tripMetrics-tripTime", None ),
+		( "metrics.tripDistance", "tripMetrics-tripDistance", None ),
+		( "metrics.totalIdlingTime", "tripMetrics-totalIdlingTime", None ),
+		( "metrics.maxSpeed", "tripMetrics-maxSpeed", None ),
+		( "metrics.averageDriveSpeed", "tripMetrics-averageDriveSpeed", None ),
+		( "metrics.hardBrakingCounts", "tripMetrics-hardBrakingCounts", None ),
+		( "metrics.hardAccelerationCounts", "tripMetrics-hardAccelerationCounts", None ),
+	),
+	"tripEnd": (
+		( "end.timestamp", "tripEnd-timestamp", None ),
+		( "end.odometer", "tripEnd-odometer", float ),
+		( "end.fuelConsumed", "tripEnd-fuelConsumed", float ),
+	),
+}
+
+
+_MISSING = object()
+
+
+def compileSpec(spec):
+	# returns flatten( obj ) -> [ { 'key': stateId, 'value': value }, ... ]
+	# keeps the spec's order, so states come out in the order they are listed
+	tree = OrderedDict()
+	for path, stateId, converter in spec:
+		keys = path.split( "." )
+		node = tree
+		for key in keys[:-1]:
+			node = node.setdefault( key, OrderedDict() )
+			if( not isinstance( node, dict ) ):
+				raise ValueError( "%s is both a value and an object in the spec" % path )
+		node.setdefault( keys[-1], [] )
+		if( not isinstance( node[ keys[-1] ], list ) ):
+			raise ValueError( "%s is both a value and an object in the spec" % path )
+		node[ keys[-1] ].append( ( stateId, converter ) )
+
+	extract = _compileNode( tree )
+
+	def flatten(obj):
+		out = []
+		extract( obj, out )
+		return out
+	return flatten
+
+
+def _compileNode(node):
+	# entries are ( key, stateId, converter, None ) for a value and
+	# ( key, None, None, extractor ) for a nested object
+	entries = []
+	for key, child in node.items():
+		if( isinstance( child, list ) ):
+			for stateId, converter in child:
+				entries.append( ( key, stateId, converter, None ) )
+		else:
+			entries.append( ( key, None, None, _compileNode( child ) ) )
+	entries = tuple( entries )
+
+	def extract(obj, out):
+		if( not isinstance( obj, dict ) ):
+			return
+		get = obj.get
+		for key, stateId, converter, child in entries:
+			value = get( key, _MISSING )
+			if( value is _MISSING ):
+				continue
+			if( child != None ):
+				if( value != None ):
+					child( value, out )
+				continue
+			if( converter != None and value != None ):
+				try:
+					value = converter( value )
+				except ( TypeError, ValueError ):
+					continue
+			out.append( { 'key': stateId, 'value': value } )
+	return extract
+
+
+flattenVehicle = compileSpec( VEHICLE_STATES )
+
+_webhookFlatteners = dict( ( eventType, compileSpec( spec ) ) for eventType, spec in WEBHOOK_STATES.items() )
+
+
+def latestPoint(payload):
+	# newest entry of a tripData payload's data[] that has a position
+	latest = None
+	for point in payload.get( 'data', [] ):
+		gps = point.get( 'gps' )
+		if( not isinstance( gps, dict ) or gps.get( 'lat' ) == None or gps.get( 'lon' ) == None ):
+			continue
+		if( latest == None or point.get( 'timestamp', "" ) >= latest.get( 'timestamp', "" ) ):
+			latest = point
+	return latest
+
+
+def flattenWebhook(eventType, payload):
+	flatten = _webhookFlatteners.get( eventType )
+	if( flatten == None ):
+		return []
+	if( eventType == "tripData" ):
+		payload = latestPoint( payload )
+		if( payload == None ):
+			return []
+	return flatten( payload )
@@ -0,0 +1,41 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Coordinate helpers.
+
+import math
+
+
+def parseLatLong(latLongCSV):
+	# "40.1234567,-75.123456" -> ( 40.1234567, -75.123456 )
+	lat, lon = str( latLongCSV ).split( "," )
+	return ( float( lat ), float( lon ) )
+
+
+def quantize(lat, lon, precision):
+	# key for the grid cell containing lat/lon. precision is decimal places of a
+	# degree: 3 is roughly 110 m, 4 roughly 11 m, 5 roughly 1 m
+	return "%.*f,%.*f" % ( precision, round( lat, precision ), precision, round( lon, precision ) )
+
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def haversineMiles(lat1, lon1, lat2, lon2):
+	lat1, lon1, lat2, lon2 = map( math.radians, ( lat1, lon1, lat2, lon2 ) )
+	a = math.sin( ( lat2 - lat1 ) / 2 ) ** 2 + math.cos( lat1 ) * math.cos( lat2 ) * math.sin( ( lon2 - lon1 ) / 2 ) ** 2
+	return 2 * EARTH_RADIUS_MILES * math.asin( math.sqrt( a ) )
+
+
+def bearing(lat1, lon1, lat2, lon2):
+	# initial compass bearing from point 1 to point 2, 0-360 degrees
+	lat1, lon1, lat2, lon2 = map( math.radians, ( lat1, lon1, lat2, lon2 ) )
+	x = math.sin( lon2 - lon1 ) * math.cos( lat2 )
+	y = math.cos( lat1 ) * math.sin( lat2 ) - math.sin( lat1 ) * math.cos( lat2 ) * math.cos( lon2 - lon1 )
+	return ( math.degrees( math.atan2( x, y ) ) + 360 ) % 360
+
+
+def angleDifference(a, b):
+	# smallest difference between two compass headings, 0-180 degrees
+	return abs( ( a - b + 180 ) % 360 - 180 )
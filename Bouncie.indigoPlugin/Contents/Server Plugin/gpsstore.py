@@ -0,0 +1,216 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Append-only store for the GPS points in tripData webhooks.
+#
+# Points are buffered in memory and written in one transaction once batchSize
+# points are waiting or flushInterval seconds have passed, so a busy trip costs one
+# commit every few seconds rather than one per webhook. Rows are keyed by
+# ( imei, timestamp ) in a WITHOUT ROWID table, which keeps each vehicle's points
+# stored together in time order and makes a redelivered point a no-op. Points older
+# than retentionDays are deleted from the periodic flush, at most every pruneInterval
+# seconds; a retentionDays of 0 keeps everything.
+
+import calendar
+import sqlite3
+import threading
+import time
+
+from tripstore import parseTime
+
+
+POINT_COLUMNS = ( "imei", "ts", "lat", "lon", "speed", "heading", "satelliteCount", "hdop" )
+
+
+def toEpochMillis(timestamp):
+	value = parseTime( timestamp )
+	return calendar.timegm( value.timetuple() ) * 1000 + value.microsecond // 1000
+
+
+def pointRow(imei, point):
+	# a row for one entry of a tripData payload's data[], or None if it has no position
+	gps = point.get( "gps" )
+	timestamp = point.get( "timestamp" )
+	if( not isinstance( gps, dict ) or gps.get( "lat" ) == None or gps.get( "lon" ) == None or timestamp == None ):
+		return None
+	try:
+		ts = toEpochMillis( timestamp )
+	except ValueError:
+		return None
+	return (
+		imei, ts, float( gps[ "lat" ] ), float( gps[ "lon" ] ),
+		point.get( "speed" ), gps.get( "heading" ),
+		gps.get( "satelliteCount", point.get( "satelliteCount" ) ),
+		gps.get( "hdop", point.get( "hdop" ) ),
+	)
+
+
+class GpsStore(object):
+
+	def __init__(self, path, batchSize=500, flushInterval=5.0, retentionDays=30, pruneInterval=3600, clock=time.time):
+		self.path = path
+		self.batchSize = batchSize
+		self.flushInterval = flushInterval
+		self.retentionDays = retentionDays
+		self.pruneInterval = pruneInterval
+		self.clock = clock
+		# the first periodic flush prunes
+		self.lastPrune = None
+
+		self.buffer = []
+		self.bufferLock = threading.Lock()
+		self.lastFlush = clock()
+
+		self.lock = threading.Lock()
+		self.conn = sqlite3.connect( path, check_same_thread=False )
+		self.conn.execute( "PRAGMA journal_mode=WAL" )
+		self.conn.execute( "PRAGMA synchronous=NORMAL" )
+		with self.lock:
+			self.conn.execute( """
+				CREATE TABLE IF NOT EXISTS gps_points (
+					imei TEXT NOT NULL,
+					ts INTEGER NOT NULL,
+					lat REAL NOT NULL,
+					lon REAL NOT NULL,
+					speed REAL,
+					heading REAL,
+					satelliteCount INTEGER,
+					hdop REAL,
+					PRIMARY KEY ( imei, ts )
+				) WITHOUT ROWID
+			""" )
+			self.conn.commit()
+
+		self.appended = 0
+		self.written = 0
+		self.flushes = 0
+		self.pruned = 0
+
+
+	def append(self, imei, points):
+		# points is a tripData payload's data[]. returns the number of points buffered
+		rows = []
+		for point in points:
+			row = pointRow( imei, point )
+			if( row != None ):
+				rows.append( row )
+
+		with self.bufferLock:
+			self.buffer.extend( rows )
+			self.appended += len( rows )
+			full = len( self.buffer ) >= self.batchSize
+
+		if( full ):
+			self.flush()
+		return len( rows )
+
+
+	def flushIfDue(self):
+		# called periodically so a quiet buffer still reaches disk, and old points go
+		if( len( self.buffer ) > 0 and self.clock() - self.lastFlush >= self.flushInterval ):
+			self.flush()
+		if( self.lastPrune == None or self.clock() - self.lastPrune >= self.pruneInterval ):
+			self.prune()
+
+
+	def prune(self):
+		# deletes points older than retentionDays, returns how many
+		self.lastPrune = self.clock()
+		if( self.retentionDays <= 0 ):
+			return 0
+		cutoff = int( ( self.clock() - self.retentionDays * 86400 ) * 1000 )
+		with self.lock:
+			with self.conn:
+				deleted = self.conn.execute( "DELETE FROM gps_points WHERE ts < ?", ( cutoff, ) ).rowcount
+		self.pruned += deleted
+		return deleted
+
+
+	def flush(self):
+		with self.bufferLock:
+			rows = self.buffer
+			self.buffer = []
+			self.lastFlush = self.clock()
+
+		if( len( rows ) == 0 ):
+			return 0
+
+		sql = "INSERT OR IGNORE INTO gps_points ( %s ) VALUES ( %s )" % ( ", ".join( POINT_COLUMNS ), ", ".join( [ "?" ] * len( POINT_COLUMNS ) ) )
+		with self.lock:
+			with self.conn:
+				self.conn.executemany( sql, rows )
+		self.written += len( rows )
+		self.flushes += 1
+		return len( rows )
+
+
+	def getPoints(self, imei, startMillis=None, endMillis=None):
+		# points for imei with startMillis <= ts < endMillis, oldest first, as dicts
+		self.flush()
+
+		sql = "SELECT %s FROM gps_points WHERE imei = ?" % ", ".join( POINT_COLUMNS )
+		params = [ imei ]
+		if( startMillis != None ):
+			sql += " AND ts >= ?"
+			params.append( startMillis )
+		if( endMillis != None ):
+			sql += " AND ts < ?"
+			params.append( endMillis )
+		sql += " ORDER BY ts"
+
+		with self.lock:
+			rows = self.conn.execute( sql, params ).fetchall()
+		return [ dict( zip( POINT_COLUMNS, row ) ) for row in rows ]
+
+
+	def getPointColumns(self, imei, startMillis=None, endMillis=None):
+		# the same range as getPoints, as ( ts, lat, lon, speed ) columns ready for
+		# tripanalytics, without building a dict per point
+		self.flush()
+
+		sql = "SELECT ts, lat, lon, speed FROM gps_points WHERE imei = ?"
+		params = [ imei ]
+		if( startMillis != None ):
+			sql += " AND ts >= ?"
+			params.append( startMillis )
+		if( endMillis != None ):
+			sql += " AND ts < ?"
+			params.append( endMillis )
+		sql += " ORDER BY ts"
+
+		with self.lock:
+			rows = self.conn.execute( sql, params ).fetchall()
+		if( len( rows ) == 0 ):
+			return ( [], [], [], [] )
+		return tuple( list( column ) for column in zip( *rows ) )
+
+
+	def latestTimestamp(self, imei):
+		self.flush()
+		with self.lock:
+			return self.conn.execute( "SELECT MAX( ts ) FROM gps_points WHERE imei = ?", ( imei, ) ).fetchone()[0]
+
+
+	def countPoints(self, imei=None):
+		self.flush()
+		with self.lock:
+			if( imei == None ):
+				return self.conn.execute( "SELECT COUNT(*) FROM gps_points" ).fetchone()[0]
+			return self.conn.execute( "SELECT COUNT(*) FROM gps_points WHERE imei = ?", ( imei, ) ).fetchone()[0]
+
+
+	def stats(self):
+		return {
+			"buffered": len( self.buffer ),
+			"appended": self.appended,
+			"written": self.written,
+			"flushes": self.flushes,
+			"pruned": self.pruned,
+		}
+
+
+	def close(self):
+		self.flush()
+		with self.lock:
+			self.conn.close()
@@ -0,0 +1,69 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Incremental decoding of a top-level JSON array.
+#
+# iterJsonArray() takes an iterable of text chunks (e.g. response.iter_content())
+# and yields each element of the array as soon as it has been received, so a large
+# response is never held in memory as one string and one parsed list.
+
+import codecs
+import json
+
+
+_decoder = json.JSONDecoder()
+_whitespace = " \t\r\n"
+
+
+def _skip(buf, pos, chars):
+	while pos < len( buf ) and buf[ pos ] in chars:
+		pos += 1
+	return pos
+
+
+def iterJsonArray(chunks):
+	buf = u""
+	pos = 0
+	started = False
+	# a multi-byte character can be split across chunks
+	utf8 = codecs.getincrementaldecoder( "utf-8" )()
+
+	for chunk in chunks:
+		if( isinstance( chunk, bytes ) ):
+			chunk = utf8.decode( chunk )
+		# drop what has already been decoded before appending
+		buf = buf[ pos: ] + chunk
+		pos = 0
+
+		if( not started ):
+			pos = _skip( buf, pos, _whitespace )
+			if( pos >= len( buf ) ):
+				continue
+			if( buf[ pos ] != u"[" ):
+				raise ValueError( "expected a JSON array" )
+			pos += 1
+			started = True
+
+		while True:
+			pos = _skip( buf, pos, _whitespace + "," )
+			if( pos >= len( buf ) ):
+				break
+			if( buf[ pos ] == u"]" ):
+				return
+			try:
+				element, end = _decoder.raw_decode( buf, pos )
+			except ValueError:
+				# element not complete yet, wait for more
+				break
+			# a number can decode from a partial token ("2" of "2.5"); only trust a
+			# scalar once the separator after it has arrived
+			if( not isinstance( element, ( dict, list ) ) ):
+				nextPos = _skip( buf, end, _whitespace )
+				if( nextPos >= len( buf ) or buf[ nextPos ] not in u",]" ):
+					break
+			yield element
+			pos = end
+
+	if( started ):
+		raise ValueError( "JSON array not terminated" )
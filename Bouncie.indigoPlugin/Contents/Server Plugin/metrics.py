@@ -0,0 +1,143 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Counters and latency histograms for the plugin's hot paths.
+#
+# Recording is a lock, a dict lookup and (for histograms) a bisect into fixed
+# buckets, so it can stay on for every request and webhook. Percentiles are read
+# back from the buckets: each is the upper bound of the bucket it falls in, capped
+# at the largest value seen. Counters kept elsewhere (e.g. StateWriter's) are pulled
+# in at snapshot time through addSource() instead of being counted twice.
+
+import bisect
+import re
+import threading
+
+
+# bucket upper bounds in seconds; anything slower lands in a final overflow bucket
+BUCKETS = ( 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0 )
+
+
+class Histogram(object):
+
+	def __init__(self, bounds=BUCKETS):
+		self.bounds = bounds
+		self.counts = [ 0 ] * ( len( bounds ) + 1 )
+		self.count = 0
+		self.total = 0.0
+		self.min = None
+		self.max = None
+
+
+	def observe(self, value):
+		# caller holds the Metrics lock
+		self.counts[ bisect.bisect_left( self.bounds, value ) ] += 1
+		self.count += 1
+		self.total += value
+		if( self.min == None or value < self.min ):
+			self.min = value
+		if( self.max == None or value > self.max ):
+			self.max = value
+
+
+	def percentile(self, p):
+		if( self.count == 0 ):
+			return 0.0
+		rank = p / 100.0 * self.count
+		seen = 0
+		for index, n in enumerate( self.counts ):
+			seen += n
+			if( seen >= rank and n > 0 ):
+				if( index == len( self.bounds ) ):
+					return self.max
+				return min( self.bounds[ index ], self.max )
+		return self.max
+
+
+	def summary(self):
+		return {
+			"count": self.count,
+			"mean": self.total / self.count if self.count else 0.0,
+			"min": self.min or 0.0,
+			"max": self.max or 0.0,
+			"p50": self.percentile( 50 ),
+			"p95": self.percentile( 95 ),
+			"p99": self.percentile( 99 ),
+		}
+
+
+class Metrics(object):
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.counters = {}
+		self.histograms = {}
+		# ( prefix, fn ) where fn returns { name: number }
+		self.sources = []
+
+
+	def increment(self, name, n=1):
+		with self.lock:
+			self.counters[ name ] = self.counters.get( name, 0 ) + n
+
+
+	def observe(self, name, seconds):
+		with self.lock:
+			histogram = self.histograms.get( name )
+			if( histogram == None ):
+				histogram = Histogram()
+				self.histograms[ name ] = histogram
+			histogram.observe( seconds )
+
+
+	def addSource(self, prefix, fn):
+		self.sources.append( ( prefix, fn ) )
+
+
+	def snapshot(self):
+		# ( { counter: value }, { histogram: summary } )
+		with self.lock:
+			counters = dict( self.counters )
+			histograms = dict( ( name, histogram.summary() ) for name, histogram in self.histograms.items() )
+		for prefix, fn in self.sources:
+			for name, value in fn().items():
+				counters[ "%s.%s" % ( prefix, name ) ] = value
+		return counters, histograms
+
+
+	def reset(self):
+		with self.lock:
+			self.counters = {}
+			self.histograms = {}
+
+
+	def formatLines(self):
+		counters, histograms = self.snapshot()
+		lines = []
+		for name in sorted( histograms ):
+			h = histograms[ name ]
+			lines.append( u"%s: %d, mean %.1fms, p50 %.1fms, p95 %.1fms, p99 %.1fms, max %.1fms" % ( name, h[ "count" ], h[ "mean" ] * 1000, h[ "p50" ] * 1000, h[ "p95" ] * 1000, h[ "p99" ] * 1000, h[ "max" ] * 1000 ) )
+		for name in sorted( counters ):
+			lines.append( u"%s: %s" % ( name, counters[ name ] ) )
+		return lines
+
+
+	def variableValues(self, prefix):
+		# [ ( Indigo variable name, value string ) ] for every counter and histogram
+		counters, histograms = self.snapshot()
+		values = []
+		for name in sorted( histograms ):
+			h = histograms[ name ]
+			base = variableName( prefix, name )
+			values.append( ( base + "_count", str( h[ "count" ] ) ) )
+			for key in ( "p50", "p95", "max" ):
+				values.append( ( "%s_%s_ms" % ( base, key ), "%.1f" % ( h[ key ] * 1000 ) ) )
+		for name in sorted( counters ):
+			values.append( ( variableName( prefix, name ), str( counters[ name ] ) ) )
+		return values
+
+
+def variableName(prefix, name):
+	# Indigo variable names are letters, digits and underscores
+	return re.sub( r"[^A-Za-z0-9_]", "_", prefix + name )
@@ -0,0 +1,111 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Bounded store for raw response and webhook bodies.
+#
+# Each ( device, kind ) keeps its last few payloads in a ring buffer, so the device
+# states can hold a short digest instead of the whole body. When a log path is
+# given, every payload is also appended as one JSON line to a size-rotated log, so
+# older payloads can still be dug out after they have left the buffer.
+
+import collections
+import hashlib
+import json
+import logging
+import logging.handlers
+import threading
+import time
+
+
+class PayloadBuffer(object):
+
+	def __init__(self, size=10, logPath=None, logMaxBytes=5 * 1024 * 1024, logBackupCount=3, clock=time.time):
+		self.size = max( 1, int( size ) )
+		self.clock = clock
+		self.lock = threading.Lock()
+		# ( devId, kind ) -> deque of ( time, digest, payload ), newest last
+		self.buffers = {}
+
+		self.log = None
+		self.logHandler = None
+		if( logPath != None ):
+			# a private logger that doesn't propagate, so payloads stay out of the Indigo log
+			self.log = logging.getLogger( "Plugin.Bouncie.payloads.%d" % id( self ) )
+			self.log.propagate = False
+			self.log.setLevel( logging.INFO )
+			self.logHandler = logging.handlers.RotatingFileHandler( logPath, maxBytes=logMaxBytes, backupCount=logBackupCount )
+			self.logHandler.setFormatter( logging.Formatter( "%(message)s" ) )
+			self.log.addHandler( self.logHandler )
+
+
+	@staticmethod
+	def digest(payload):
+		if( isinstance( payload, unicode ) ):
+			payload = payload.encode( "utf-8" )
+		return hashlib.sha1( payload ).hexdigest()[:12]
+
+
+	def put(self, devId, kind, payload):
+		# returns the entry stored: ( time, digest, payload ). a payload identical to
+		# the newest one for ( devId, kind ) isn't stored or logged again; that entry
+		# is returned instead, so repeats don't push the history out of the buffer
+		digest = self.digest( payload )
+		with self.lock:
+			buf = self.buffers.get( ( devId, kind ) )
+			if( buf == None ):
+				buf = collections.deque( maxlen=self.size )
+				self.buffers[ ( devId, kind ) ] = buf
+			elif( len( buf ) > 0 and buf[-1][1] == digest ):
+				return buf[-1]
+			entry = ( self.clock(), digest, payload )
+			buf.append( entry )
+
+		if( self.log != None ):
+			self.log.info( json.dumps( { "time": entry[0], "devId": devId, "kind": kind, "digest": entry[1], "payload": payload } ) )
+		return entry
+
+
+	def get(self, devId, kind, digest=None):
+		# the newest entry, or the newest one with that digest; None if not buffered
+		with self.lock:
+			buf = self.buffers.get( ( devId, kind ) )
+			if( buf == None ):
+				return None
+			for entry in reversed( buf ):
+				if( digest == None or entry[1] == digest ):
+					return entry
+		return None
+
+
+	def entries(self, devId, kind):
+		# oldest first
+		with self.lock:
+			return list( self.buffers.get( ( devId, kind ), [] ) )
+
+
+	def kinds(self, devId):
+		with self.lock:
+			return sorted( kind for ( bufDevId, kind ) in self.buffers.keys() if bufDevId == devId )
+
+
+	def forget(self, devId):
+		with self.lock:
+			for key in [ key for key in self.buffers.keys() if key[0] == devId ]:
+				del self.buffers[ key ]
+
+
+	def resize(self, size):
+		size = max( 1, int( size ) )
+		with self.lock:
+			self.size = size
+			for key, buf in self.buffers.items():
+				self.buffers[ key ] = collections.deque( buf, maxlen=size )
+
+
+	def close(self):
+		if( self.logHandler != None ):
+			self.log.removeHandler( self.logHandler )
+			self.logHandler.close()
+			self.log = None
+			self.logHandler = None
@@ -36,13 +36,34 @@ import sys
 import random
 
 import time
+import threading
 import datetime
 
 import json
 import re
 import requests
+from requests.adapters import HTTPAdapter
 
 import httplib, urllib
+import Queue
+
+from workers import WorkerPool
+from scheduler import PollScheduler
+from statewriter import StateWriter
+from webhookqueue import WebhookQueue
+from caches import TTLCache, RefreshingValue
+from tokens import TokenManager
+from resilience import RetryPolicy, CircuitBreaker
+import geo
+import flattener
+from jsonstream import iterJsonArray
+from tripstore import TripStore, parseTime, formatTime
+from gpsstore import GpsStore, toEpochMillis
+import tripanalytics
+from payloadbuffer import PayloadBuffer
+from webhookrecorder import WebhookRecorder
+from metrics import Metrics
+from profiler import Profiler
 
 
 # Note the "indigo" module is automatically imported and made available inside
@@ -53,6 +74,34 @@ class Plugin(indigo.PluginBase):
 
 
 	bouncieAPIBaseUrl = "https://api.bouncie.dev/v1/"
+	bouncieAuthBaseUrl = "https://auth.bouncie.com"
+	googleMapsAPIBaseUrl = "https://maps.googleapis.com/maps/api/"
+
+	# vehicle value for triggers that fire for every vehicle
+	anyVehicle = "*"
+
+	# distance matrix results are reused within roughly 100 m of the cached origin
+	distanceMatrixCachePrecision = 3
+
+	# seconds before the vehicle menu is refreshed in the background
+	vehicleCatalogTTL = 3600
+
+	# /trips only answers for a window of up to a week
+	tripSyncWindow = datetime.timedelta( days=7 )
+	# re-scan this far back so a trip that was still running at the last scan gets picked up
+	tripSyncOverlap = datetime.timedelta( hours=6 )
+	tripSyncBatchSize = 100
+	# 'polyline' is much smaller over the wire and cheaper to parse than 'geojson'
+	tripGpsFormat = "polyline"
+
+	# seconds between "webhook queue full" warnings
+	webhookDropWarningInterval = 60
+
+	# seconds between writes of new geocode cache entries to disk
+	geocodeCacheSaveInterval = 60
+
+	# without a tripStart time, a trip is the last run of points within this many seconds
+	tripAnalysisLookback = 12 * 3600
 
 
 
@@ -64,6 +113,25 @@ class Plugin(indigo.PluginBase):
 		
 		self.triggerDict = {}
 
+		# (eventType, imei) -> set of trigger ids. imei is anyVehicle for wildcard triggers
+		self.triggerIndex = {}
+		self.triggerKeys = {}
+
+		# imei <-> device id for every device that has started comm
+		self.imeiToDevId = {}
+		self.devIdToImei = {}
+
+		# imeis with a tripStart webhook but no tripEnd yet
+		self.openTrips = set()
+		# imei -> start of the open trip (epoch milliseconds), from the tripStart webhook
+		self.tripStartTimes = {}
+
+		self.stateWriter = StateWriter( self.logger )
+
+		self.metrics = Metrics()
+		self.profiler = None
+		self.metrics.addSource( "states", lambda: { "written": self.stateWriter.written, "skipped": self.stateWriter.skipped, "flushes": self.stateWriter.flushes } )
+
 		try:
 			self.logLevel = int(self.pluginPrefs[u"logLevel"])
 		except:
@@ -92,6 +160,92 @@ class Plugin(indigo.PluginBase):
 		self.logger.debug(u"startup called")
 
 		self.pollingInterval = int(self.pluginPrefs.get("pollingIntervalVehicleData", 60) )
+		self.pollingIntervalActive = int(self.pluginPrefs.get("pollingIntervalActive", 15) )
+		self.pollingIntervalMax = int(self.pluginPrefs.get("pollingIntervalMax", 900) )
+		self.pollScheduler = PollScheduler( self.pollingIntervalActive, self.pollingInterval, self.pollingIntervalMax )
+
+		self.webhookDedupCache = TTLCache( 5000, int(self.pluginPrefs.get("webhookDedupWindow", 600)) )
+		self.webhookQueue = WebhookQueue( self._processWebhook, self.logger, int(self.pluginPrefs.get("webhookQueueSize", 5000)), dedupCache=self.webhookDedupCache, metrics=self.metrics )
+		self.webhookQueue.start()
+		self.metrics.addSource( "webhookQueue", self.webhookQueue.stats )
+		self.lastWebhookDropWarning = 0
+
+		self.publishMetrics = bool(self.pluginPrefs.get("publishMetrics", False))
+		self.metricsVariablePrefix = self.pluginPrefs.get("metricsVariablePrefix", "bouncie_")
+		self.metricsPublishInterval = float(self.pluginPrefs.get("metricsPublishInterval", 1)) * 60
+		self.nextMetricsPublish = time.time() + self.metricsPublishInterval
+		# variable name -> value last published
+		self.publishedMetrics = {}
+
+		self.geocodeCachePrecision = int(self.pluginPrefs.get("geocodeCachePrecision", 4))
+		self.geocodeCache = TTLCache( 1000, float(self.pluginPrefs.get("geocodeCacheDays", 30)) * 86400 )
+		self.geocodeCachePath = os.path.join( self._getDataFolder(), "geocodeCache.json" )
+		try:
+			self.logger.debug( u"loaded %d cached geocode locations" % self.geocodeCache.load( self.geocodeCachePath ) )
+		except Exception, e:
+			self.logger.warning( u"unable to load geocode cache: %s" % e )
+		# set when the cache has entries that aren't on disk yet; saved from the run loop
+		self.geocodeCacheDirty = False
+		self.nextGeocodeCacheSave = time.time() + self.geocodeCacheSaveInterval
+
+		self.distanceMatrixMinInterval = float(self.pluginPrefs.get("distanceMatrixMinInterval", 60))
+		self.distanceMatrixTraffic = bool(self.pluginPrefs.get("distanceMatrixTraffic", False))
+		self.distanceMatrixCache = TTLCache( 200, float(self.pluginPrefs.get("distanceMatrixCacheAge", 300)) )
+		# devId -> ( time, response text ) of the last distance matrix answer for that vehicle
+		self.distanceMatrixLastQuery = {}
+
+		# route distance lookups run here, off the polling and webhook threads
+		self.distanceMatrixPool = WorkerPool( 1, "BouncieDistanceMatrix" )
+		# ( homeAddress, ( lat, lon ) ) once the home address has been geocoded
+		self.homeLocation = None
+		self.homeGeocodeAttempt = 0
+		# device ids currently inside the radius and heading home
+		self.approachingHome = set()
+		self.useFleetPolling = bool(self.pluginPrefs.get("useFleetPolling", True))
+
+		self.httpTimeout = float(self.pluginPrefs.get("httpTimeout", 2))
+		self.httpPoolSize = int(self.pluginPrefs.get("httpPoolSize", 4))
+		self.httpSession = self._createHttpSession()
+
+		self.retryPolicy = RetryPolicy()
+		self.circuitBreakers = {
+			"vehicles": CircuitBreaker( "vehicles", self.logger ),
+			"trips": CircuitBreaker( "trips", self.logger ),
+			"oauth": CircuitBreaker( "oauth", self.logger ),
+		}
+
+		self.vehicleCatalog = RefreshingValue( self._getVehicles, self.logger, self.vehicleCatalogTTL )
+
+		self.tokenManager = TokenManager( self.renewAccessToken, self.logger )
+		if( self.pluginPrefs.get("accessTokenJson", "") != "" ):
+			obtainedAt = self.pluginPrefs.get("accessTokenObtained", "")
+			self.tokenManager.load( self.pluginPrefs["accessTokenJson"], float( obtainedAt ) if obtainedAt != "" else None )
+
+		self.pollingConcurrency = int(self.pluginPrefs.get("pollingConcurrency", 4))
+		self.pollingCycleDeadline = float(self.pluginPrefs.get("pollingCycleDeadline", 30))
+		self.pollPool = WorkerPool( self.pollingConcurrency, "BouncieVehiclePoll" )
+
+		self.syncTripHistory = bool(self.pluginPrefs.get("syncTripHistory", False))
+		self.tripSyncInterval = float(self.pluginPrefs.get("tripSyncInterval", 60)) * 60
+		self.tripSyncHistoryDays = int(self.pluginPrefs.get("tripSyncHistoryDays", 30))
+		self.tripStore = None
+		self.tripSyncThread = None
+		self.nextTripSync = time.time() + 60
+		if( self.syncTripHistory ):
+			self._openTripStore()
+
+		self.storeGpsPoints = bool(self.pluginPrefs.get("storeGpsPoints", False))
+		self.gpsRetentionDays = int(self.pluginPrefs.get("gpsRetentionDays", 30))
+		self.gpsStore = None
+		if( self.storeGpsPoints ):
+			self._openGpsStore()
+
+		self.payloadBuffer = None
+		self.payloadLogSettings = None
+		self._configurePayloadBuffer( self.pluginPrefs )
+
+		self.webhookRecorder = None
+		self._configureWebhookRecorder( self.pluginPrefs )
 
 		self.use_webhooks = bool(self.pluginPrefs.get("useWebhooks", False))
 		if not self.use_webhooks:
@@ -111,72 +265,255 @@ class Plugin(indigo.PluginBase):
 	def shutdown(self):
 		self.logger.debug(u"shutdown called")
 
+		self.webhookQueue.stop()
+		self.pollPool.stop()
+		self.distanceMatrixPool.stop()
+		self.httpSession.close()
+		if( self.geocodeCacheDirty ):
+			self._saveGeocodeCache()
+		if( self.tripSyncThread != None ):
+			self.tripSyncThread.join( 10.0 )
+		if( self.tripStore != None ):
+			self.tripStore.close()
+		if( self.gpsStore != None ):
+			self.gpsStore.close()
+		if( self.payloadBuffer != None ):
+			self.payloadBuffer.close()
+		if( self.webhookRecorder != None ):
+			self.webhookRecorder.close()
+		if( self.profiler != None ):
+			self._stopProfiler()
+
+	def _getDataFolder(self):
+
+		# persistent files (caches etc.) live next to the plugin's prefs
+		dataFolder = os.path.join( indigo.server.getInstallFolderPath(), "Preferences", "Plugins", self.pluginId )
+		if( not os.path.exists( dataFolder ) ):
+			os.makedirs( dataFolder )
+		return dataFolder
+
+
+	########################################
+	def _createHttpSession(self):
+
+		# one keep-alive session shared by the polling thread, webhooks and actions.
+		# HTTPAdapter keeps a connection pool per host (api.bouncie.dev, auth.bouncie.com,
+		# maps.googleapis.com), so once the pool is warm a request is a single round trip.
+		session = requests.Session()
+		adapter = HTTPAdapter( pool_connections=4, pool_maxsize=self.httpPoolSize )
+		session.mount( "https://", adapter )
+		session.mount( "http://", adapter )
+		session.headers.update( { "Accept-Encoding": "gzip, deflate", "Connection": "keep-alive" } )
+		return session
+
+
 	########################################
 	def runConcurrentThread(self):
 		try:
 			while True:
-				for dev in indigo.devices.iter("self"):
-					if not dev.enabled or not dev.configured:
-						continue
-
-					# Plugins that need to poll out the status from the sensor
-					# could do so here, then broadcast back the new values to the
-					# Indigo Server via updateStateOnServer. For this example, we
-					# could toggle the onOffState every 2 seconds. If the sensor
-					# always broadcasts out changes (or is just 1-way), then this
-					# entire runConcurrentThread() method can be deleted.
-					if dev.deviceTypeId == u"myBouncieCustomType":
-					
-						imei = dev.pluginProps.get("vehicle", "")
-						if( imei == "" ):
-							self.logger.error(u"problem with device configuration. unable to get imei. please reconfigue.")
-							continue
-							
-						data = self._requestVehicle( imei )
-						
-						if( data == "" ):
-							self.logger.error( u"problem getting vehicle data for imei: %s" % imei )
-							continue
-
-						#self.logger.debug(data)
-						jsonResponse = json.loads(data)
-						#self.logger.debug( jsonResponse )
-						
-						'''
-						# sample response from vehicles:
-						[
+				profiler = self.profiler
+				if( profiler == None ):
+					sleepTime = self._runCycle()
+				elif( profiler.expired() ):
+					self._stopProfiler()
+					continue
+				else:
+					sleepTime = profiler.runcall( self._runCycle )
+				self.sleep( sleepTime )
+		except self.StopThread:
+			pass	# Optionally catch the StopThread exception and do any needed cleanup.
+
+
+	def _runCycle(self):
+
+		# one pass of the polling loop; returns how long to sleep before the next
+		dueIds = set( self.pollScheduler.popDue() )
+
+		if( len( dueIds ) > 0 ):
+			# a fleet request refreshes every vehicle, so include them all
+			if( self.useFleetPolling ):
+				dueIds = set( self.devIdToImei.keys() )
+
+			devList = []
+			for devId in dueIds:
+				try:
+					dev = indigo.devices[ devId ]
+				except KeyError:
+					continue
+				if not dev.enabled or not dev.configured:
+					continue
+				devList.append( dev )
+
+			started = time.time()
+			if( self.useFleetPolling ):
+				self._pollFleet( devList )
+				self.metrics.observe( "poll.fleet", time.time() - started )
+			else:
+				self._pollDevices( devList )
+				self.metrics.observe( "poll.vehicles", time.time() - started )
+
+		self._startTripSyncIfDue()
+		gpsStore = self.gpsStore
+		if( gpsStore != None ):
+			gpsStore.flushIfDue()
+		if( self.geocodeCacheDirty and time.time() >= self.nextGeocodeCacheSave ):
+			self.nextGeocodeCacheSave = time.time() + self.geocodeCacheSaveInterval
+			self._saveGeocodeCache()
+		for devId, result, error in self.distanceMatrixPool.getReadyResults():
+			if( error != None ):
+				self.logger.error( u"approaching home check failed: %s" % error )
+		if( self.publishMetrics and time.time() >= self.nextMetricsPublish ):
+			self.nextMetricsPublish = time.time() + self.metricsPublishInterval
+			self._publishMetrics()
+
+		# wake up at least once a second so a webhook can pull a device forward
+		nextDue = self.pollScheduler.nextDue()
+		if( nextDue == None ):
+			return 1.0
+		return min( max( nextDue - time.time(), 0.1 ), 1.0 )
+
+
+	def _pollFleet( self, devList ):
+
+		# one /vehicles request for the whole account, fanned out to every device
+		if( len( devList ) == 0 ):
+			return
+
+		data = self._requestVehicles()
+
+		if( data == "" ):
+			self.logger.error( u"problem getting fleet vehicle data" )
+			for dev in devList:
+				self.stateWriter.set( dev, "vehicleDataStale", True )
+				self.stateWriter.flush( dev )
+			return
+
+		jsonResponse = json.loads(data)
+
+		# the fleet response is the whole account, so it keeps the vehicle menus current too
+		try:
+			self.vehicleCatalog.set( self._buildVehicleList( jsonResponse ) )
+		except Exception, e:
+			self.logger.error( u"unable to refresh the vehicle list from fleet data: %s" % e )
+
+		vehiclesByImei = {}
+		for result in jsonResponse:
+			if( 'imei' in result ):
+				vehiclesByImei[ result['imei'] ] = result
+
+		for dev in devList:
+			imei = self.devIdToImei.get( dev.id, "" )
+			if( imei == "" ):
+				self.logger.error(u"problem with device configuration. unable to get imei. please reconfigue.")
+				continue
+
+			result = vehiclesByImei.get( imei )
+			if( result == None ):
+				# don't fall back to a per-vehicle request; just flag the data as stale
+				self.logger.warning( u"imei %s missing from fleet vehicle data, flagging \"%s\" stale" % ( imei, dev.name ) )
+				self.stateWriter.set( dev, "vehicleDataStale", True )
+				self.stateWriter.flush( dev )
+				continue
+
+			self._updateVehicleStates( dev, [ result ], json.dumps( [ result ] ) )
+
+
+	def _pollDevices( self, devList ):
+
+		# one /vehicles request per device, spread over the worker pool. results are
+		# applied as they complete; anything still outstanding at the deadline is
+		# either cancelled (not started yet) or carried over to the next cycle.
+		deadline = time.time() + self.pollingCycleDeadline
+
+		for dev in devList:
+			imei = self.devIdToImei.get( dev.id, "" )
+			if( imei == "" ):
+				self.logger.error(u"problem with device configuration. unable to get imei. please reconfigue.")
+				continue
+
+			if( not self.pollPool.submit( dev.id, self._requestVehicle, imei ) ):
+				self.logger.debug( u"request for \"%s\" still in flight, carrying it over" % dev.name )
+
+		while self.pollPool.pending() > 0:
+			remaining = deadline - time.time()
+			if( remaining <= 0 ):
+				break
+			try:
+				result = self.pollPool.getResult( remaining )
+			except Queue.Empty:
+				break
+			self._applyVehicleResult( *result )
+
+		for result in self.pollPool.getReadyResults():
+			self._applyVehicleResult( *result )
+
+		cancelled = self.pollPool.cancelPending()
+		if( len( cancelled ) > 0 or self.pollPool.pending() > 0 ):
+			self.logger.warning( u"polling cycle deadline reached: %d request(s) cancelled, %d carried over" % ( len( cancelled ), self.pollPool.pending() ) )
+
+
+	def _applyVehicleResult( self, devId, data, error ):
+
+		try:
+			dev = indigo.devices[ devId ]
+		except KeyError:
+			# device was deleted while its request was in flight
+			return
+
+		if( error != None ):
+			self.logger.error( u"problem getting vehicle data for \"%s\": %s" % ( dev.name, error ) )
+			data = ""
+
+		if( data == "" ):
+			self.logger.error( u"problem getting vehicle data for imei: %s" % self.devIdToImei.get( dev.id, "" ) )
+			self.stateWriter.set( dev, "vehicleDataStale", True )
+			self.stateWriter.flush( dev )
+			return
+
+		#self.logger.debug(data)
+		jsonResponse = json.loads(data)
+		#self.logger.debug( jsonResponse )
+
+		self._updateVehicleStates( dev, jsonResponse, data )
+
+
+	def _updateVehicleStates( self, dev, jsonResponse, data ):
+
+		'''
+		# sample response from vehicles:
+		[
+			{
+				'stats': 
+					{
+						'isRunning': False, 
+						'mil': 
+							{
+								'milOn': False, 
+								'lastUpdated': '2020-10-15T22:19:58.000Z'
+							}, 
+						'lastUpdated': '2020-10-17T18:51:50.000Z', 
+						'location': 
 							{
-								'stats': 
-									{
-										'isRunning': False, 
-										'mil': 
-											{
-												'milOn': False, 
-												'lastUpdated': '2020-10-15T22:19:58.000Z'
-											}, 
-										'lastUpdated': '2020-10-17T18:51:50.000Z', 
-										'location': 
-											{
-												'lat': 40.1234567, 
-												'lon': -75.123456, 
-												'heading': 312, 
-												'address': None
-											}, 
-										'localTimeZone': '-0400', 
-										'speed': 1.242742
-									}, 
-								'vin': '12345123451234512', 
-								'standardEngine': '3L', 
-								'imei': '111112222233333', 
-								'model': 
-									{
-										'make': 'AUDI', 
-										'name': 'S4', 
-										'year': 2013
-									}, 
-								'nickName': 'Audi S4'
-							}
-						]						
+								'lat': 40.1234567, 
+								'lon': -75.123456, 
+								'heading': 312, 
+								'address': None
+							}, 
+						'localTimeZone': '-0400', 
+						'speed': 1.242742
+					}, 
+				'vin': '12345123451234512', 
+				'standardEngine': '3L', 
+				'imei': '111112222233333', 
+				'model': 
+					{
+						'make': 'AUDI', 
+						'name': 'S4', 
+						'year': 2013
+					}, 
+				'nickName': 'Audi S4'
+			}
+		]						
 
 
    						[
@@ -212,86 +549,57 @@ class Plugin(indigo.PluginBase):
    								'standardEngine': '3.5L V6'
    							}
    						]
-						'''
-
-						keyValueList = []
-						keyValueList.append( {'key':'vehicleJSON', 'value':data } )
-
-						for result in jsonResponse:
-							if( 'model' in result ):
-								model = result['model']
-								if( 'make' in model ):
-									keyValueList.append( {'key':'model-make', 'value':model['make'] } )
-								if( 'name' in model ):
-									keyValueList.append( {'key':'model-name', 'value':model['name'] } )
-								if( 'year' in model ):
-									keyValueList.append( {'key':'model-year', 'value':model['year'] } )
-							if( 'nickname' in result ):
-								keyValueList.append( {'key':'nickname', 'value':result['nickname'] } )
-							if( 'standardEngine' in result ):
-								keyValueList.append( {'key':'standardEngine', 'value':result['standardEngine'] } )
-							if( 'vin' in result ):
-								keyValueList.append( {'key':'vin', 'value':result['vin'] } )
-							if( 'imei' in result ):
-								keyValueList.append( {'key':'imei', 'value':result['imei'] } )
-							if( 'stats' in result ):
-								stats = result['stats']
-								if( 'localTimezone' in stats ):
-									keyValueList.append( {'key':'stats-localTimezone', 'value':stats['localTimezone'] } )
-								if( 'lastUpdated' in stats ):
-									keyValueList.append( {'key':'stats-lastUpdated', 'value':stats['lastUpdated'] } )
-								if( 'location' in stats ):
-									location = stats['location']
-									if( 'lat' in location ):
-										keyValueList.append( {'key':'stats-location-lat', 'value':location['lat'] } )
-									if( 'lon' in location ):
-										keyValueList.append( {'key':'stats-location-long', 'value':location['lon'] } )
-									if( 'heading' in location ):
-										keyValueList.append( {'key':'stats-location-heading', 'value':location['heading'] } )
-									if( 'address' in location ):
-										keyValueList.append( {'key':'stats-location-address', 'value':location['address'] } )
-								if( 'fuelLevel' in stats ):
-									keyValueList.append( {'key':'stats-fuelLevel', 'value':stats['fuelLevel'] } )
-								if( 'isRunning' in stats ):
-									keyValueList.append( {'key':'stats-isRunning', 'value':stats['isRunning'] } )
-								if( 'speed' in stats ):
-									keyValueList.append( {'key':'stats-speed', 'value':stats['speed'] } )
-								if( 'mil' in stats ):
-									mil = stats['mil']
-									if( 'milOn' in mil ):
-										keyValueList.append( {'key':'mil-milOn', 'value':mil['milOn'] } )
-									if( 'lastUpdated' in mil ):
-										keyValueList.append( {'key':'mil-lastUpdated', 'value':mil['lastUpdated'] } )
-								if( 'battery' in stats ):
-									battery = stats['battery']
-									if( 'status' in battery ):
-										keyValueList.append( {'key':'battery-status', 'value':battery['status'] } )
-									if( 'lastUpdated' in battery ):
-										keyValueList.append( {'key':'battery-lastUpdated', 'value':battery['lastUpdated'] } )
-						#self.logger.debug( keyValueList )
-						dev.updateStatesOnServer( keyValueList )
-
-						'''
-						data = self._getTrips( imei )
-						
-						if( data == "" ):
-							self.logger.debug( u"problem getting vehicle trips for imei: %s" % imei )
-							continue
-
-						#self.logger.debug(data)
-						jsonResponse = json.loads(data)
-						self.logger.debug( jsonResponse )
-						'''
-
-				self.sleep(self.pollingInterval)
-		except self.StopThread:
-			pass	# Optionally catch the StopThread exception and do any needed cleanup.
+		'''
+
+		keyValueList = []
+		keyValueList.append( {'key':'vehicleJSON', 'value':self._payloadStateValue( dev, 'vehicleJSON', data ) } )
+
+		for result in jsonResponse:
+			keyValueList.extend( flattener.flattenVehicle( result ) )
+		#self.logger.debug( keyValueList )
+		keyValueList.append( {'key':'vehicleDataStale', 'value':False } )
+		self.stateWriter.setList( dev, keyValueList )
+
+		for result in jsonResponse:
+			location = result.get( 'stats', {} ).get( 'location' )
+			if( isinstance( location, dict ) and location.get( 'lat' ) != None and location.get( 'lon' ) != None ):
+				self._checkApproachingHome( dev, location['lat'], location['lon'], location.get( 'heading' ), result['stats'].get( 'speed' ) )
+
+		self.stateWriter.flush( dev )
+
+		self._rescheduleVehicle( dev, jsonResponse )
+
+
+	def _rescheduleVehicle( self, dev, jsonResponse ):
+
+		# poll fast while the vehicle is running or a trip is open, back off while parked
+		active = self.devIdToImei.get( dev.id ) in self.openTrips
+		for result in jsonResponse:
+			if( result.get( 'stats', {} ).get( 'isRunning', False ) ):
+				active = True
+
+		self.pollScheduler.reschedule( dev.id, active )
+		self.logger.debug( u"next poll for \"%s\" in %s seconds" % ( dev.name, self.pollScheduler.interval( dev.id ) ) )
 
 	########################################
 	def validateDeviceConfigUi(self, valuesDict, typeId, devId):
 		return (True, valuesDict)
 
 
+	########################################
+	def validateEventConfigUi(self, valuesDict, typeId, eventId):
+		errorsDict = indigo.Dict()
+		if( typeId == "approaching_home" ):
+			try:
+				if float(valuesDict['milesToHome']) <= 0:
+					raise Exception()
+			except:
+				errorsDict["milesToHome"] = u"Must be a number greater than 0 (miles)."
+		if len(errorsDict):
+			return False, valuesDict, errorsDict
+		return True, valuesDict
+
+
 	########################################
 	def validatePrefsConfigUi(self, valuesDict):
 		errorsDict = indigo.Dict()
@@ -300,6 +608,93 @@ class Plugin(indigo.PluginBase):
 				raise Exception()
 		except:
 			errorsDict["pollingIntervalVehicleData"] = u"Must be a number greater than or equal to 5 (seconds)."
+		try:
+			if int(valuesDict['pollingIntervalActive']) < 5:
+				raise Exception()
+		except:
+			errorsDict["pollingIntervalActive"] = u"Must be a number greater than or equal to 5 (seconds)."
+		try:
+			if int(valuesDict['pollingIntervalMax']) < int(valuesDict['pollingIntervalVehicleData']):
+				raise Exception()
+		except:
+			errorsDict["pollingIntervalMax"] = u"Must be a number greater than or equal to the parked polling interval (seconds)."
+		try:
+			if float(valuesDict['httpTimeout']) <= 0:
+				raise Exception()
+		except:
+			errorsDict["httpTimeout"] = u"Must be a number greater than 0 (seconds)."
+		try:
+			if int(valuesDict['httpPoolSize']) < 1:
+				raise Exception()
+		except:
+			errorsDict["httpPoolSize"] = u"Must be a number greater than or equal to 1."
+		try:
+			if int(valuesDict['pollingConcurrency']) < 1:
+				raise Exception()
+		except:
+			errorsDict["pollingConcurrency"] = u"Must be a number greater than or equal to 1."
+		try:
+			if float(valuesDict['pollingCycleDeadline']) <= 0:
+				raise Exception()
+		except:
+			errorsDict["pollingCycleDeadline"] = u"Must be a number greater than 0 (seconds)."
+		try:
+			if int(valuesDict['webhookQueueSize']) < 1:
+				raise Exception()
+		except:
+			errorsDict["webhookQueueSize"] = u"Must be a number greater than or equal to 1."
+		try:
+			if int(valuesDict['webhookDedupWindow']) < 0:
+				raise Exception()
+		except:
+			errorsDict["webhookDedupWindow"] = u"Must be a number greater than or equal to 0 (seconds)."
+		try:
+			if float(valuesDict['geocodeCacheDays']) < 0:
+				raise Exception()
+		except:
+			errorsDict["geocodeCacheDays"] = u"Must be a number greater than or equal to 0 (days)."
+		try:
+			if float(valuesDict['distanceMatrixCacheAge']) < 0:
+				raise Exception()
+		except:
+			errorsDict["distanceMatrixCacheAge"] = u"Must be a number greater than or equal to 0 (seconds)."
+		try:
+			if float(valuesDict['distanceMatrixMinInterval']) < 0:
+				raise Exception()
+		except:
+			errorsDict["distanceMatrixMinInterval"] = u"Must be a number greater than or equal to 0 (seconds)."
+		try:
+			if float(valuesDict['tripSyncInterval']) < 5:
+				raise Exception()
+		except:
+			errorsDict["tripSyncInterval"] = u"Must be a number greater than or equal to 5 (minutes)."
+		try:
+			if int(valuesDict['tripSyncHistoryDays']) < 1:
+				raise Exception()
+		except:
+			errorsDict["tripSyncHistoryDays"] = u"Must be a number greater than or equal to 1 (days)."
+		try:
+			if int(valuesDict['gpsRetentionDays']) < 0:
+				raise Exception()
+		except:
+			errorsDict["gpsRetentionDays"] = u"Must be a number greater than or equal to 0 (days, 0 keeps everything)."
+		try:
+			if int(valuesDict['rawPayloadBufferSize']) < 1:
+				raise Exception()
+		except:
+			errorsDict["rawPayloadBufferSize"] = u"Must be a number greater than or equal to 1."
+		try:
+			if float(valuesDict['rawPayloadLogSize']) <= 0:
+				raise Exception()
+		except:
+			errorsDict["rawPayloadLogSize"] = u"Must be a number greater than 0 (MB)."
+		try:
+			if float(valuesDict['metricsPublishInterval']) < 0.25:
+				raise Exception()
+		except:
+			errorsDict["metricsPublishInterval"] = u"Must be a number greater than or equal to 0.25 (minutes)."
+		if re.search( r"[^A-Za-z0-9_]", valuesDict.get('metricsVariablePrefix', "") ):
+			errorsDict["metricsVariablePrefix"] = u"Only letters, digits and underscores are allowed."
 		if len(errorsDict):
 			return False, valuesDict, errorsDict
 		return True, valuesDict
@@ -319,6 +714,72 @@ class Plugin(indigo.PluginBase):
 			#self.debug = valuesDict["debugLogging"]
 
 			self.pollingInterval = int(valuesDict["pollingIntervalVehicleData"])
+			self.pollingIntervalActive = int(valuesDict["pollingIntervalActive"])
+			self.pollingIntervalMax = int(valuesDict["pollingIntervalMax"])
+			self.pollScheduler.setIntervals( self.pollingIntervalActive, self.pollingInterval, self.pollingIntervalMax )
+
+			self.webhookDedupCache.ttl = float(valuesDict["webhookDedupWindow"])
+
+			self.geocodeCache.ttl = float(valuesDict["geocodeCacheDays"]) * 86400
+
+			self.distanceMatrixMinInterval = float(valuesDict["distanceMatrixMinInterval"])
+			self.distanceMatrixTraffic = bool(valuesDict["distanceMatrixTraffic"])
+			self.distanceMatrixCache.ttl = float(valuesDict["distanceMatrixCacheAge"])
+			# cached answers may be for the old home address or without traffic
+			self.distanceMatrixCache.clear()
+			self.distanceMatrixLastQuery = {}
+
+			self.homeGeocodeAttempt = 0
+			if( int(valuesDict["geocodeCachePrecision"]) != self.geocodeCachePrecision ):
+				# keys are cells of the old size, so they no longer match
+				self.geocodeCachePrecision = int(valuesDict["geocodeCachePrecision"])
+				self.geocodeCache.clear()
+				self.geocodeCacheDirty = True
+			self.useFleetPolling = bool(valuesDict["useFleetPolling"])
+
+			self.httpTimeout = float(valuesDict["httpTimeout"])
+			if( int(valuesDict["httpPoolSize"]) != self.httpPoolSize ):
+				# the pool size is fixed when the adapters are mounted, so start over with a new session
+				self.httpPoolSize = int(valuesDict["httpPoolSize"])
+				oldSession = self.httpSession
+				self.httpSession = self._createHttpSession()
+				oldSession.close()
+
+			self.pollingCycleDeadline = float(valuesDict["pollingCycleDeadline"])
+			if( int(valuesDict["pollingConcurrency"]) != self.pollingConcurrency ):
+				# requests already running on the old pool finish on their own
+				self.pollingConcurrency = int(valuesDict["pollingConcurrency"])
+				oldPool = self.pollPool
+				self.pollPool = WorkerPool( self.pollingConcurrency, "BouncieVehiclePoll" )
+				oldPool.stop()
+
+			self.tripSyncInterval = float(valuesDict["tripSyncInterval"]) * 60
+			self.tripSyncHistoryDays = int(valuesDict["tripSyncHistoryDays"])
+			self.syncTripHistory = bool(valuesDict["syncTripHistory"])
+			if( self.syncTripHistory and self.tripStore == None ):
+				self._openTripStore()
+				self.nextTripSync = time.time()
+
+			self.storeGpsPoints = bool(valuesDict["storeGpsPoints"])
+			self.gpsRetentionDays = int(valuesDict["gpsRetentionDays"])
+			if( self.storeGpsPoints and self.gpsStore == None ):
+				self._openGpsStore()
+			elif( not self.storeGpsPoints and self.gpsStore != None ):
+				self._closeGpsStore()
+			elif( self.gpsStore != None and self.gpsStore.retentionDays != self.gpsRetentionDays ):
+				self.gpsStore.retentionDays = self.gpsRetentionDays
+				# prune on the next pass rather than in an hour
+				self.gpsStore.lastPrune = None
+
+			self._configurePayloadBuffer( valuesDict )
+			self._configureWebhookRecorder( valuesDict )
+
+			self.publishMetrics = bool(valuesDict["publishMetrics"])
+			self.metricsPublishInterval = float(valuesDict["metricsPublishInterval"]) * 60
+			if( valuesDict["metricsVariablePrefix"] != self.metricsVariablePrefix ):
+				self.metricsVariablePrefix = valuesDict["metricsVariablePrefix"]
+				self.publishedMetrics = {}
+			self.nextMetricsPublish = time.time()
 
 			self.use_webhooks = bool(valuesDict["useWebhooks"])
 			
@@ -350,10 +811,53 @@ class Plugin(indigo.PluginBase):
 			dev.subModel = subModel
 			dev.replaceOnServer()
 
+		self._indexDevice( dev )
+		self.pollScheduler.add( dev.id )
+
 
 	def deviceStopComm(self, dev):
 		# Called when communication with the hardware should be shutdown.
-		pass
+		self._unindexDevice( dev.id )
+		self.approachingHome.discard( dev.id )
+		self.pollScheduler.remove( dev.id )
+		self.stateWriter.forget( dev.id )
+		if( self.payloadBuffer != None ):
+			self.payloadBuffer.forget( dev.id )
+
+
+	def _indexDevice(self, dev):
+
+		# Indigo stops and restarts comm when the vehicle in the device config changes,
+		# so start/stop is enough to keep the index in step with the configuration
+		imei = dev.pluginProps.get("vehicle", "")
+		if( imei == "" ):
+			return
+
+		otherDevId = self.imeiToDevId.get( imei )
+		if( otherDevId != None and otherDevId != dev.id ):
+			self.logger.warning( u"imei %s is configured on more than one device; webhooks will update \"%s\" only" % ( imei, dev.name ) )
+
+		self.imeiToDevId[ imei ] = dev.id
+		self.devIdToImei[ dev.id ] = imei
+
+
+	def _unindexDevice(self, devId):
+
+		imei = self.devIdToImei.pop( devId, None )
+		if( imei != None and self.imeiToDevId.get( imei ) == devId ):
+			del self.imeiToDevId[ imei ]
+
+
+	def _getDeviceForImei(self, imei):
+
+		devId = self.imeiToDevId.get( imei )
+		if( devId == None ):
+			return None
+		try:
+			return indigo.devices[ devId ]
+		except KeyError:
+			self._unindexDevice( devId )
+			return None
 
 
 
@@ -390,19 +894,50 @@ class Plugin(indigo.PluginBase):
 		#	"vars": {}
 		# }
 		
-		hookData = json.loads(hookJson)
+		profiler = self.profiler
+		if( profiler != None ):
+			profiler.runcall( self._receiveWebhook, hookJson )
+		else:
+			self._receiveWebhook( hookJson )
+
+
+	def _receiveWebhook(self, hookJson):
+
+		if( self.webhookRecorder != None ):
+			self.webhookRecorder.record( hookJson )
+
+		# hand off to the webhook queue worker so the broadcast callback returns right away
+		if( not self.webhookQueue.put( hookJson ) ):
+			# this is the broadcast thread, so a burst of drops gets one line per interval
+			now = time.time()
+			if( now - self.lastWebhookDropWarning >= self.webhookDropWarningInterval ):
+				self.lastWebhookDropWarning = now
+				self.logger.warning( u"webhook queue full, dropping webhooks (%d dropped so far)" % self.webhookQueue.dropped )
+
+
+	def _processWebhook(self, events):
+
+		profiler = self.profiler
+		if( profiler != None ):
+			profiler.runcall( self._applyWebhook, events )
+		else:
+			self._applyWebhook( events )
+
+
+	def _applyWebhook(self, events):
+
+		# events is one webhook, or a run of coalesced tripData webhooks for one imei
+		# (newest last). states are written from the newest; triggers fire once per webhook.
+		hookData = events[-1][ "hookData" ]
+		payload = events[-1][ "payload" ]
 
 		self.logger.debug(u"webhook_handler received: %s" % hookData )
-		
-		
-		# pull the imei out of the payload
-		payload = json.loads( hookData[ "payload" ] )
+		if( len( events ) > 1 ):
+			self.logger.debug( u"coalesced %d tripData webhooks for imei %s" % ( len( events ), payload['imei'] ) )
 
 		# Find the Indigo device for the Bouncie Device
-		for dev in indigo.devices.iter(filter="self"):
-			if dev.pluginProps.get("vehicle", "") == payload['imei']:
-				break
-		else:
+		dev = self._getDeviceForImei( payload['imei'] )
+		if( dev == None ):
 			self.logger.debug("webHook_handler: No matching Indigo device for Bouncie imei '{}'".format(payload['imei']))
 			return
 
@@ -412,6 +947,7 @@ class Plugin(indigo.PluginBase):
 		
 		if eventType == "connect":
 			self.logger.debug( "connect" )
+			self.pollScheduler.wake( dev.id )
 		elif eventType == "disconnect":
 			self.logger.debug( "disconnect" )
 		elif eventType == "battery":
@@ -420,28 +956,415 @@ class Plugin(indigo.PluginBase):
 			self.logger.debug( "mil" )
 		elif eventType == "tripStart":
 			self.logger.debug( "tripStart" )
-			dev.updateStateOnServer( "previousMilesFromHome", 0.0 )
-			dev.updateStateOnServer( "currentMilesFromHome", 0.0 )
+			self.openTrips.add( payload['imei'] )
+			self.tripStartTimes[ payload['imei'] ] = self._webhookTimestamp( payload, 'start' )
+			self.pollScheduler.wake( dev.id )
+			self.stateWriter.set( dev, "previousMilesFromHome", 0.0 )
+			self.stateWriter.set( dev, "currentMilesFromHome", 0.0 )
 		elif eventType == "tripData":
 			self.logger.debug( "tripData" )
+			gpsStore = self.gpsStore
+			if( self.storeGpsPoints and gpsStore != None ):
+				# every point is kept, including those of coalesced webhooks
+				for event in events:
+					gpsStore.append( payload['imei'], event[ "payload" ].get( 'data', [] ) )
 		elif eventType == "tripMetrics":
 			self.logger.debug( "tripMetrics" )
 		elif eventType == "tripEnd":
 			self.logger.debug( "tripEnd" )
-			dev.updateStateOnServer( "previousMilesFromHome", 0.0 )
-			dev.updateStateOnServer( "currentMilesFromHome", 0.0 )
+			self.openTrips.discard( payload['imei'] )
+			# pick the finished trip up soon rather than at the next scheduled sync
+			self.nextTripSync = min( self.nextTripSync, time.time() + 120 )
+			self.stateWriter.set( dev, "previousMilesFromHome", 0.0 )
+			self.stateWriter.set( dev, "currentMilesFromHome", 0.0 )
+			if( self.storeGpsPoints and self.gpsStore != None ):
+				# tripData for this trip was processed before this webhook, so its points are in the store
+				endMillis = self._webhookTimestamp( payload, 'end' ) or int( time.time() * 1000 )
+				self._analyzeTrip( dev, payload['imei'], self.tripStartTimes.pop( payload['imei'], None ), endMillis + 1 )
 		else:
 			self.logger.debug("{}: Unknown eventType '{}', {}".format(dev.name, eventType, payload))
 
-		dev.updateStateOnServer( "webHookJSON-%s" % eventType, hookData[ "payload" ] )
+		self._setPayloadState( dev, "webHookJSON-%s" % eventType, hookData[ "payload" ] )
+		# typed states straight from the payload, so webhook-only setups don't need to poll
+		self.stateWriter.setList( dev, flattener.flattenWebhook( eventType, payload ) )
+
+		if eventType == "tripData":
+			point = flattener.latestPoint( payload )
+			if( point != None ):
+				self._checkApproachingHome( dev, point['gps']['lat'], point['gps']['lon'], point['gps'].get( 'heading' ), point.get( 'speed' ) )
+
+		self.stateWriter.flush( dev )
 
 		# fire off the event
-		self._fireTrigger(eventType, payload['imei'])
+		for event in events:
+			self._fireTrigger(eventType, payload['imei'])
 			
 		return
 		
 
 
+	########################################
+	# Approaching Home
+	########################################
+	def _getHomeLocation(self):
+
+		# geocode the home address once and keep the coordinates in the plugin prefs
+		homeAddress = self.pluginPrefs.get( "homeAddress", "" )
+		if( self.homeLocation != None and self.homeLocation[0] == homeAddress ):
+			return self.homeLocation[1]
+
+		if( self.pluginPrefs.get( "homeLatLongAddress", "" ) == homeAddress and self.pluginPrefs.get( "homeLatLong", "" ) != "" ):
+			self.homeLocation = ( homeAddress, geo.parseLatLong( self.pluginPrefs["homeLatLong"] ) )
+			return self.homeLocation[1]
+
+		# don't retry a failed lookup on every position update
+		if( time.time() - self.homeGeocodeAttempt < 3600 ):
+			return None
+		self.homeGeocodeAttempt = time.time()
+
+		try:
+			params = { 'address': homeAddress, 'key': self.pluginPrefs["googleMapsAPIKey"] }
+			response = self._googleGet( 'geocode', params )
+			location = json.loads( response.text )['results'][0]['geometry']['location']
+		except Exception, e:
+			self.logger.error( u"unable to geocode home address: %s" % e )
+			return None
+
+		self.pluginPrefs["homeLatLong"] = "%s,%s" % ( location['lat'], location['lng'] )
+		self.pluginPrefs["homeLatLongAddress"] = homeAddress
+		self.homeLocation = ( homeAddress, ( float( location['lat'] ), float( location['lng'] ) ) )
+		self.logger.debug( u"home address is at %s" % self.pluginPrefs["homeLatLong"] )
+		return self.homeLocation[1]
+
+
+	def _checkApproachingHome(self, dev, lat, lon, heading, speed):
+
+		# cheap local check on every position update. Google is only asked for the
+		# route distance (which decides approaching_home) once the vehicle is inside
+		# the radius and heading home. leaving needs a wider margin than entering so
+		# the check doesn't flap at the edge of the radius or at a turn.
+		if( self.pluginPrefs.get( "googleMapsAPIKey", "" ) == "" ):
+			return
+		radius = self._approachingHomeRadius( self.devIdToImei.get( dev.id ) )
+		if( radius <= 0 ):
+			self.approachingHome.discard( dev.id )
+			return
+
+		home = self._getHomeLocation()
+		if( home == None ):
+			return
+
+		lat = float( lat )
+		lon = float( lon )
+		miles = geo.haversineMiles( lat, lon, home[0], home[1] )
+		self.stateWriter.set( dev, "localMilesFromHome", round( miles, 1 ) )
+
+		offCourse = None
+		if( heading != None ):
+			offCourse = geo.angleDifference( float( heading ), geo.bearing( lat, lon, home[0], home[1] ) )
+
+		if( dev.id in self.approachingHome ):
+			approaching = miles <= radius * 1.25 and ( offCourse == None or offCourse < 120 )
+		else:
+			moving = speed != None and float( speed ) > 0
+			approaching = moving and miles <= radius and offCourse != None and offCourse <= 60
+
+		if( not approaching ):
+			self.approachingHome.discard( dev.id )
+			return
+
+		self.approachingHome.add( dev.id )
+		self.logger.debug( u"\"%s\" is %.1f miles from home and heading that way" % ( dev.name, miles ) )
+		# a vehicle with a lookup still in flight is checked again on its next position
+		if( not self.distanceMatrixPool.submit( dev.id, self._approachingHomeLookup, dev.id, "%s,%s" % ( lat, lon ) ) ):
+			self.logger.debug( u"distance matrix lookup for \"%s\" still running, skipping" % dev.name )
+
+
+	def _approachingHomeRadius(self, imei):
+
+		# the largest milesToHome of the approaching_home triggers for this vehicle,
+		# or 0 when there are none, so nothing is checked (or billed) without a trigger
+		radius = 0.0
+		triggerIds = self.triggerIndex.get( ( "approaching_home", imei ), set() ) | self.triggerIndex.get( ( "approaching_home", self.anyVehicle ), set() )
+		for triggerId in triggerIds:
+			trigger = self.triggerDict.get( triggerId )
+			if( trigger == None ):
+				continue
+			try:
+				radius = max( radius, float( trigger.pluginProps.get( "milesToHome", 3 ) ) )
+			except ( TypeError, ValueError ):
+				continue
+		return radius
+
+
+	def _approachingHomeLookup(self, devId, latLongCSV):
+
+		# runs on distanceMatrixPool
+		try:
+			dev = indigo.devices[ devId ]
+		except KeyError:
+			return
+		self.getGoogleDistanceMatrix( dev, latLongCSV )
+		self.stateWriter.flush( dev )
+
+
+	def _webhookTimestamp(self, payload, key):
+
+		# epoch milliseconds of payload[key]['timestamp'], or None
+		try:
+			return toEpochMillis( payload[ key ][ 'timestamp' ] )
+		except Exception:
+			return None
+
+
+	########################################
+	# Raw Payloads
+	########################################
+	def _configurePayloadBuffer(self, prefs):
+
+		useBuffer = bool(prefs.get("rawPayloadBuffer", False))
+		size = int(prefs.get("rawPayloadBufferSize", 10))
+		logPath = None
+		if( bool(prefs.get("rawPayloadLog", False)) ):
+			logPath = os.path.join( indigo.server.getLogsFolderPath( pluginId=self.pluginId ), "payloads.log" )
+		logMaxBytes = int( float(prefs.get("rawPayloadLogSize", 5)) * 1024 * 1024 )
+
+		oldBuffer = self.payloadBuffer
+		if( useBuffer and oldBuffer != None and self.payloadLogSettings == ( logPath, logMaxBytes ) ):
+			# same log settings, keep what is buffered
+			oldBuffer.resize( size )
+			return
+
+		self.payloadBuffer = PayloadBuffer( size, logPath, logMaxBytes ) if useBuffer else None
+		self.payloadLogSettings = ( logPath, logMaxBytes )
+		if( oldBuffer != None ):
+			oldBuffer.close()
+
+
+	def _configureWebhookRecorder(self, prefs):
+
+		# every webhook envelope received while this is on goes to a new recording in
+		# the plugin's logs folder, for benchmarks/webhook_replay.py
+		record = bool(prefs.get("recordWebhooks", False))
+		if( record and self.webhookRecorder == None ):
+			path = os.path.join( indigo.server.getLogsFolderPath( pluginId=self.pluginId ), "webhooks-%s.jsonl.gz" % time.strftime( "%Y%m%d-%H%M%S" ) )
+			try:
+				self.webhookRecorder = WebhookRecorder( path )
+				self.logger.info( u"recording webhooks to %s" % path )
+			except Exception, e:
+				self.logger.error( u"unable to record webhooks to %s: %s" % ( path, e ) )
+		elif( not record and self.webhookRecorder != None ):
+			recorder = self.webhookRecorder
+			self.webhookRecorder = None
+			recorder.close()
+			self.logger.info( u"recorded %d webhooks to %s" % ( recorder.recorded, recorder.path ) )
+
+
+	def _payloadStateValue(self, dev, stateKey, payload):
+
+		# with the payload buffer on, the state only holds the payload's digest. an
+		# unchanged payload then leaves the state alone, and the body stays in memory
+		if( self.payloadBuffer == None ):
+			return payload
+		return self.payloadBuffer.put( dev.id, stateKey, payload )[1]
+
+
+	def _setPayloadState(self, dev, stateKey, payload):
+
+		self.stateWriter.set( dev, stateKey, self._payloadStateValue( dev, stateKey, payload ) )
+
+
+	def _getPayload(self, dev, stateKey):
+
+		# the latest raw payload behind stateKey, or None
+		if( self.payloadBuffer != None ):
+			entry = self.payloadBuffer.get( dev.id, stateKey )
+			if( entry == None ):
+				return None
+			return entry[2]
+		return self.stateWriter.get( dev, stateKey )
+
+
+	def getRawPayload(self, pluginAction, dev):
+
+		# logs the full payload behind one of the JSON states, optionally copying it into
+		# a variable, and returns it to scripts that call executeAction
+		stateKey = pluginAction.props.get( "payload", "vehicleJSON" )
+		payload = self._getPayload( dev, stateKey )
+		if( payload == None or payload == "" ):
+			self.logger.info( u"%s: no %s payload available" % ( dev.name, stateKey ) )
+			return None
+
+		self.logger.info( u"%s %s: %s" % ( dev.name, stateKey, payload ) )
+
+		variableName = pluginAction.props.get( "variableName", "" ).strip()
+		if( variableName != "" ):
+			if( variableName in indigo.variables ):
+				indigo.variable.updateValue( variableName, value=payload )
+			else:
+				indigo.variable.create( variableName, value=payload )
+
+		return payload
+
+
+	########################################
+	# Trip Analytics
+	########################################
+	def _analyzeTrip(self, dev, imei, startMillis, endMillis):
+
+		# analyzes the points in [ startMillis, endMillis ) and writes the trip-* states.
+		# with no startMillis, the trip is the last run of points before endMillis
+		gpsStore = self.gpsStore
+		if( gpsStore == None ):
+			return None
+		if( startMillis == None ):
+			ts, lat, lon, speed = gpsStore.getPointColumns( imei, endMillis - self.tripAnalysisLookback * 1000, endMillis )
+			bounds = tripanalytics.splitTrips( ts )
+			if( len( bounds ) > 0 ):
+				start, end = bounds[-1]
+				ts, lat, lon, speed = ts[ start:end ], lat[ start:end ], lon[ start:end ], speed[ start:end ]
+		else:
+			ts, lat, lon, speed = gpsStore.getPointColumns( imei, startMillis, endMillis )
+
+		result = tripanalytics.analyzeTrip( ts, lat, lon, speed )
+		if( result == None ):
+			self.logger.debug( u"%s: no GPS points stored for the trip" % dev.name )
+			return None
+
+		speedBands = u", ".join( [ u"%s mph: %.1f min" % ( label, seconds / 60.0 ) for label, seconds in result[ "speedBands" ] ] )
+		self.stateWriter.setList( dev, [
+			{ 'key': 'trip-startTime', 'value': formatTime( datetime.datetime.utcfromtimestamp( result[ "startTime" ] / 1000.0 ) ) },
+			{ 'key': 'trip-endTime', 'value': formatTime( datetime.datetime.utcfromtimestamp( result[ "endTime" ] / 1000.0 ) ) },
+			{ 'key': 'trip-distance', 'value': round( result[ "distance" ], 2 ) },
+			{ 'key': 'trip-movingTime', 'value': int( round( result[ "movingTime" ] ) ) },
+			{ 'key': 'trip-idleTime', 'value': int( round( result[ "idleTime" ] ) ) },
+			{ 'key': 'trip-maxSpeed', 'value': round( result[ "maxSpeed" ], 1 ) },
+			{ 'key': 'trip-averageSpeed', 'value': round( result[ "averageSpeed" ], 1 ) },
+			{ 'key': 'trip-hardAccelerations', 'value': result[ "hardAccelerations" ] },
+			{ 'key': 'trip-hardBrakes', 'value': result[ "hardBrakes" ] },
+			{ 'key': 'trip-speedBands', 'value': speedBands },
+			{ 'key': 'trip-points', 'value': result[ "points" ] },
+		] )
+		self.stateWriter.flush( dev )
+
+		self.logger.info( u"%s: trip of %.1f miles, %d min moving, %d min idle, max %.0f mph, %d hard acceleration(s), %d hard brake(s)" % ( dev.name, result[ "distance" ], result[ "movingTime" ] // 60, result[ "idleTime" ] // 60, result[ "maxSpeed" ], result[ "hardAccelerations" ], result[ "hardBrakes" ] ) )
+		return result
+
+
+	def analyzeTrip(self, pluginAction, dev):
+
+		# re-analyzes the vehicle's most recent trip in the GPS point store
+		self.logger.debug( "analyzeTrip for \"%s\"" % (dev.name) )
+
+		gpsStore = self.gpsStore
+		if( not self.storeGpsPoints or gpsStore == None ):
+			self.logger.error( u"%s: GPS points are not being stored, enable \"Keep GPS points from trip webhooks\" in the plugin config" % dev.name )
+			return
+
+		imei = self.devIdToImei.get( dev.id, "" )
+		endMillis = gpsStore.latestTimestamp( imei )
+		if( endMillis == None ):
+			self.logger.info( u"%s: no GPS points stored yet" % dev.name )
+			return
+
+		self._analyzeTrip( dev, imei, None, endMillis + 1 )
+
+
+	########################################
+	# Menu Items
+	########################################
+	def logWebhookQueueStats(self):
+
+		stats = self.webhookQueue.stats()
+		self.logger.info( u"webhook queue: depth %(depth)d (max %(maxDepth)d), received %(received)d, processed %(processed)d, coalesced %(coalesced)d, duplicates %(duplicates)d, dropped %(dropped)d, errors %(errors)d" % stats )
+		self.logger.info( u"webhook dedup cache: %(size)d entries, %(hits)d hits, %(misses)d misses, %(evictions)d evictions" % self.webhookDedupCache.stats() )
+		if( self.gpsStore != None ):
+			self.logger.info( u"GPS point store: %(appended)d points received, %(written)d written in %(flushes)d batches, %(buffered)d buffered, %(pruned)d pruned" % self.gpsStore.stats() )
+		if( self.webhookRecorder != None ):
+			self.logger.info( u"webhook recording: %d webhooks in %s" % ( self.webhookRecorder.recorded, self.webhookRecorder.path ) )
+		return True
+
+
+	########################################
+	# Metrics
+	########################################
+	def logMetrics(self):
+
+		for line in self.metrics.formatLines():
+			self.logger.info( line )
+		return True
+
+
+	def resetMetrics(self):
+
+		self.metrics.reset()
+		self.logger.info( u"metrics reset" )
+		return True
+
+
+	def _publishMetrics(self):
+
+		# only variables whose value changed are sent to the server
+		for name, value in self.metrics.variableValues( self.metricsVariablePrefix ):
+			if( self.publishedMetrics.get( name ) == value ):
+				continue
+			try:
+				if( name in indigo.variables ):
+					indigo.variable.updateValue( name, value=value )
+				else:
+					indigo.variable.create( name, value=value )
+				self.publishedMetrics[ name ] = value
+			except Exception, e:
+				self.logger.error( u"unable to publish metric to variable %s: %s" % ( name, e ) )
+
+
+	########################################
+	# Profiling
+	########################################
+	def startProfiling(self, valuesDict, typeId):
+
+		errorsDict = indigo.Dict()
+		try:
+			minutes = float(valuesDict["minutes"])
+			if minutes <= 0:
+				raise Exception()
+		except:
+			errorsDict["minutes"] = u"Must be a number greater than 0 (minutes)."
+			return False, valuesDict, errorsDict
+
+		if( self.profiler != None ):
+			self.logger.warning( u"already profiling until %s" % time.strftime( "%H:%M:%S", time.localtime( self.profiler.until ) ) )
+			return True
+
+		mode = valuesDict.get("mode", "sampling")
+		self.profiler = Profiler( mode, minutes * 60, indigo.server.getLogsFolderPath( pluginId=self.pluginId ) )
+		self.logger.info( u"%s profiling of the polling loop and webhooks for %g minute(s), output to %s" % ( mode, minutes, self.profiler.path ) )
+		return True
+
+
+	def stopProfiling(self):
+
+		if( self.profiler == None ):
+			self.logger.info( u"not profiling" )
+			return True
+		# the polling loop writes the output on its next pass, outside any profiled call
+		self.profiler.until = time.time()
+		return True
+
+
+	def _stopProfiler(self):
+
+		profiler = self.profiler
+		self.profiler = None
+		try:
+			summary = profiler.stop()
+		except Exception, e:
+			self.logger.error( u"unable to write profile to %s: %s" % ( profiler.path, e ) )
+			return
+		if( summary != None ):
+			self.logger.info( u"profiling finished: %s" % summary )
+
+
 	######################################################################################
 	# Indigo Trigger Start/Stop
 	######################################################################################
@@ -450,8 +1373,13 @@ class Plugin(indigo.PluginBase):
 	def triggerStartProcessing(self, trigger):
 		super(Plugin, self).triggerStartProcessing(trigger)
 		self.logger.debug("Start processing trigger " + str(trigger.id))
-		if trigger.id not in self.triggerDict:
-			self.triggerDict[trigger.id] = trigger
+		# a restarted trigger may have been edited; drop its old object and index entry
+		self.triggerDict[trigger.id] = trigger
+		self._unindexTrigger( trigger.id )
+
+		key = ( trigger.pluginTypeId, trigger.pluginProps.get("vehicle", "") )
+		self.triggerIndex.setdefault( key, set() ).add( trigger.id )
+		self.triggerKeys[ trigger.id ] = key
 		self.logger.debug("Start trigger processing list: " + str(self.triggerDict))
 
 	########################################
@@ -463,9 +1391,20 @@ class Plugin(indigo.PluginBase):
 		except:
 			# the trigger isn't in the list for some reason so just skip it
 			pass
+
+		self._unindexTrigger( trigger.id )
 		self.logger.debug("Stop trigger processing list: " + str(self.triggerDict))
 
 
+	def _unindexTrigger(self, triggerId):
+		key = self.triggerKeys.pop( triggerId, None )
+		if( key != None ):
+			triggerIds = self.triggerIndex.get( key, set() )
+			triggerIds.discard( triggerId )
+			if( len( triggerIds ) == 0 ):
+				self.triggerIndex.pop( key, None )
+
+
 	######################################################################################
 	# Indigo Trigger Firing
 	######################################################################################	
@@ -473,11 +1412,11 @@ class Plugin(indigo.PluginBase):
 	def _fireTrigger(self, event, imei=None):
 		try:
 			self.logger.debug( "_fireTrigger - event: %s, imei: %s" % ( event, imei ) )
-			for triggerId, trigger in self.triggerDict.items():
-				#self.logger.debug( trigger )
-				if trigger.pluginTypeId == event:
-					if trigger.pluginProps["vehicle"] == imei:
-						indigo.trigger.execute(trigger)
+			triggerIds = self.triggerIndex.get( ( event, imei ), set() ) | self.triggerIndex.get( ( event, self.anyVehicle ), set() )
+			for triggerId in triggerIds:
+				trigger = self.triggerDict.get( triggerId )
+				if( trigger != None ):
+					indigo.trigger.execute(trigger)
 
 		except Exception as exc:
 			self.logger.error(u"An error occurred during trigger processing")
@@ -573,7 +1512,7 @@ class Plugin(indigo.PluginBase):
 		latLongCSV = None
 		try:
 	
-			tripData = dev.states["webHookJSON-tripData"]
+			tripData = self._getPayload( dev, "webHookJSON-tripData" )
 			#self.logger.debug( tripData )
 			tripDataJson = json.loads( tripData )
 			latLongCSV = "%s,%s" % ( tripDataJson[ "data" ][ 0 ][ "gps" ][ "lat" ], tripDataJson[ "data" ][ 0 ][ "gps" ][ "lon" ] )
@@ -611,46 +1550,46 @@ class Plugin(indigo.PluginBase):
 
 		try:
 			self.logger.debug( "getGoogleDistanceMatrix for %s" % dev.name )
-			
-			googleMapsApiKey = self.pluginPrefs["googleMapsAPIKey"]
-			
-			##self.logger.debug( googleMapsApiKey )
 
-			theUrl = 'https://maps.googleapis.com/maps/api/distancematrix/json?origins='+str(latLongCSV)+'&' + urllib.urlencode({'destinations':self.pluginPrefs["homeAddress"]}) + '&key='+googleMapsApiKey+'&units=imperial'
-			self.logger.debug( theUrl )
-			
-			response = requests.get(theUrl, timeout=2)
-			
-			self.logger.debug( response.text )
+			responseText = self._getDistanceMatrixResponse( dev, latLongCSV )
 
-			dev.updateStateOnServer( "googleapis-distancematrix", response.text )
+			self._setPayloadState( dev, "googleapis-distancematrix", responseText )
 			
-			distanceMatrixJson = json.loads(response.text)
+			distanceMatrixJson = json.loads(responseText)
+
+			element = self._distanceMatrixElement( distanceMatrixJson )
+			if( element == None ):
+				self.logger.warning( u"no distance matrix result for %s (status %s)" % ( dev.name, distanceMatrixJson.get( 'status' ) ) )
+				return None
 			
 			# Record last ETA Distance and this ETA Distance to help determine if we'll notify en route
-			distance = str(distanceMatrixJson['rows'][0]['elements'][0]['distance']['text']).split()
+			distance = str(element['distance']['text']).split()
 			
 			#self.logger.debug( distance )
 			
 			if distance[1] == 'mi':
-				dev.updateStateOnServer( 'currentMilesFromHome', float(distance[0]) )
+				currentMilesFromHome = float(distance[0])
 			else:
-				dev.updateStateOnServer( 'currentMilesFromHome', 0.0 )
+				currentMilesFromHome = 0.0
+			self.stateWriter.set( dev, 'currentMilesFromHome', currentMilesFromHome )
 
 
 			try:
-				percentChange = ((dev.states['previousMilesFromHome'] - dev.states['currentMilesFromHome']) / dev.states['previousMilesFromHome']) * 100
+				previousMilesFromHome = float( self.stateWriter.get( dev, 'previousMilesFromHome', 0.0 ) )
+				percentChange = ((previousMilesFromHome - currentMilesFromHome) / previousMilesFromHome) * 100
 			except Exception, e:
 				# Divide by zero when car[vehicleId]['previousMilesFromHome'] is zero
 				percentChange = 0.0
-				dev.updateStateOnServer( 'previousMilesFromHome', dev.states['currentMilesFromHome'] )
+				self.stateWriter.set( dev, 'previousMilesFromHome', currentMilesFromHome )
 			
 			# Only notify en route if there is a significant change in progress towards the house (or we're less than a mile away)
-			if percentChange > 50.0 or dev.states['currentMilesFromHome'] == 0.0:
-				dev.updateStateOnServer( 'previousMilesFromHome', dev.states['currentMilesFromHome'] )
+			if percentChange > 50.0 or currentMilesFromHome == 0.0:
+				self.stateWriter.set( dev, 'previousMilesFromHome', currentMilesFromHome )
 				if percentChange > 50.0:
 					
-					self._fireTrigger("approaching_home", dev.states['imei'])
+					# triggers should see the new distance
+					self.stateWriter.flush( dev )
+					self._fireTrigger("approaching_home", self.devIdToImei.get( dev.id ))
 
 				#indigo.server.log(dev.name + " En Route; At " + location + ", " + ETA)
 			else:
@@ -667,6 +1606,66 @@ class Plugin(indigo.PluginBase):
 		return None
 
 
+	def _distanceMatrixElement(self, distanceMatrixJson):
+
+		# the single origin/destination element of an OK answer, or None
+		try:
+			if( distanceMatrixJson.get( 'status' ) != "OK" ):
+				return None
+			element = distanceMatrixJson['rows'][0]['elements'][0]
+			if( element.get( 'status' ) != "OK" or 'distance' not in element ):
+				return None
+			return element
+		except ( AttributeError, KeyError, IndexError, TypeError ):
+			return None
+
+
+	def _getDistanceMatrixResponse(self, dev, latLongCSV):
+
+		now = time.time()
+		homeAddress = self.pluginPrefs["homeAddress"]
+
+		# several triggers asking for an ETA at once get the same answer
+		lastQuery = self.distanceMatrixLastQuery.get( dev.id )
+		if( lastQuery != None and now - lastQuery[0] < self.distanceMatrixMinInterval ):
+			self.logger.debug( "distance matrix for %s queried %.0f seconds ago, reusing it" % ( dev.name, now - lastQuery[0] ) )
+			return lastQuery[1]
+
+		lat, lon = geo.parseLatLong( latLongCSV )
+		cacheKey = "%s|%s" % ( geo.quantize( lat, lon, self.distanceMatrixCachePrecision ), homeAddress )
+		responseText = self.distanceMatrixCache.get( cacheKey )
+
+		if( responseText != None ):
+			self.logger.debug( "distance matrix cache hit for %s" % cacheKey )
+		else:
+			params = {
+				'origins': latLongCSV,
+				'destinations': homeAddress,
+				'key': self.pluginPrefs["googleMapsAPIKey"],
+				'units': 'imperial',
+			}
+			if( self.distanceMatrixTraffic ):
+				# gives duration_in_traffic; only asked for when the cached answer has aged out
+				params[ 'departure_time' ] = 'now'
+
+			response = self._googleGet( 'distancematrix', params )
+			responseText = response.text
+			
+			self.logger.debug( responseText )
+
+			# errors aren't kept, so the next position or ETA asks again
+			try:
+				usable = self._distanceMatrixElement( json.loads( responseText ) ) != None
+			except ValueError:
+				usable = False
+			if( not usable ):
+				return responseText
+			self.distanceMatrixCache.put( cacheKey, responseText )
+
+		self.distanceMatrixLastQuery[ dev.id ] = ( now, responseText )
+		return responseText
+
+
 	def getETA(self, pluginAction, dev):
 		
 		self.logger.debug( "getETA for \"%s\"" % (dev.name) )
@@ -676,7 +1675,8 @@ class Plugin(indigo.PluginBase):
 		latLongData = self.getLatLongData( dev )
 		
 		if( latLongData[ "latLongCSV" ] == None ):
-			dev.updateStateOnServer( "ETA", eta )
+			self.stateWriter.set( dev, "ETA", eta )
+			self.stateWriter.flush( dev )
 			self.logger.debug( eta )
 			return eta
 		
@@ -708,8 +1708,10 @@ class Plugin(indigo.PluginBase):
 			   "status" : "OK"
 			}			
 			'''
-			text = distanceMatrixJson['rows'][0]['elements'][0]['duration']['text']
-			seconds = distanceMatrixJson['rows'][0]['elements'][0]['duration']['value']
+			element = distanceMatrixJson['rows'][0]['elements'][0]
+			duration = element.get( 'duration_in_traffic', element['duration'] )
+			text = duration['text']
+			seconds = duration['value']
 			
 			# when did we get this geoLocation data?
 			self.logger.debug( str(latLongData[ "latLongTimestamp" ]) )
@@ -730,12 +1732,13 @@ class Plugin(indigo.PluginBase):
 		
 			#self.logger.debug( ETA )
 			
-			eta = text + " / " + str(dev.states['currentMilesFromHome']) + " miles from home, ETA " + ETA.strftime("%I:%M %p")
+			eta = text + " / " + str(self.stateWriter.get( dev, 'currentMilesFromHome' )) + " miles from home, ETA " + ETA.strftime("%I:%M %p")
 			self.logger.debug( eta )
-			dev.updateStateOnServer( "ETA", eta )
+			self.stateWriter.set( dev, "ETA", eta )
 			
-			dev.updateStateOnServer( "formatted_address", str( distanceMatrixJson['origin_addresses'][ 0 ] ) )
+			self.stateWriter.set( dev, "formatted_address", str( distanceMatrixJson['origin_addresses'][ 0 ] ) )
 			
+		self.stateWriter.flush( dev )
 		return eta
 	
 	
@@ -750,32 +1753,73 @@ class Plugin(indigo.PluginBase):
 		try:
 			self.logger.debug("getLocation %s" % dev.name)
 
-			googleMapsApiKey = self.pluginPrefs["googleMapsAPIKey"]
-	
-			#self.logger.debug( googleMapsApiKey )
-			
-			apiURL = 'https://maps.googleapis.com/maps/api/geocode/json?latlng='+str(latLongCSV)+'&key='+googleMapsApiKey
-			##self.logger.debug( apiURL )
-						
-			response = requests.get(apiURL, timeout=2)
+			# vehicles park in the same few places, so answer from the grid cell cache when we can
+			lat, lon = geo.parseLatLong( latLongCSV )
+			cacheKey = geo.quantize( lat, lon, self.geocodeCachePrecision )
+			responseText = self.geocodeCache.get( cacheKey )
+			fromCache = ( responseText != None )
+
+			if( fromCache ):
+				self.logger.debug( "geocode cache hit for %s" % cacheKey )
+			else:
+				googleMapsApiKey = self.pluginPrefs["googleMapsAPIKey"]
+		
+				#self.logger.debug( googleMapsApiKey )
+				
+				params = { 'latlng': str(latLongCSV), 'key': googleMapsApiKey }
+							
+				response = self._googleGet( 'geocode', params )
+
+				##self.logger.debug( response.text )
 
-			##self.logger.debug( response.text )
+				responseText = response.text
 
-			dev.updateStateOnServer( "googleapis-geocode", response.text )
+			self._setPayloadState( dev, "googleapis-geocode", responseText )
 
-			responseJson = json.loads(response.text)
+			responseJson = json.loads(responseText)
 			
-			dev.updateStateOnServer( "formatted_address", str( responseJson['results'][0]['formatted_address'] ) )
+			self.stateWriter.set( dev, "formatted_address", str( responseJson['results'][0]['formatted_address'] ) )
+
+			if( not fromCache and responseJson.get( 'status' ) == "OK" ):
+				self.geocodeCache.put( cacheKey, responseText )
+				self.geocodeCacheDirty = True
 			
 			return responseJson
 
 		except Exception, e:
-			iself.logger.error('Location unknown, geocode failed: ' + str(e))
+			self.logger.error('Location unknown, geocode failed: ' + str(e))
 			pass
 	
 		return responseJson
 
 
+	def _googleGet(self, api, params):
+
+		# GET maps/api/<api>/json, timed and counted per api
+		started = time.time()
+		try:
+			response = self.httpSession.get(self.googleMapsAPIBaseUrl + api + '/json', params=params, timeout=self.httpTimeout)
+		except Exception:
+			self.metrics.increment( "google.%s.errors" % api )
+			raise
+		finally:
+			self.metrics.observe( "google.%s" % api, time.time() - started )
+		if( response.status_code != 200 ):
+			self.metrics.increment( "google.%s.errors" % api )
+		return response
+
+
+	def _saveGeocodeCache(self):
+
+		# cleared first, so an entry added while saving is picked up next time
+		self.geocodeCacheDirty = False
+		try:
+			self.geocodeCache.save( self.geocodeCachePath )
+		except Exception, e:
+			self.geocodeCacheDirty = True
+			self.logger.warning( u"unable to save geocode cache: %s" % e )
+
+
 	def getAddress(self, pluginAction, dev):
 		
 		self.logger.debug( "getAddress for \"%s\"" % (dev.name) )
@@ -785,7 +1829,8 @@ class Plugin(indigo.PluginBase):
 		latLongData = self.getLatLongData( dev )
 		
 		if( latLongData[ "latLongCSV" ] == None ):
-			dev.updateStateOnServer( "currentStreet", currentStreet )
+			self.stateWriter.set( dev, "currentStreet", currentStreet )
+			self.stateWriter.flush( dev )
 			self.logger.debug( currentStreet )
 			return currentStreet
 		
@@ -801,21 +1846,127 @@ class Plugin(indigo.PluginBase):
 					break
 		
 			self.logger.debug( "getLocation: %s" % currentStreet )
-			dev.updateStateOnServer( "currentStreet", currentStreet )
+			self.stateWriter.set( dev, "currentStreet", currentStreet )
+			self.stateWriter.flush( dev )
 			return currentStreet
 
+		self.stateWriter.flush( dev )
 		self.logger.debug( currentStreet )
 		return currentStreet
 
 	
 
-	def _getTrips( self, imei ):
-		#self.logger.debug(u"_requestVehicle")
+	def _getTrips( self, imei, startsAfter, endsBefore ):
+		#self.logger.debug(u"_getTrips")
 
-		# gps-format can be either 'geojson' or 'polyline'
-		
-		data = self._requestData("trips", { 'imei': imei, 'gps-format': 'geojson' } )
-		return data
+		# gps-format can be either 'geojson' or 'polyline'; tripStore decodes either
+		# a week of trips with gps tracks can be large, so the response is decoded as it
+		# arrives and trips are yielded one at a time instead of holding the whole body
+
+		params = { 'imei': imei, 'gps-format': self.tripGpsFormat, 'starts-after': formatTime( startsAfter ), 'ends-before': formatTime( endsBefore ) }
+		r = self._request( "trips", params, stream=True )
+		if( r == None ):
+			raise Exception( u"trips request failed" )
+		try:
+			for trip in iterJsonArray( r.iter_content( 65536 ) ):
+				yield trip
+		finally:
+			r.close()
+
+
+	def _openTripStore(self):
+
+		try:
+			self.tripStore = TripStore( os.path.join( self._getDataFolder(), "trips.sqlite" ) )
+			self.logger.debug( u"trip store has %d trips" % self.tripStore.countTrips() )
+		except Exception, e:
+			self.logger.error( u"unable to open trip store: %s" % e )
+			self.tripStore = None
+
+
+	def _openGpsStore(self):
+
+		try:
+			self.gpsStore = GpsStore( os.path.join( self._getDataFolder(), "gps.sqlite" ), retentionDays=self.gpsRetentionDays )
+		except Exception, e:
+			self.logger.error( u"unable to open GPS point store: %s" % e )
+			self.gpsStore = None
+
+
+	def _closeGpsStore(self):
+
+		# webhook threads take their own reference, so clear ours before closing
+		gpsStore = self.gpsStore
+		self.gpsStore = None
+		try:
+			gpsStore.close()
+		except Exception, e:
+			self.logger.error( u"unable to close GPS point store: %s" % e )
+
+
+	def _startTripSyncIfDue(self):
+
+		if( not self.syncTripHistory or self.tripStore == None or time.time() < self.nextTripSync ):
+			return
+		# a slow sync is never overlapped by the next one
+		if( self.tripSyncThread != None and self.tripSyncThread.is_alive() ):
+			return
+
+		self.nextTripSync = time.time() + self.tripSyncInterval
+		imeis = sorted( set( self.devIdToImei.values() ) )
+		self.tripSyncThread = threading.Thread( target=self._syncAllTrips, args=( imeis, ), name="BouncieTripSync" )
+		self.tripSyncThread.daemon = True
+		self.tripSyncThread.start()
+
+
+	def _syncAllTrips(self, imeis):
+
+		for imei in imeis:
+			try:
+				count = self._syncTrips( imei )
+				if( count > 0 ):
+					self.logger.debug( u"synced %d trip(s) for imei %s" % ( count, imei ) )
+			except Exception, e:
+				self.logger.warning( u"trip sync for imei %s stopped: %s" % ( imei, e ) )
+
+
+	def _syncTrips(self, imei):
+
+		# walks forward from the high-water mark a window at a time, so only trips newer
+		# than what is already stored are fetched. returns the number of trips stored.
+		now = datetime.datetime.utcnow()
+		lastTripEnd, scannedUntil = self.tripStore.getSyncState( imei )
+
+		starts = []
+		if( lastTripEnd != None ):
+			starts.append( parseTime( lastTripEnd ) )
+		if( scannedUntil != None ):
+			starts.append( parseTime( scannedUntil ) - self.tripSyncOverlap )
+		if( len( starts ) > 0 ):
+			windowStart = max( starts )
+		else:
+			windowStart = now - datetime.timedelta( days=self.tripSyncHistoryDays )
+
+		count = 0
+		while windowStart < now:
+			windowEnd = min( windowStart + self.tripSyncWindow, now )
+
+			batch = []
+			for trip in self._getTrips( imei, windowStart, windowEnd ):
+				batch.append( trip )
+				if( len( batch ) >= self.tripSyncBatchSize ):
+					lastTripEnd = max( lastTripEnd, self.tripStore.upsertTrips( imei, batch, self.tripGpsFormat ) )
+					count += len( batch )
+					batch = []
+			if( len( batch ) > 0 ):
+				lastTripEnd = max( lastTripEnd, self.tripStore.upsertTrips( imei, batch, self.tripGpsFormat ) )
+				count += len( batch )
+
+			# only recorded once the whole window has been read
+			self.tripStore.setSyncState( imei, lastTripEnd, formatTime( windowEnd ) )
+			windowStart = windowEnd
+
+		return count
 	
 
 	############################
@@ -825,38 +1976,87 @@ class Plugin(indigo.PluginBase):
 
 	def _requestData(self, target, paramsList={}):
 	
-		retries = 3
 		data = ""
+		r = self._request( target, paramsList )
+		if( r != None ):
+			data = r.text
+		return data
+
+
+	def _request(self, target, paramsList={}, stream=False):
+
+		# returns the response for a 200, otherwise None. with stream=True the body has
+		# not been read yet and the caller has to close the response
+		response = None
+
+		# during an outage an open circuit costs nothing instead of timeouts and retries per request
+		breaker = self.circuitBreakers[ target ]
+		if( not breaker.allow() ):
+			self.logger.debug( u"%s endpoint circuit open, skipping request" % target )
+			self.metrics.increment( "api.%s.circuitOpen" % target )
+			return response
+
+		attempt = 0
+		renewedToken = False
 		try:
 		
-			while retries > 0:
+			while True:
 			
-				jsonResponse = json.loads(self.pluginPrefs['accessTokenJson'])
-				#self.logger.debug("Bearer %s" % jsonResponse["access_token"])
+				accessToken = self.tokenManager.getToken()
+				if( accessToken == None ):
+					self.logger.error( u"no access token. Please re-configure Bouncie to obtain an access token." )
+					# nothing was sent, so this says nothing about the endpoint
+					breaker.release()
+					break
 	
-				headersData = {"Content-type": "application/x-www-form-urlencoded", "Authorization": "%s" % jsonResponse["access_token"]}
-
-				r = requests.get(self.bouncieAPIBaseUrl + target, params=paramsList, timeout=2, headers=headersData)
+				headersData = {"Content-type": "application/x-www-form-urlencoded", "Authorization": "%s" % accessToken}
+
+				started = time.time()
+				try:
+					r = self.httpSession.get(self.bouncieAPIBaseUrl + target, params=paramsList, timeout=self.httpTimeout, headers=headersData, stream=stream)
+					statusCode = r.status_code
+					if( stream and statusCode != 200 ):
+						# give the connection back to the pool
+						r.close()
+				except requests.exceptions.RequestException, e:
+					self.logger.debug( u"%s request failed: %s" % ( target, e ) )
+					statusCode = None
+				self.metrics.observe( "api.%s" % target, time.time() - started )
+				if( statusCode != 200 ):
+					self.metrics.increment( "api.%s.errors" % target )
 				#self.logger.debug( r )
 			
-				if( r.status_code == 200 ):
-					data = r.text
-					retries = 0
+				if( statusCode == 200 ):
+					response = r
+					breaker.recordSuccess()
+					break
+
+				if( statusCode == 401 and not renewedToken ):
+					# access token expired? renews once even if several requests hit this together
+					self.tokenManager.invalidate( accessToken )
+					renewedToken = True
 					continue
-					
-				else:
-					retries -= 1
-					# problem getting data
-					if( r.status_code == 401 ):
-						
-						# access token expired?
-						self.renewAccessToken()
-						
+
+				if( not self.retryPolicy.isRetryable( statusCode ) ):
+					# the API answered, so this isn't an outage; don't count it against the circuit
+					self.logger.error( u"%s request failed with status %s" % ( target, statusCode ) )
+					breaker.recordSuccess()
+					break
+
+				attempt += 1
+				if( attempt >= self.retryPolicy.attempts ):
+					self.logger.debug( u"%s request failed after %d attempts (last status %s)" % ( target, attempt, statusCode ) )
+					breaker.recordFailure()
+					break
+
+				self.metrics.increment( "api.%s.retries" % target )
+				time.sleep( self.retryPolicy.delay( attempt ) )
 
 		except Exception, e:
+			breaker.recordFailure()
 			self.logger.error("FYI - Exception caught _requestData: " + str(e))
 
-		return data
+		return response
 
 
 	'''
@@ -917,15 +2117,22 @@ class Plugin(indigo.PluginBase):
 		
 		self.logger.debug(data)
 		jsonResponse = json.loads(data)
+
+		return self._buildVehicleList( jsonResponse )
+
+
+	def _buildVehicleList(self, jsonResponse):
 		
+		# [ imei, name ] per vehicle; a vehicle with missing details gets a fallback name
 		myArray = []
 		for result in jsonResponse:
-			if( ( 'nickName' in result ) and ( result['nickName'] != None ) ):
-				self.logger.debug( result['nickName'] )
-				myArray.append( [ result['imei'], result['nickName'] ] )
-			else:
-				self.logger.debug( "%s %s %s" % ( result['model']['make'], result['model']['name'], result['model']['year'] ) )
-				myArray.append( [ result['imei'], "%s %s %s" % ( result['model']['make'], result['model']['name'], result['model']['year'] ) ] )
+			if( not isinstance( result, dict ) or result.get('imei') == None ):
+				continue
+			name = result.get('nickName')
+			if( name == None ):
+				model = result.get('model') or {}
+				name = " ".join( unicode( part ) for part in ( model.get('make'), model.get('name'), model.get('year') ) if part != None )
+			myArray.append( [ result['imei'], name or result['imei'] ] )
 
 		return myArray
 		
@@ -937,9 +2144,14 @@ class Plugin(indigo.PluginBase):
 		myArray = []
 		
 		try:
-			myArray = self._getVehicles()
+			# served from memory; only the very first call waits on the API
+			myArray = list( self.vehicleCatalog.get() or [] )
 		except Exception, e:
 			indigo.server.log("FYI - Exception caught getting vehicles list: " + str(e))
+
+		# triggers can also fire for every vehicle
+		if( filter == "anyVehicle" ):
+			myArray.insert( 0, [ self.anyVehicle, "Any Vehicle" ] )
 			
 		return myArray
 
@@ -958,7 +2170,7 @@ class Plugin(indigo.PluginBase):
 		
 		self.logger.debug(u"getAuthorization")
 		
-		authorizationURL = "https://auth.bouncie.com/dialog/authorize?client_id=%s&redirect_uri=http://localhost/&response_type=code&state=initBouncieAuth" % ( valuesDict[ "clientId" ] )
+		authorizationURL = "%s/dialog/authorize?client_id=%s&redirect_uri=http://localhost/&response_type=code&state=initBouncieAuth" % ( self.bouncieAuthBaseUrl, valuesDict[ "clientId" ] )
 		
 		self.logger.debug( authorizationURL )
 		self.browserOpen( authorizationURL )
@@ -973,16 +2185,49 @@ class Plugin(indigo.PluginBase):
 
 	def _requestAccessToken(self, code, clientId, clientSecret):
 		data = ""
+
+		breaker = self.circuitBreakers[ "oauth" ]
+		if( not breaker.allow() ):
+			self.logger.warning( u"oauth endpoint circuit open, not requesting access token" )
+			self.metrics.increment( "api.oauth.circuitOpen" )
+			return data
+
 		try:
 			postURL = "/oauth/token"
 
 			headersData = {"Content-type": "application/x-www-form-urlencoded", "Accept": "*/*", "User-Agent": "BouncieIndigoPlugin"}
 			postData = {'client_id': clientId, 'client_secret': clientSecret, 'grant_type': 'authorization_code', 'code': code, 'redirect_uri': 'http://localhost/' }
-			r = requests.post('https://auth.bouncie.com' + postURL, timeout=2, headers=headersData, data=postData)
-			data = r.text
+
+			attempt = 0
+			while True:
+				started = time.time()
+				try:
+					r = self.httpSession.post(self.bouncieAuthBaseUrl + postURL, timeout=self.httpTimeout, headers=headersData, data=postData)
+					statusCode = r.status_code
+				except requests.exceptions.RequestException, e:
+					self.logger.debug( u"oauth request failed: %s" % e )
+					statusCode = None
+				self.metrics.observe( "api.oauth", time.time() - started )
+				if( statusCode != 200 ):
+					self.metrics.increment( "api.oauth.errors" )
+
+				if( not self.retryPolicy.isRetryable( statusCode ) ):
+					# a rejected code is a configuration problem, not an outage
+					breaker.recordSuccess()
+					data = r.text
+					break
+
+				attempt += 1
+				if( attempt >= self.retryPolicy.attempts ):
+					breaker.recordFailure()
+					break
+
+				self.metrics.increment( "api.oauth.retries" )
+				time.sleep( self.retryPolicy.delay( attempt ) )
 
 			self.logger.debug(data)
 		except Exception, e:
+			breaker.recordFailure()
 			self.logger.error("FYI - Exception caught _requestAccessToken: " + str(e))
 
 		return data
@@ -997,7 +2242,10 @@ class Plugin(indigo.PluginBase):
 
 			# store the access token!
 			# or maybe store the whole response??
+			obtainedAt = time.time()
 			self.pluginPrefs["accessTokenJson"] = data
+			self.pluginPrefs["accessTokenObtained"] = str( obtainedAt )
+			self.tokenManager.load( data, obtainedAt )
 			
 			return True
 		except Exception, e:
@@ -1008,11 +2256,13 @@ class Plugin(indigo.PluginBase):
 	def renewAccessToken( self ):
 	
 		self.logger.debug(u"renewAccessToken")
+		self.metrics.increment( "token.renewals" )
 		
 		data = self._requestAccessToken(self.pluginPrefs["code"], self.pluginPrefs["clientId"], self.pluginPrefs["clientSecret"])
 
 		if( not self._saveAccessToken(data) ):
 			self.logger.error( "Unable to automatically renew access token. Please re-configure Bouncie to renew access token." )
+			self.metrics.increment( "token.renewalFailures" )
 			return False
 
 		return True
@@ -0,0 +1,119 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Trip GPS tracks in either format the Bouncie API offers.
+#
+# 'polyline' is Google's encoded polyline (precision 5), a fraction of the size of
+# the same track as GeoJSON. Both formats decode to the same thing: an array('d') of
+# interleaved latitude, longitude values, which takes 16 bytes a point instead of a
+# list of lists of floats.
+
+import re
+
+from array import array
+
+
+# one zig-zag varint: continuation characters ( '_' to '~' ) then a final one ( '?' to '^' )
+_TOKEN = re.compile( br"[_-~]*[?-^]" )
+
+# GPS samples a second or so apart give a small set of deltas that repeat a lot,
+# so decoded tokens are memoized
+_deltas = {}
+_DELTAS_MAX = 65536
+
+
+def _delta(token):
+	result = 0
+	shift = 0
+	for b in bytearray( token ):
+		result |= ( ( b - 63 ) & 0x1f ) << shift
+		shift += 5
+	delta = ~( result >> 1 ) if result & 1 else result >> 1
+	if( len( _deltas ) >= _DELTAS_MAX ):
+		_deltas.clear()
+	_deltas[ token ] = delta
+	return delta
+
+
+def decode(encoded, precision=5):
+	# batched: the regex splits the whole string into tokens in one C-level pass,
+	# tokens become deltas through the memo table, then a single loop accumulates
+	# them into coordinates
+	if( isinstance( encoded, bytearray ) ):
+		encoded = bytes( encoded )
+	elif( not isinstance( encoded, bytes ) ):
+		encoded = encoded.encode( "ascii" )
+
+	tokens = _TOKEN.findall( encoded )
+	if( sum( len( t ) for t in tokens ) != len( encoded ) or len( tokens ) % 2 ):
+		raise ValueError( "malformed polyline" )
+
+	get = _deltas.get
+	deltas = [ get( t ) for t in tokens ]
+	if( None in deltas ):
+		deltas = [ _delta( t ) if d == None else d for d, t in zip( deltas, tokens ) ]
+
+	factor = float( 10 ** precision )
+	coords = array( 'd', [ 0.0 ] ) * len( deltas )
+	lat = 0
+	lon = 0
+	i = 0
+	values = iter( deltas )
+	for dLat in values:
+		lat += dLat
+		lon += next( values )
+		coords[ i ] = lat / factor
+		coords[ i + 1 ] = lon / factor
+		i += 2
+	return coords
+
+
+def _encodeValue(value, out):
+	value = ~( value << 1 ) if value < 0 else value << 1
+	while value >= 0x20:
+		out.append( chr( ( 0x20 | ( value & 0x1f ) ) + 63 ) )
+		value >>= 5
+	out.append( chr( value + 63 ) )
+
+
+def encode(points, precision=5):
+	# points is a sequence of ( lat, lon )
+	factor = 10 ** precision
+	out = []
+	lastLat = 0
+	lastLon = 0
+	for lat, lon in points:
+		lat = int( round( lat * factor ) )
+		lon = int( round( lon * factor ) )
+		_encodeValue( lat - lastLat, out )
+		_encodeValue( lon - lastLon, out )
+		lastLat = lat
+		lastLon = lon
+	return "".join( out )
+
+
+def decodeGeoJson(gps):
+	# a GeoJSON LineString (or a bare coordinates list); GeoJSON orders each
+	# position as [ lon, lat, ... ]
+	coordinates = gps.get( "coordinates", [] ) if isinstance( gps, dict ) else gps
+	coords = array( 'd' )
+	append = coords.append
+	for position in coordinates or []:
+		append( float( position[1] ) )
+		append( float( position[0] ) )
+	return coords
+
+
+def decodeTripGps(gps, gpsFormat):
+	# a trip's gps field as interleaved lat, lon, whichever format it was fetched in
+	if( gps == None ):
+		return array( 'd' )
+	if( gpsFormat == "polyline" ):
+		return decode( gps )
+	return decodeGeoJson( gps )
+
+
+def points(coords):
+	# ( lat, lon ) pairs from an interleaved coordinate array
+	return list( zip( coords[0::2], coords[1::2] ) )
@@ -0,0 +1,181 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# On-demand profiling of the plugin's hot paths.
+#
+# The plugin runs each poll-loop cycle and each webhook through runcall() while a
+# Profiler exists, and calls them directly otherwise, so there is nothing to pay
+# when profiling is off. Two modes:
+#
+#   cprofile   every call is traced with a cProfile.Profile per thread; the merged
+#              stats are written as .pstats (python -m pstats, snakeviz, ...)
+#   sampling   a thread samples the stacks of threads inside runcall() every
+#              interval seconds; the counts are written as .folded stacks
+#              (flamegraph.pl, speedscope, ...). Much cheaper than cprofile. Samples
+#              are wall clock, so waiting on the network shows up as socket reads.
+
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+
+try:
+	from StringIO import StringIO
+except ImportError:
+	from io import StringIO
+
+
+MODES = ( "sampling", "cprofile" )
+
+
+class Profiler(object):
+
+	def __init__(self, mode, duration, outputDir, interval=0.005):
+		if( mode not in MODES ):
+			raise ValueError( "unknown profiling mode %s" % mode )
+		self.mode = mode
+		self.started = time.time()
+		self.until = self.started + duration
+		self.interval = interval
+		self.path = os.path.join( outputDir, "profile-%s.%s" % ( time.strftime( "%Y%m%d-%H%M%S" ), "pstats" if mode == "cprofile" else "folded" ) )
+		self.lock = threading.Lock()
+		self.calls = 0
+		self.stopped = False
+
+		# thread ident -> cProfile.Profile
+		self.profiles = {}
+		# thread ident -> nesting depth of runcall() on that thread
+		self.active = {}
+		# folded stack -> samples
+		self.stacks = {}
+		self.samples = 0
+		self.sampler = None
+		if( mode == "sampling" ):
+			self.sampler = threading.Thread( target=self._sample, name="BouncieProfiler" )
+			self.sampler.daemon = True
+			self.sampler.start()
+
+
+	def expired(self):
+		return time.time() >= self.until
+
+
+	def runcall(self, fn, *args):
+		ident = threading.current_thread().ident
+		with self.lock:
+			if( self.stopped ):
+				profile = None
+				depth = -1
+			else:
+				depth = self.active.get( ident, 0 )
+				self.active[ ident ] = depth + 1
+				self.calls += 1
+				profile = None
+				if( self.mode == "cprofile" and depth == 0 ):
+					profile = self.profiles.get( ident )
+					if( profile == None ):
+						profile = cProfile.Profile()
+						self.profiles[ ident ] = profile
+		if( depth < 0 ):
+			return fn( *args )
+
+		try:
+			if( profile != None ):
+				return profile.runcall( fn, *args )
+			return fn( *args )
+		finally:
+			with self.lock:
+				if( depth == 0 ):
+					self.active.pop( ident, None )
+				else:
+					self.active[ ident ] = depth
+
+
+	def _sample(self):
+		me = threading.current_thread().ident
+		while not self.stopped:
+			time.sleep( self.interval )
+			with self.lock:
+				idents = [ ident for ident in self.active if ident != me ]
+			if( len( idents ) == 0 ):
+				continue
+			names = dict( ( t.ident, t.name ) for t in threading.enumerate() )
+			frames = sys._current_frames()
+			for ident in idents:
+				frame = frames.get( ident )
+				if( frame == None ):
+					continue
+				stack = []
+				while frame != None:
+					code = frame.f_code
+					stack.append( "%s (%s:%d)" % ( code.co_name, os.path.basename( code.co_filename ), code.co_firstlineno ) )
+					frame = frame.f_back
+				stack.append( names.get( ident, "thread-%s" % ident ) )
+				key = ";".join( reversed( stack ) )
+				with self.lock:
+					self.stacks[ key ] = self.stacks.get( key, 0 ) + 1
+					self.samples += 1
+
+
+	def stop(self, wait=5.0):
+		# stops profiling, writes the output file and returns a short text summary.
+		# must not be called from inside runcall()
+		with self.lock:
+			if( self.stopped ):
+				return None
+			self.stopped = True
+		if( self.sampler != None ):
+			self.sampler.join( 1.0 )
+
+		# give calls in flight a moment to finish; a profile still in use after that is left out
+		deadline = time.time() + wait
+		while time.time() < deadline:
+			with self.lock:
+				busy = set( self.active )
+			if( len( busy ) == 0 ):
+				break
+			time.sleep( 0.05 )
+
+		if( self.mode == "cprofile" ):
+			return self._writeStats( busy )
+		return self._writeFolded()
+
+
+	def _writeStats(self, busy):
+		stats = None
+		for ident, profile in self.profiles.items():
+			if( ident in busy ):
+				continue
+			profile.create_stats()
+			if( stats == None ):
+				stats = pstats.Stats( profile )
+			else:
+				stats.add( profile )
+		if( stats == None ):
+			return "%d calls, nothing to write" % self.calls
+
+		stats.dump_stats( self.path )
+		out = StringIO()
+		stats.stream = out
+		stats.sort_stats( "cumulative" ).print_stats( 15 )
+		return "%d calls profiled, written to %s\n%s" % ( self.calls, self.path, out.getvalue() )
+
+
+	def _writeFolded(self):
+		if( self.samples == 0 ):
+			return "%d calls, no samples taken" % self.calls
+
+		with open( self.path, "w" ) as f:
+			for key in sorted( self.stacks ):
+				f.write( "%s %d\n" % ( key, self.stacks[ key ] ) )
+
+		# where the samples landed, innermost frame first
+		leaves = {}
+		for key, count in self.stacks.items():
+			leaf = key.rsplit( ";", 1 )[-1]
+			leaves[ leaf ] = leaves.get( leaf, 0 ) + count
+		lines = [ "%6.1f%%  %s" % ( 100.0 * count / self.samples, leaf ) for leaf, count in sorted( leaves.items(), key=lambda item: -item[1] )[:15] ]
+		return "%d calls, %d samples, written to %s\n%s" % ( self.calls, self.samples, self.path, "\n".join( lines ) )
@@ -0,0 +1,101 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Retry policy and per-endpoint circuit breaker for the Bouncie API.
+#
+# Retryable failures (network errors, 408/429/5xx) are retried with exponential
+# backoff and full jitter. Repeated failures open the endpoint's circuit: while it
+# is open requests fail immediately, and after resetTimeout a single probe request
+# is let through (half-open) to decide whether to close it again.
+
+import random
+import threading
+import time
+
+
+RETRYABLE_STATUS_CODES = ( 408, 425, 429, 500, 502, 503, 504 )
+
+
+class RetryPolicy(object):
+
+	def __init__(self, attempts=3, baseDelay=0.5, maxDelay=4.0):
+		self.attempts = attempts
+		self.baseDelay = baseDelay
+		self.maxDelay = maxDelay
+
+
+	def isRetryable(self, statusCode):
+		# statusCode None means the request never got a response
+		return statusCode == None or statusCode in RETRYABLE_STATUS_CODES
+
+
+	def delay(self, attempt):
+		# attempt is 1 for the first retry
+		return random.uniform( 0, min( self.maxDelay, self.baseDelay * ( 2 ** ( attempt - 1 ) ) ) )
+
+
+class CircuitBreaker(object):
+
+	CLOSED = "closed"
+	OPEN = "open"
+	HALF_OPEN = "half-open"
+
+	def __init__(self, name, logger, failureThreshold=3, resetTimeout=60, clock=time.time):
+		self.name = name
+		self.logger = logger
+		self.failureThreshold = failureThreshold
+		self.resetTimeout = resetTimeout
+		self.clock = clock
+
+		self.state = self.CLOSED
+		self.failures = 0
+		self.openedAt = 0
+		self.probeInFlight = False
+		self.lock = threading.Lock()
+
+		self.rejected = 0
+
+
+	def allow(self):
+		with self.lock:
+			if( self.state == self.CLOSED ):
+				return True
+
+			if( self.state == self.OPEN and self.clock() - self.openedAt >= self.resetTimeout ):
+				self.state = self.HALF_OPEN
+				self.logger.info( u"%s endpoint: circuit half-open, probing" % self.name )
+
+			if( self.state == self.HALF_OPEN and not self.probeInFlight ):
+				self.probeInFlight = True
+				return True
+
+			self.rejected += 1
+			return False
+
+
+	def recordSuccess(self):
+		with self.lock:
+			if( self.state != self.CLOSED ):
+				self.logger.info( u"%s endpoint: circuit closed" % self.name )
+			self.state = self.CLOSED
+			self.failures = 0
+			self.probeInFlight = False
+
+
+	def release(self):
+		# allow() let a request through but none was made; free a half-open probe
+		# slot without counting anything
+		with self.lock:
+			self.probeInFlight = False
+
+
+	def recordFailure(self):
+		with self.lock:
+			self.failures += 1
+			if( self.state == self.HALF_OPEN or self.failures >= self.failureThreshold ):
+				if( self.state != self.OPEN ):
+					self.logger.warning( u"%s endpoint: circuit open after %d failure(s), failing fast for %d seconds" % ( self.name, self.failures, self.resetTimeout ) )
+				self.state = self.OPEN
+				self.openedAt = self.clock()
+			self.probeInFlight = False
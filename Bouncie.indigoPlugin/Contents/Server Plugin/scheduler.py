@@ -0,0 +1,126 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Per-device polling scheduler.
+#
+# Every device has a next-due time in a heap. A device that is moving (or has an
+# open trip) is polled at the active interval; a parked device starts at the
+# parked interval and doubles each time it is still parked, up to the maximum.
+# wake() puts a device straight back on the active interval, e.g. when a connect
+# or tripStart webhook comes in.
+
+import heapq
+import itertools
+import threading
+import time
+
+
+class PollScheduler(object):
+
+	def __init__(self, activeInterval, parkedInterval, maxInterval):
+		self.heap = []
+		self.entries = {}		# key -> heap entry [dueTime, seq, key, valid]
+		self.intervals = {}		# key -> current interval
+		self.counter = itertools.count()
+		self.lock = threading.Lock()
+		self.setIntervals( activeInterval, parkedInterval, maxInterval )
+
+
+	def setIntervals(self, activeInterval, parkedInterval, maxInterval):
+		with self.lock:
+			self.activeInterval = float( activeInterval )
+			self.parkedInterval = float( parkedInterval )
+			self.maxInterval = max( float( maxInterval ), self.parkedInterval )
+			for key, interval in self.intervals.items():
+				self.intervals[ key ] = min( max( interval, self.activeInterval ), self.maxInterval )
+
+
+	def _push(self, key, dueTime):
+		# caller holds the lock
+		entry = self.entries.get( key )
+		if( entry != None ):
+			entry[3] = False
+		entry = [ dueTime, next( self.counter ), key, True ]
+		self.entries[ key ] = entry
+		heapq.heappush( self.heap, entry )
+
+
+	def add(self, key, now=None):
+		# new devices are due immediately
+		if( now == None ):
+			now = time.time()
+		with self.lock:
+			self.intervals[ key ] = self.activeInterval
+			self._push( key, now )
+
+
+	def remove(self, key):
+		with self.lock:
+			entry = self.entries.pop( key, None )
+			if( entry != None ):
+				entry[3] = False
+			self.intervals.pop( key, None )
+
+
+	def __contains__(self, key):
+		with self.lock:
+			return key in self.entries
+
+
+	def popDue(self, now=None):
+		# returns the keys that are due. they are requeued at their current interval
+		# so a failed or carried-over poll never drops a device from the schedule.
+		if( now == None ):
+			now = time.time()
+		due = []
+		with self.lock:
+			while( len( self.heap ) > 0 and self.heap[0][0] <= now ):
+				entry = heapq.heappop( self.heap )
+				if( not entry[3] ):
+					continue
+				key = entry[2]
+				due.append( key )
+				self._push( key, now + self.intervals[ key ] )
+		return due
+
+
+	def reschedule(self, key, active, now=None):
+		# called after fresh data for a device has been applied
+		if( now == None ):
+			now = time.time()
+		with self.lock:
+			if( key not in self.entries ):
+				return
+			if( active ):
+				interval = self.activeInterval
+			elif( self.intervals[ key ] < self.parkedInterval ):
+				interval = self.parkedInterval
+			else:
+				interval = min( self.intervals[ key ] * 2, self.maxInterval )
+			self.intervals[ key ] = interval
+			self._push( key, now + interval )
+
+
+	def wake(self, key, now=None):
+		if( now == None ):
+			now = time.time()
+		with self.lock:
+			if( key not in self.entries ):
+				return
+			self.intervals[ key ] = self.activeInterval
+			self._push( key, now )
+
+
+	def nextDue(self):
+		with self.lock:
+			while( len( self.heap ) > 0 and not self.heap[0][3] ):
+				heapq.heappop( self.heap )
+			if( len( self.heap ) == 0 ):
+				return None
+			return self.heap[0][0]
+
+
+	def interval(self, key):
+		with self.lock:
+			return self.intervals.get( key )
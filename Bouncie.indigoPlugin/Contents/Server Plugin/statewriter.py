@@ -0,0 +1,137 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Change-detecting, batched device state writes.
+#
+# Everything written while handling one poll, webhook or action is collected with
+# set()/setList() and sent to the Indigo server with a single updateStatesOnServer
+# call in flush(). Keys whose value matches what was last pushed are dropped, so a
+# poll where nothing changed costs no IPC and doesn't re-evaluate triggers.
+#
+# Pending batches belong to the thread that builds them, so a flush only ever sends
+# what the calling thread has finished. The IPC happens outside the writer's lock,
+# under a per-device lock that keeps flushes for one device in order.
+
+import threading
+
+try:
+	from collections import OrderedDict
+except ImportError:
+	OrderedDict = dict
+
+
+_MISSING = object()
+
+
+class StateWriter(object):
+
+	def __init__(self, logger):
+		self.logger = logger
+		self.lastPushed = {}	# devId -> { key: value }
+		self.pending = {}		# ( thread ident, devId ) -> OrderedDict( key: value )
+		self.deviceLocks = {}	# devId -> Lock held while flushing that device
+		self.lock = threading.Lock()
+
+		self.written = 0
+		self.skipped = 0
+		self.flushes = 0
+
+
+	def _pendingKey(self, devId):
+		return ( threading.current_thread().ident, devId )
+
+
+	def set(self, dev, key, value):
+		pendingKey = self._pendingKey( dev.id )
+		with self.lock:
+			pending = self.pending.get( pendingKey )
+			if( pending == None ):
+				pending = OrderedDict()
+				self.pending[ pendingKey ] = pending
+			pending[ key ] = value
+
+
+	def setList(self, dev, keyValueList):
+		for item in keyValueList:
+			self.set( dev, item['key'], item['value'] )
+
+
+	def get(self, dev, key, default=None):
+		# the value this thread will leave the state at: pending, else last pushed, else the server's
+		pendingKey = self._pendingKey( dev.id )
+		with self.lock:
+			pending = self.pending.get( pendingKey, {} )
+			if( key in pending ):
+				return pending[ key ]
+			pushed = self.lastPushed.get( dev.id, {} )
+			if( key in pushed ):
+				return pushed[ key ]
+		return dev.states.get( key, default )
+
+
+	def _unchanged(self, dev, pushed, key, value):
+		if( key in pushed ):
+			return pushed[ key ] == value
+
+		# nothing pushed yet this session, compare against what the server has
+		if( key not in dev.states ):
+			return False
+		try:
+			return unicode( dev.states[ key ] ) == unicode( value )
+		except Exception:
+			return False
+
+
+	def flush(self, dev):
+		# sends the calling thread's batch for dev
+		with self.lock:
+			pending = self.pending.pop( self._pendingKey( dev.id ), None )
+			if( pending == None ):
+				return 0
+			deviceLock = self.deviceLocks.get( dev.id )
+			if( deviceLock == None ):
+				deviceLock = threading.Lock()
+				self.deviceLocks[ dev.id ] = deviceLock
+
+		with deviceLock:
+			with self.lock:
+				pushed = self.lastPushed.setdefault( dev.id, {} )
+				keyValueList = []
+				for key, value in pending.items():
+					if( self._unchanged( dev, pushed, key, value ) ):
+						self.skipped += 1
+						continue
+					keyValueList.append( { 'key': key, 'value': value } )
+
+				if( len( keyValueList ) == 0 ):
+					return 0
+
+				# marked as pushed up front so a concurrent flush doesn't resend them
+				previous = dict( ( item['key'], pushed.get( item['key'], _MISSING ) ) for item in keyValueList )
+				for item in keyValueList:
+					pushed[ item['key'] ] = item['value']
+
+			try:
+				dev.updateStatesOnServer( keyValueList )
+			except Exception:
+				with self.lock:
+					for key, value in previous.items():
+						if( value is _MISSING ):
+							pushed.pop( key, None )
+						else:
+							pushed[ key ] = value
+				raise
+
+		with self.lock:
+			self.written += len( keyValueList )
+			self.flushes += 1
+		return len( keyValueList )
+
+
+	def forget(self, devId):
+		with self.lock:
+			for pendingKey in [ k for k in self.pending if k[1] == devId ]:
+				del self.pending[ pendingKey ]
+			self.lastPushed.pop( devId, None )
+			self.deviceLocks.pop( devId, None )
@@ -0,0 +1,115 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Access token manager.
+#
+# Keeps the parsed access token in memory along with when it expires. Once the
+# token is within refreshAhead seconds of expiring, the next caller kicks off a
+# renewal in the background and carries on with the current token. Only one
+# renewal runs at a time; callers that need a new token (it has expired, or a
+# request got a 401) wait for the renewal already in flight instead of starting
+# their own.
+
+import json
+import threading
+import time
+
+
+class TokenManager(object):
+
+	def __init__(self, renewFn, logger, refreshAhead=300, clock=time.time):
+		# renewFn() renews the token and hands the result back through load();
+		# it returns True on success
+		self.renewFn = renewFn
+		self.logger = logger
+		self.refreshAhead = refreshAhead
+		self.clock = clock
+
+		self.token = None
+		self.expiresAt = None
+		self.refreshing = False
+		self.cond = threading.Condition()
+
+		self.renewals = 0
+		self.renewalFailures = 0
+
+
+	def load(self, tokenJson, obtainedAt=None):
+		# tokenJson is the /oauth/token response. without obtainedAt the expiry is
+		# unknown, and the token is only renewed after a 401
+		try:
+			data = json.loads( tokenJson )
+			token = data[ "access_token" ]
+		except Exception:
+			return False
+
+		expiresAt = None
+		if( obtainedAt != None and data.get( "expires_in" ) != None ):
+			expiresAt = float( obtainedAt ) + float( data[ "expires_in" ] )
+
+		with self.cond:
+			self.token = token
+			self.expiresAt = expiresAt
+		return True
+
+
+	def getToken(self):
+		with self.cond:
+			token = self.token
+			expiresAt = self.expiresAt
+			now = self.clock()
+
+			refreshAhead = ( token != None and expiresAt != None and not self.refreshing and expiresAt - self.refreshAhead <= now < expiresAt )
+			if( refreshAhead ):
+				# claim the renewal before the thread starts so no one else starts one too
+				self.refreshing = True
+
+		if( refreshAhead ):
+			t = threading.Thread( target=self._renew, name="BouncieTokenRefresh" )
+			t.daemon = True
+			t.start()
+			return token
+
+		if( token == None or ( expiresAt != None and now >= expiresAt ) ):
+			self._refresh()
+			with self.cond:
+				return self.token
+
+		return token
+
+
+	def invalidate(self, staleToken):
+		# a request using staleToken was rejected. renew, unless another caller already has
+		with self.cond:
+			if( self.token != staleToken and not self.refreshing ):
+				return
+		self._refresh()
+
+
+	def _refresh(self):
+		with self.cond:
+			if( self.refreshing ):
+				# single flight: wait for the renewal in progress
+				while self.refreshing:
+					self.cond.wait( 30 )
+				return
+			self.refreshing = True
+
+		self._renew()
+
+
+	def _renew(self):
+		# caller has set self.refreshing
+		try:
+			self.logger.debug( u"renewing access token" )
+			self.renewals += 1
+			if( not self.renewFn() ):
+				self.renewalFailures += 1
+		except Exception, e:
+			self.renewalFailures += 1
+			self.logger.error( u"access token renewal failed: %s" % e )
+		finally:
+			with self.cond:
+				self.refreshing = False
+				self.cond.notify_all()
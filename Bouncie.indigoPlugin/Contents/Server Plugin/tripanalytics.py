@@ -0,0 +1,195 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Trip analytics over stored GPS points.
+#
+# A trip is given as parallel columns: timestamps (epoch milliseconds), latitude,
+# longitude and the reported speed (mph, None where missing). Each metric is a
+# single pass over the arrays between consecutive samples ("intervals"). NumPy is
+# used when it is installed; otherwise the same calculations run as plain loops,
+# which give the same answers, only slower.
+
+import math
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+from geo import EARTH_RADIUS_MILES
+
+
+# at or below this speed (mph) the vehicle counts as idling
+IDLE_SPEED = 2.0
+# change in speed (mph per second) that counts as a hard acceleration or braking event
+HARD_ACCELERATION = 8.0
+HARD_BRAKING = 8.0
+# speed changes across a longer gap between samples (seconds) aren't events
+MAX_RATE_INTERVAL = 5.0
+# upper edges (mph) of the speed bands; the last band is open-ended
+SPEED_BANDS = ( 25, 45, 65 )
+# a gap between samples longer than this (seconds) separates two trips
+TRIP_GAP = 600
+
+
+def speedBandLabels(edges=SPEED_BANDS):
+	labels = []
+	lower = 0
+	for edge in edges:
+		labels.append( "%d-%d" % ( lower, edge ) )
+		lower = edge
+	labels.append( "%d+" % lower )
+	return labels
+
+
+def splitTrips(ts, gap=TRIP_GAP):
+	# ( start, end ) slice bounds of each run of samples with no gap over gap seconds
+	if( len( ts ) == 0 ):
+		return []
+	gapMillis = gap * 1000
+	if( numpy != None ):
+		breaks = ( numpy.flatnonzero( numpy.diff( numpy.asarray( ts, dtype=numpy.int64 ) ) > gapMillis ) + 1 ).tolist()
+	else:
+		breaks = [ i for i in range( 1, len( ts ) ) if ts[ i ] - ts[ i - 1 ] > gapMillis ]
+	bounds = [ 0 ] + breaks + [ len( ts ) ]
+	return list( zip( bounds[:-1], bounds[1:] ) )
+
+
+def analyzeTrip(ts, lat, lon, speed=None, edges=SPEED_BANDS):
+	# returns a dict of metrics; times are in seconds, distance in miles, speeds in mph
+	if( len( ts ) == 0 ):
+		return None
+	if( speed == None ):
+		speed = [ None ] * len( ts )
+
+	if( numpy != None ):
+		result = _analyzeArrays( ts, lat, lon, speed, edges )
+	else:
+		result = _analyzeLists( ts, lat, lon, speed, edges )
+
+	result[ "points" ] = len( ts )
+	result[ "startTime" ] = ts[0]
+	result[ "endTime" ] = ts[-1]
+	result[ "duration" ] = ( ts[-1] - ts[0] ) / 1000.0
+	if( result[ "movingTime" ] > 0 ):
+		result[ "averageSpeed" ] = result[ "distance" ] / ( result[ "movingTime" ] / 3600.0 )
+	else:
+		result[ "averageSpeed" ] = 0.0
+	result[ "speedBands" ] = list( zip( speedBandLabels( edges ), result[ "speedBands" ] ) )
+	return result
+
+
+def _countEvents(flags):
+	# runs of consecutive flagged intervals count as one event
+	count = 0
+	previous = False
+	for flag in flags:
+		if( flag and not previous ):
+			count += 1
+		previous = flag
+	return count
+
+
+def _analyzeArrays(ts, lat, lon, speed, edges):
+	t = numpy.asarray( ts, dtype=float ) / 1000.0
+	lat = numpy.radians( numpy.asarray( lat, dtype=float ) )
+	lon = numpy.radians( numpy.asarray( lon, dtype=float ) )
+	# None becomes NaN
+	speed = numpy.array( speed, dtype=float )
+
+	dt = numpy.diff( t )
+
+	# haversine for every interval at once
+	a = numpy.sin( numpy.diff( lat ) / 2 ) ** 2 + numpy.cos( lat[:-1] ) * numpy.cos( lat[1:] ) * numpy.sin( numpy.diff( lon ) / 2 ) ** 2
+	segment = 2 * EARTH_RADIUS_MILES * numpy.arcsin( numpy.sqrt( numpy.minimum( a, 1.0 ) ) )
+
+	# interval speed: mean of the reported speeds at each end, or distance over time
+	with numpy.errstate( divide="ignore", invalid="ignore" ):
+		derived = numpy.where( dt > 0, segment / dt * 3600.0, 0.0 )
+		rate = numpy.diff( speed ) / dt
+	intervalSpeed = ( speed[:-1] + speed[1:] ) / 2
+	missing = numpy.isnan( intervalSpeed )
+	intervalSpeed[ missing ] = derived[ missing ]
+
+	moving = intervalSpeed > IDLE_SPEED
+	movingTime = float( dt[ moving ].sum() )
+	idleTime = float( dt[ ~moving ].sum() )
+
+	reported = speed[ ~numpy.isnan( speed ) ]
+	if( len( reported ) > 0 ):
+		maxSpeed = float( reported.max() )
+	elif( len( derived ) > 0 ):
+		maxSpeed = float( derived.max() )
+	else:
+		maxSpeed = 0.0
+
+	valid = ( dt > 0 ) & ( dt <= MAX_RATE_INTERVAL ) & ~numpy.isnan( rate )
+	with numpy.errstate( invalid="ignore" ):
+		accelerating = valid & ( rate >= HARD_ACCELERATION )
+		braking = valid & ( rate <= -HARD_BRAKING )
+
+	band = numpy.searchsorted( numpy.asarray( edges, dtype=float ), intervalSpeed, side="right" )
+	bandTimes = numpy.bincount( band, weights=dt, minlength=len( edges ) + 1 )
+
+	return {
+		"distance": float( segment.sum() ),
+		"movingTime": movingTime,
+		"idleTime": idleTime,
+		"maxSpeed": maxSpeed,
+		"hardAccelerations": int( numpy.count_nonzero( accelerating[1:] & ~accelerating[:-1] ) + ( 1 if len( accelerating ) and accelerating[0] else 0 ) ),
+		"hardBrakes": int( numpy.count_nonzero( braking[1:] & ~braking[:-1] ) + ( 1 if len( braking ) and braking[0] else 0 ) ),
+		"speedBands": [ float( x ) for x in bandTimes ],
+	}
+
+
+def _analyzeLists(ts, lat, lon, speed, edges):
+	distance = 0.0
+	movingTime = 0.0
+	idleTime = 0.0
+	maxDerived = 0.0
+	accelerating = []
+	braking = []
+	bandTimes = [ 0.0 ] * ( len( edges ) + 1 )
+
+	for i in range( len( ts ) - 1 ):
+		dt = ( ts[ i + 1 ] - ts[ i ] ) / 1000.0
+		lat1 = math.radians( lat[ i ] )
+		lat2 = math.radians( lat[ i + 1 ] )
+		a = math.sin( ( lat2 - lat1 ) / 2 ) ** 2 + math.cos( lat1 ) * math.cos( lat2 ) * math.sin( math.radians( lon[ i + 1 ] - lon[ i ] ) / 2 ) ** 2
+		segment = 2 * EARTH_RADIUS_MILES * math.asin( math.sqrt( min( a, 1.0 ) ) )
+		distance += segment
+
+		derived = segment / dt * 3600.0 if dt > 0 else 0.0
+		maxDerived = max( maxDerived, derived )
+		if( speed[ i ] != None and speed[ i + 1 ] != None ):
+			intervalSpeed = ( speed[ i ] + speed[ i + 1 ] ) / 2.0
+			rate = ( speed[ i + 1 ] - speed[ i ] ) / dt if dt > 0 else None
+		else:
+			intervalSpeed = derived
+			rate = None
+
+		if( intervalSpeed > IDLE_SPEED ):
+			movingTime += dt
+		else:
+			idleTime += dt
+
+		valid = rate != None and 0 < dt <= MAX_RATE_INTERVAL
+		accelerating.append( valid and rate >= HARD_ACCELERATION )
+		braking.append( valid and rate <= -HARD_BRAKING )
+
+		band = 0
+		while band < len( edges ) and intervalSpeed >= edges[ band ]:
+			band += 1
+		bandTimes[ band ] += dt
+
+	reported = [ s for s in speed if s != None ]
+	return {
+		"distance": distance,
+		"movingTime": movingTime,
+		"idleTime": idleTime,
+		"maxSpeed": float( max( reported ) ) if len( reported ) > 0 else maxDerived,
+		"hardAccelerations": _countEvents( accelerating ),
+		"hardBrakes": _countEvents( braking ),
+		"speedBands": bandTimes,
+	}
@@ -0,0 +1,181 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Local SQLite store for trip history.
+#
+# Trips are upserted by transactionId (imei and startTime for a trip without one),
+# so re-fetching an overlapping time window is harmless. sync_state keeps, per imei,
+# the end time of the newest synced trip (the high-water mark) and how far the API
+# has been scanned, so each sync only asks for trips newer than what is already
+# stored.
+
+import datetime
+import json
+import sqlite3
+import threading
+
+from polyline import decodeTripGps
+
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.000Z"
+
+TRIP_COLUMNS = (
+	"transactionId", "imei", "startTime", "endTime", "distance", "averageSpeed", "maxSpeed",
+	"hardBrakingCount", "hardAccelerationCount", "totalIdleDuration", "fuelConsumed",
+	"startOdometer", "endOdometer", "timeZone",
+)
+
+
+def parseTime(value):
+	# Bouncie timestamps, with or without milliseconds
+	if( '.' in value ):
+		return datetime.datetime.strptime( value, '%Y-%m-%dT%H:%M:%S.%fZ' )
+	return datetime.datetime.strptime( value, '%Y-%m-%dT%H:%M:%SZ' )
+
+
+def formatTime(value):
+	return value.strftime( TIME_FORMAT )
+
+
+def tripKey(imei, trip):
+	# the trip's transactionId, else one made from imei and startTime; None if it has neither
+	transactionId = trip.get( "transactionId" )
+	if( transactionId != None ):
+		return transactionId
+	if( trip.get( "startTime" ) == None ):
+		return None
+	return "%s/%s" % ( imei, trip[ "startTime" ] )
+
+
+class TripStore(object):
+
+	def __init__(self, path):
+		self.path = path
+		self.lock = threading.Lock()
+		self.conn = sqlite3.connect( path, check_same_thread=False )
+		self.conn.execute( "PRAGMA journal_mode=WAL" )
+		self.conn.execute( "PRAGMA synchronous=NORMAL" )
+		self._createSchema()
+
+
+	def _createSchema(self):
+		with self.lock:
+			self.conn.executescript( """
+				CREATE TABLE IF NOT EXISTS trips (
+					transactionId TEXT NOT NULL PRIMARY KEY,
+					imei TEXT NOT NULL,
+					startTime TEXT,
+					endTime TEXT,
+					distance REAL,
+					averageSpeed REAL,
+					maxSpeed REAL,
+					hardBrakingCount INTEGER,
+					hardAccelerationCount INTEGER,
+					totalIdleDuration REAL,
+					fuelConsumed REAL,
+					startOdometer REAL,
+					endOdometer REAL,
+					timeZone TEXT,
+					gpsFormat TEXT,
+					gps TEXT,
+					json TEXT
+				);
+				CREATE INDEX IF NOT EXISTS trips_imei_startTime ON trips ( imei, startTime );
+				CREATE TABLE IF NOT EXISTS sync_state (
+					imei TEXT PRIMARY KEY,
+					lastTripEnd TEXT,
+					scannedUntil TEXT
+				);
+			""" )
+			# stores made before transactionId was NOT NULL can hold a copy of a trip
+			# without one for every sync; keep one under its fallback key
+			self.conn.execute( "UPDATE OR IGNORE trips SET transactionId = imei || '/' || startTime WHERE transactionId IS NULL AND startTime IS NOT NULL" )
+			self.conn.execute( "DELETE FROM trips WHERE transactionId IS NULL" )
+			self.conn.commit()
+
+
+	def upsertTrips(self, imei, trips, gpsFormat):
+		# returns the newest endTime of the trips stored, or None. a trip with neither
+		# a transactionId nor a startTime can't be told apart from a re-fetch, so it is skipped
+		rows = []
+		newestEnd = None
+		for trip in trips:
+			row = [ trip.get( column ) for column in TRIP_COLUMNS ]
+			row[1] = trip.get( "imei", imei )
+			row[0] = tripKey( row[1], trip )
+			if( row[0] == None ):
+				continue
+			gps = trip.get( "gps" )
+			if( gps != None and not isinstance( gps, basestring ) ):
+				gps = json.dumps( gps )
+			# the gps track is stored once, in its own column
+			details = dict( ( k, v ) for k, v in trip.items() if k != "gps" )
+			rows.append( row + [ gpsFormat, gps, json.dumps( details ) ] )
+
+			endTime = trip.get( "endTime" )
+			if( endTime != None and ( newestEnd == None or endTime > newestEnd ) ):
+				newestEnd = endTime
+
+		if( len( rows ) == 0 ):
+			return None
+
+		sql = "INSERT OR REPLACE INTO trips ( %s, gpsFormat, gps, json ) VALUES ( %s )" % ( ", ".join( TRIP_COLUMNS ), ", ".join( [ "?" ] * ( len( TRIP_COLUMNS ) + 3 ) ) )
+		with self.lock:
+			with self.conn:
+				self.conn.executemany( sql, rows )
+		return newestEnd
+
+
+	def getSyncState(self, imei):
+		# ( lastTripEnd, scannedUntil ), either may be None
+		with self.lock:
+			row = self.conn.execute( "SELECT lastTripEnd, scannedUntil FROM sync_state WHERE imei = ?", ( imei, ) ).fetchone()
+		if( row == None ):
+			return ( None, None )
+		return ( row[0], row[1] )
+
+
+	def setSyncState(self, imei, lastTripEnd, scannedUntil):
+		with self.lock:
+			with self.conn:
+				self.conn.execute( "INSERT OR REPLACE INTO sync_state ( imei, lastTripEnd, scannedUntil ) VALUES ( ?, ?, ? )", ( imei, lastTripEnd, scannedUntil ) )
+
+
+	def getTrips(self, imei, startTime=None, endTime=None):
+		# trips for imei that started in [ startTime, endTime ), oldest first. gps is
+		# decoded to an array of interleaved lat, lon whether it was stored as
+		# polyline or GeoJSON
+		sql = "SELECT json, gpsFormat, gps FROM trips WHERE imei = ?"
+		params = [ imei ]
+		if( startTime != None ):
+			sql += " AND startTime >= ?"
+			params.append( startTime )
+		if( endTime != None ):
+			sql += " AND startTime < ?"
+			params.append( endTime )
+		sql += " ORDER BY startTime"
+
+		with self.lock:
+			rows = self.conn.execute( sql, params ).fetchall()
+
+		trips = []
+		for details, gpsFormat, gps in rows:
+			trip = json.loads( details )
+			if( gps != None and gpsFormat != "polyline" ):
+				gps = json.loads( gps )
+			trip[ "gps" ] = decodeTripGps( gps, gpsFormat )
+			trips.append( trip )
+		return trips
+
+
+	def countTrips(self, imei=None):
+		with self.lock:
+			if( imei == None ):
+				return self.conn.execute( "SELECT COUNT(*) FROM trips" ).fetchone()[0]
+			return self.conn.execute( "SELECT COUNT(*) FROM trips WHERE imei = ?", ( imei, ) ).fetchone()[0]
+
+
+	def close(self):
+		with self.lock:
+			self.conn.close()
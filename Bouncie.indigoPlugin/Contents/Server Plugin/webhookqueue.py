@@ -0,0 +1,197 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Bounded webhook ingestion queue.
+#
+# The HTTPd 2 broadcast callback only puts the raw hookJson on the queue; a worker
+# thread parses and processes it. Whatever is waiting when the worker wakes up is
+# handled as one batch, and consecutive tripData events for the same imei in that
+# batch are coalesced into a single group so only the newest position gets written.
+# Bouncie retries deliveries, so replays are dropped against a dedup cache before
+# anything else happens to them.
+
+import json
+import threading
+import time
+
+try:
+	import Queue as queue
+except ImportError:
+	import queue
+
+
+class WebhookQueue(object):
+
+	def __init__(self, processFn, logger, maxSize=5000, batchSize=50, dedupCache=None, metrics=None):
+		self.processFn = processFn
+		self.logger = logger
+		self.dedupCache = dedupCache
+		self.metrics = metrics
+		self.queue = queue.Queue( maxSize )
+		self.batchSize = batchSize
+		self.thread = None
+
+		self.received = 0
+		self.dropped = 0
+		self.processed = 0
+		self.coalesced = 0
+		self.duplicates = 0
+		self.errors = 0
+		self.maxDepth = 0
+
+
+	def start(self):
+		self.thread = threading.Thread( target=self._run, name="BouncieWebhookQueue" )
+		self.thread.daemon = True
+		self.thread.start()
+
+
+	def stop(self):
+		if( self.thread == None ):
+			return
+		# the stop sentinel has to get in even if the queue is full
+		while True:
+			try:
+				self.queue.put( None, True, 1.0 )
+				break
+			except queue.Full:
+				try:
+					self.queue.get_nowait()
+					self.dropped += 1
+				except queue.Empty:
+					pass
+		self.thread.join( 5.0 )
+		self.thread = None
+
+
+	def put(self, hookJson):
+		# called on the broadcast thread, so never block it
+		self.received += 1
+		try:
+			self.queue.put_nowait( ( time.time(), hookJson ) )
+		except queue.Full:
+			self.dropped += 1
+			return False
+		self.maxDepth = max( self.maxDepth, self.queue.qsize() )
+		return True
+
+
+	def depth(self):
+		return self.queue.qsize()
+
+
+	def stats(self):
+		return {
+			"depth": self.depth(),
+			"maxDepth": self.maxDepth,
+			"received": self.received,
+			"dropped": self.dropped,
+			"processed": self.processed,
+			"coalesced": self.coalesced,
+			"duplicates": self.duplicates,
+			"errors": self.errors,
+		}
+
+
+	def _run(self):
+		while True:
+			item = self.queue.get()
+			if( item == None ):
+				return
+
+			batch = [ item ]
+			stopping = False
+			while len( batch ) < self.batchSize:
+				try:
+					item = self.queue.get_nowait()
+				except queue.Empty:
+					break
+				if( item == None ):
+					stopping = True
+					break
+				batch.append( item )
+
+			self._processBatch( batch )
+
+			if( stopping ):
+				return
+
+
+	def _processBatch(self, batch):
+		events = []
+		for receivedTime, hookJson in batch:
+			try:
+				hookData = json.loads( hookJson )
+				payload = json.loads( hookData[ "payload" ] )
+			except Exception, e:
+				self.errors += 1
+				self.logger.error( u"unable to parse webhook: %s" % e )
+				continue
+
+			if( self.dedupCache != None ):
+				key = dedupKey( payload )
+				if( key != None and self.dedupCache.seen( key ) ):
+					self.duplicates += 1
+					self.logger.debug( u"dropped duplicate webhook %s" % ( key, ) )
+					continue
+
+			events.append( { "received": receivedTime, "hookData": hookData, "payload": payload } )
+
+		for group in coalesceTripData( events ):
+			self.coalesced += len( group ) - 1
+			try:
+				self.processFn( group )
+			except Exception, e:
+				self.errors += 1
+				self.logger.exception( u"error processing webhook: %s" % e )
+			self.processed += len( group )
+
+			if( self.metrics != None ):
+				# end to end, from the broadcast callback to done processing
+				done = time.time()
+				for event in group:
+					self.metrics.observe( "webhook.%s" % event[ "payload" ].get( "eventType" ), done - event[ "received" ] )
+
+
+def dedupKey(payload):
+	# ( imei, eventType, transactionId, timestamp ), or None if the payload has
+	# neither a transactionId nor an event timestamp to tell deliveries apart
+	transactionId = payload.get( "transactionId" )
+
+	timestamp = None
+	data = payload.get( "data" )
+	if( isinstance( data, list ) and len( data ) > 0 and isinstance( data[0], dict ) ):
+		timestamp = data[0].get( "timestamp" )
+	else:
+		# connect, battery, tripStart etc. carry their details in a nested object
+		for value in payload.values():
+			if( isinstance( value, dict ) and "timestamp" in value ):
+				timestamp = value[ "timestamp" ]
+				break
+
+	if( transactionId == None and timestamp == None ):
+		return None
+	return ( payload.get( "imei" ), payload.get( "eventType" ), transactionId, timestamp )
+
+
+def coalesceTripData(events):
+	# returns a list of groups in arrival order. a group is a single event, or a run
+	# of tripData events for one imei with no other event for that imei in between
+	# (newest last). events for other imeis may be interleaved with the run.
+	groups = []
+	lastGroupByImei = {}
+	for event in events:
+		payload = event[ "payload" ]
+		imei = payload.get( "imei" )
+		eventType = payload.get( "eventType" )
+
+		group = lastGroupByImei.get( imei )
+		if( eventType == "tripData" and group != None and group[-1][ "payload" ].get( "eventType" ) == "tripData" ):
+			group.append( event )
+			continue
+
+		group = [ event ]
+		groups.append( group )
+		lastGroupByImei[ imei ] = group
+	return groups
@@ -0,0 +1,68 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Recording of incoming webhook envelopes, for replaying production traffic offline
+# (see benchmarks/webhook_replay.py).
+#
+# A recording is a gzip-compressed file of JSON lines, one per webhook:
+#
+#   [ receivedTime, hookJson ]
+#
+# where hookJson is the HTTPd 2 envelope exactly as the broadcast delivered it.
+
+import gzip
+import json
+import threading
+import time
+
+
+class WebhookRecorder(object):
+
+	def __init__(self, path):
+		self.path = path
+		self.lock = threading.Lock()
+		self.file = gzip.open( path, "wb" )
+		self.recorded = 0
+
+
+	def record(self, hookJson, receivedTime=None):
+		if( receivedTime == None ):
+			receivedTime = time.time()
+		line = json.dumps( [ receivedTime, hookJson ], separators=( ",", ":" ) ) + "\n"
+		with self.lock:
+			if( self.file == None ):
+				return
+			self.file.write( line.encode( "utf-8" ) )
+			self.recorded += 1
+
+
+	def close(self):
+		with self.lock:
+			if( self.file != None ):
+				self.file.close()
+				self.file = None
+
+
+def readRecording(path):
+	# yields ( receivedTime, hookJson ) in file order
+	f = gzip.open( path, "rb" )
+	try:
+		for line in f:
+			line = line.strip()
+			if( line ):
+				receivedTime, hookJson = json.loads( line.decode( "utf-8" ) )
+				yield receivedTime, hookJson
+	finally:
+		f.close()
+
+
+def writeRecording(path, records):
+	# records is an iterable of ( receivedTime, hookJson ); returns how many were written
+	recorder = WebhookRecorder( path )
+	try:
+		for receivedTime, hookJson in records:
+			recorder.record( hookJson, receivedTime )
+	finally:
+		recorder.close()
+	return recorder.recorded
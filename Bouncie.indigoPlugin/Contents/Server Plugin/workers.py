@@ -0,0 +1,107 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Bounded worker pool used by the polling loop.
+#
+# Jobs are submitted with a key (the Indigo device id). A key can only have one
+# job queued or running at a time, so a vehicle whose request is still in flight
+# when the next cycle starts is carried over rather than requested twice.
+# Results come back on a queue in completion order so the caller can apply them
+# as they arrive.
+
+import threading
+
+try:
+	import Queue as queue
+except ImportError:
+	import queue
+
+
+class WorkerPool(object):
+
+	def __init__(self, size, name="BouncieWorker"):
+		self.size = max( 1, int( size ) )
+		self.tasks = queue.Queue()
+		self.results = queue.Queue()
+		self.inFlight = set()
+		self.lock = threading.Lock()
+		self.threads = []
+
+		for i in range( self.size ):
+			t = threading.Thread( target=self._run, name="%s-%d" % ( name, i ) )
+			t.daemon = True
+			t.start()
+			self.threads.append( t )
+
+
+	def _run(self):
+		while True:
+			task = self.tasks.get()
+			if( task == None ):
+				return
+
+			key, fn, args = task
+			result = None
+			error = None
+			try:
+				result = fn( *args )
+			except Exception, e:
+				error = e
+
+			with self.lock:
+				self.inFlight.discard( key )
+			self.results.put( ( key, result, error ) )
+
+
+	def submit(self, key, fn, *args):
+		# returns False if the key already has a job queued or running
+		with self.lock:
+			if( key in self.inFlight ):
+				return False
+			self.inFlight.add( key )
+		self.tasks.put( ( key, fn, args ) )
+		return True
+
+
+	def pending(self):
+		with self.lock:
+			return len( self.inFlight )
+
+
+	def getResult(self, timeout=None):
+		# raises queue.Empty if nothing completes within timeout
+		return self.results.get( True, timeout )
+
+
+	def getReadyResults(self):
+		ready = []
+		while True:
+			try:
+				ready.append( self.results.get_nowait() )
+			except queue.Empty:
+				return ready
+
+
+	def cancelPending(self):
+		# drop jobs that have not started yet; jobs already running are left to finish
+		cancelled = []
+		while True:
+			try:
+				task = self.tasks.get_nowait()
+			except queue.Empty:
+				break
+			if( task == None ):
+				# keep the stop sentinel for the workers
+				self.tasks.put( task )
+				break
+			with self.lock:
+				self.inFlight.discard( task[0] )
+			cancelled.append( task[0] )
+		return cancelled
+
+
+	def stop(self):
+		self.cancelPending()
+		for t in self.threads:
+			self.tasks.put( None )
@@ -0,0 +1,268 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# A stand-in for the "indigo" module Indigo injects into plugins, with just enough
+# of the API for plugin.py to run outside Indigo: devices and their states,
+# triggers, variables, plugin prefs, logging and broadcast subscriptions.
+#
+# Everything the plugin sends to the "server" is counted in stats, so benchmarks
+# can report state writes and trigger executions.
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+
+stats = {
+	"updateStatesOnServer": 0,
+	"statesWritten": 0,
+	"triggerExecutions": 0,
+}
+_statsLock = threading.Lock()
+
+
+def resetStats():
+	with _statsLock:
+		for key in stats:
+			stats[ key ] = 0
+
+
+def _count(key, n=1):
+	with _statsLock:
+		stats[ key ] += n
+
+
+class Dict(dict):
+	pass
+
+
+class List(list):
+	pass
+
+
+class _Enum(object):
+	def __init__(self, *names):
+		for value, name in enumerate( names ):
+			setattr( self, name, value )
+
+
+kSensorAction = _Enum( "TurnOn", "TurnOff", "Toggle", "RequestStatus" )
+kUniversalAction = _Enum( "Beep", "RequestStatus", "EnergyUpdate", "EnergyReset" )
+
+
+########################################
+# Devices, triggers and variables
+########################################
+class Device(object):
+
+	def __init__(self, id, name, pluginProps, deviceTypeId="myBouncieCustomType"):
+		self.id = id
+		self.name = name
+		self.deviceTypeId = deviceTypeId
+		self.pluginProps = Dict( pluginProps )
+		self.states = Dict()
+		self.enabled = True
+		self.configured = True
+		self.subModel = ""
+		self.lock = threading.Lock()
+
+
+	def updateStatesOnServer(self, keyValueList):
+		with self.lock:
+			for item in keyValueList:
+				self.states[ item[ "key" ] ] = item[ "value" ]
+		_count( "updateStatesOnServer" )
+		_count( "statesWritten", len( keyValueList ) )
+
+
+	def updateStateOnServer(self, key, value, **kwargs):
+		self.updateStatesOnServer( [ { "key": key, "value": value } ] )
+
+
+	def replaceOnServer(self):
+		pass
+
+
+class _DeviceList(dict):
+
+	def iter(self, filter=""):
+		return iter( list( self.values() ) )
+
+
+class Trigger(object):
+
+	def __init__(self, id, name, pluginTypeId, pluginProps):
+		self.id = id
+		self.name = name
+		self.pluginTypeId = pluginTypeId
+		self.pluginProps = Dict( pluginProps )
+
+
+class _TriggerCommands(object):
+
+	def execute(self, trigger):
+		_count( "triggerExecutions" )
+
+
+class Variable(object):
+
+	def __init__(self, name, value):
+		self.name = name
+		self.value = value
+
+
+class _VariableCommands(object):
+
+	def create(self, name, value="", folder=0):
+		variables[ name ] = Variable( name, value )
+		return variables[ name ]
+
+
+	def updateValue(self, name, value=""):
+		variables[ name ].value = value
+
+
+devices = _DeviceList()
+triggers = _DeviceList()
+variables = {}
+trigger = _TriggerCommands()
+variable = _VariableCommands()
+
+
+########################################
+# Server
+########################################
+class _PluginInfo(object):
+
+	def __init__(self, pluginId, enabled=True):
+		self.pluginId = pluginId
+		self.enabled = enabled
+
+
+	def isEnabled(self):
+		return self.enabled
+
+
+class _Server(object):
+
+	def __init__(self):
+		self.installFolder = tempfile.mkdtemp( prefix="fakeindigo-" )
+		self.plugins = {}
+		# ( pluginId, messageType ) -> [ ( plugin, callbackName ) ]
+		self.subscriptions = {}
+		self.currentPlugin = None
+		self.logger = logging.getLogger( "Indigo" )
+
+
+	def log(self, message, type=None, isError=False, level=logging.INFO):
+		self.logger.log( logging.ERROR if isError else level, message )
+
+
+	def getInstallFolderPath(self):
+		return self.installFolder
+
+
+	def getLogsFolderPath(self, pluginId=None):
+		path = os.path.join( self.installFolder, "Logs" )
+		if( pluginId != None ):
+			path = os.path.join( path, pluginId )
+		if( not os.path.exists( path ) ):
+			os.makedirs( path )
+		return path
+
+
+	def getPlugin(self, pluginId):
+		info = self.plugins.get( pluginId )
+		if( info == None ):
+			# pretend every plugin asked about (e.g. HTTPd 2) is installed and enabled
+			info = _PluginInfo( pluginId )
+			self.plugins[ pluginId ] = info
+		return info
+
+
+	def subscribeToBroadcast(self, pluginId, messageType, callbackName):
+		subscribers = self.subscriptions.setdefault( ( pluginId, messageType ), [] )
+		if( ( self.currentPlugin, callbackName ) not in subscribers ):
+			subscribers.append( ( self.currentPlugin, callbackName ) )
+
+
+	def broadcast(self, pluginId, messageType, payload):
+		# what another plugin's broadcastToSubscribers would deliver
+		for plugin, callbackName in self.subscriptions.get( ( pluginId, messageType ), [] ):
+			getattr( plugin, callbackName )( payload )
+
+
+	def cleanup(self):
+		shutil.rmtree( self.installFolder, ignore_errors=True )
+
+
+server = _Server()
+
+
+########################################
+# PluginBase
+########################################
+class PluginBase(object):
+
+	class StopThread(Exception):
+		pass
+
+
+	def __init__(self, pluginId, pluginDisplayName, pluginVersion, pluginPrefs):
+		self.pluginId = pluginId
+		self.pluginDisplayName = pluginDisplayName
+		self.pluginVersion = pluginVersion
+		self.pluginPrefs = Dict( pluginPrefs )
+		self.stopThread = False
+
+		self.indigo_log_handler = logging.StreamHandler()
+		self.indigo_log_handler.setFormatter( logging.Formatter( "%(asctime)s %(name)s %(levelname)s %(message)s" ) )
+		pluginLogger = logging.getLogger( "Plugin" )
+		pluginLogger.addHandler( self.indigo_log_handler )
+		pluginLogger.setLevel( logging.DEBUG )
+		# like Indigo, plugin messages only go through indigo_log_handler
+		pluginLogger.propagate = False
+		self.logger = pluginLogger
+
+		# broadcast subscriptions made from now on belong to this plugin
+		server.currentPlugin = self
+
+
+	# the no-op defaults Indigo provides
+
+	def startup(self):
+		pass
+
+
+	def shutdown(self):
+		pass
+
+
+	def deviceStartComm(self, dev):
+		pass
+
+
+	def deviceStopComm(self, dev):
+		pass
+
+
+	def triggerStartProcessing(self, trigger):
+		pass
+
+
+	def triggerStopProcessing(self, trigger):
+		pass
+
+
+	def sleep(self, seconds):
+		if( self.stopThread ):
+			raise self.StopThread()
+		time.sleep( seconds )
+
+
+	def stopConcurrentThread(self):
+		self.stopThread = True
@@ -0,0 +1,328 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Offline benchmarks for the Bouncie plugin.
+#
+# Runs plugin.py under benchmarks/fakeindigo against local stand-ins for the Bouncie
+# API, Bouncie auth and Google Maps (see standins.py), and reports:
+#
+#   - poll-cycle latency and API calls per cycle, for fleet and per-vehicle polling
+#   - webhook throughput and state writes per webhook
+#   - a first trip history sync for one vehicle
+#   - access token renewal, and a poll that has to renew an expired token
+#
+# The plugin is Python 2, so run this with the same interpreter Indigo uses, with
+# requests installed:
+#
+#   python2 benchmarks/run_benchmarks.py --vehicles 25 --latency-ms 50 --error-rate 0.02
+#
+# --json writes the results to a file, to compare runs for regressions.
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+HERE = os.path.dirname( os.path.abspath( __file__ ) )
+sys.path.insert( 0, os.path.join( HERE, "fakeindigo" ) )
+sys.path.insert( 0, os.path.join( HERE, "..", "Bouncie.indigoPlugin", "Contents", "Server Plugin" ) )
+sys.path.insert( 0, HERE )
+
+import indigo
+import standins
+import webhooktraffic
+
+
+PLUGIN_ID = "com.joyunspeakable.indigoplugin.bouncie"
+HTTPD_PLUGIN_ID = "com.flyingdiver.indigoplugin.httpd2"
+WEBHOOK_MESSAGE = "httpd_bouncie-webhook"
+EVENT_TYPES = ( "connect", "disconnect", "battery", "mil", "tripStart", "tripData", "tripMetrics", "tripEnd" )
+POLLED_ENDPOINTS = ( "vehicles", "trips", "oauth" )
+GOOGLE_ENDPOINTS = ( "geocode", "distancematrix" )
+
+
+def percentile(values, p):
+	if( len( values ) == 0 ):
+		return 0.0
+	values = sorted( values )
+	index = min( len( values ) - 1, int( round( p / 100.0 * ( len( values ) - 1 ) ) ) )
+	return values[ index ]
+
+
+########################################
+# Setup
+########################################
+def createPlugin(args, server, imeis):
+	import plugin
+
+	prefs = {
+		"logLevel": str( logging.DEBUG if args.verbose else logging.WARNING ),
+		"pollingIntervalVehicleData": 60,
+		"useFleetPolling": True,
+		"pollingConcurrency": args.concurrency,
+		"pollingCycleDeadline": 30,
+		"httpTimeout": 5,
+		# room for the Google requests made while polling
+		"httpPoolSize": args.concurrency + 2,
+		"useWebhooks": True,
+		"webhookQueueSize": args.queue_size,
+		"googleMapsAPIKey": "standin",
+		"homeAddress": "1 Home St",
+		"distanceMatrixMinInterval": 0,
+		"storeGpsPoints": not args.no_gps_store,
+		"accessTokenJson": json.dumps( { "access_token": "standin", "expires_in": 3600 } ),
+		"accessTokenObtained": str( time.time() ),
+		"clientId": "standin",
+		"clientSecret": "standin",
+		"code": "standin",
+	}
+
+	# point every base URL at the stand-in server before anything is requested
+	plugin.Plugin.bouncieAPIBaseUrl = server.baseUrl + "/v1/"
+	plugin.Plugin.bouncieAuthBaseUrl = server.baseUrl
+	plugin.Plugin.googleMapsAPIBaseUrl = server.baseUrl + "/maps/api/"
+
+	p = plugin.Plugin( PLUGIN_ID, "Bouncie", "benchmark", prefs )
+	p.startup()
+
+	devList = []
+	for i, imei in enumerate( imeis ):
+		dev = indigo.Device( 1000 + i, "Vehicle %d" % i, { "vehicle": imei } )
+		indigo.devices[ dev.id ] = dev
+		p.deviceStartComm( dev )
+		devList.append( dev )
+
+	# one "any vehicle" trigger per event type, like a typical install
+	for i, eventType in enumerate( EVENT_TYPES + ( "approaching_home", ) ):
+		props = { "vehicle": p.anyVehicle }
+		if( eventType == "approaching_home" ):
+			props[ "milesToHome" ] = 5
+		trigger = indigo.Trigger( 5000 + i, eventType, eventType, props )
+		indigo.triggers[ trigger.id ] = trigger
+		p.triggerStartProcessing( trigger )
+
+	return p, devList
+
+
+########################################
+# Polling
+########################################
+def benchmarkPolling(p, devList, server, cycles, fleet):
+	latencies = []
+	apiCalls = []
+	googleCalls = []
+	updates = []
+	written = []
+
+	for cycle in range( cycles ):
+		server.resetCounts()
+		indigo.resetStats()
+
+		started = time.time()
+		if( fleet ):
+			p._pollFleet( devList )
+		else:
+			p._pollDevices( devList )
+		latencies.append( time.time() - started )
+
+		counts = server.resetCounts()
+		apiCalls.append( sum( counts.get( name, 0 ) for name in POLLED_ENDPOINTS ) )
+		googleCalls.append( sum( counts.get( name, 0 ) for name in GOOGLE_ENDPOINTS ) )
+		updates.append( indigo.stats[ "updateStatesOnServer" ] )
+		written.append( indigo.stats[ "statesWritten" ] )
+
+	return {
+		"mode": "fleet" if fleet else "per-vehicle",
+		"cycles": cycles,
+		"latencyP50": percentile( latencies, 50 ),
+		"latencyP95": percentile( latencies, 95 ),
+		"latencyMax": max( latencies ),
+		"apiCallsPerCycle": sum( apiCalls ) / float( cycles ),
+		"googleCallsPerCycle": sum( googleCalls ) / float( cycles ),
+		"stateUpdatesPerCycle": sum( updates ) / float( cycles ),
+		"statesWrittenPerCycle": sum( written ) / float( cycles ),
+	}
+
+
+########################################
+# Webhooks
+########################################
+def waitForQueue(queue, before, timeout):
+	# wait for the worker to get through everything accepted since the before stats
+	deadline = time.time() + timeout
+	while time.time() < deadline:
+		stats = queue.stats()
+		accepted = ( stats[ "received" ] - before[ "received" ] ) - ( stats[ "dropped" ] - before[ "dropped" ] )
+		done = ( stats[ "processed" ] - before[ "processed" ] ) + ( stats[ "duplicates" ] - before[ "duplicates" ] ) + ( stats[ "errors" ] - before[ "errors" ] )
+		if( done >= accepted ):
+			return True
+		time.sleep( 0.005 )
+	return False
+
+
+def benchmarkWebhooks(p, server, envelopes, timeout=120):
+	server.resetCounts()
+	indigo.resetStats()
+	queue = p.webhookQueue
+	before = queue.stats()
+
+	started = time.time()
+	for envelope in envelopes:
+		indigo.server.broadcast( HTTPD_PLUGIN_ID, WEBHOOK_MESSAGE, envelope )
+	delivered = time.time() - started
+	waitForQueue( queue, before, timeout )
+	elapsed = time.time() - started
+
+	stats = queue.stats()
+	counts = server.resetCounts()
+	processed = stats[ "processed" ] - before[ "processed" ]
+	return {
+		"webhooks": len( envelopes ),
+		"deliverSeconds": delivered,
+		"processSeconds": elapsed,
+		"webhooksPerSecond": processed / elapsed if elapsed > 0 else 0.0,
+		"processed": processed,
+		"coalesced": stats[ "coalesced" ] - before[ "coalesced" ],
+		"dropped": stats[ "dropped" ] - before[ "dropped" ],
+		"errors": stats[ "errors" ] - before[ "errors" ],
+		"stateUpdatesPerWebhook": indigo.stats[ "updateStatesOnServer" ] / float( max( processed, 1 ) ),
+		"statesWrittenPerWebhook": indigo.stats[ "statesWritten" ] / float( max( processed, 1 ) ),
+		"triggerExecutions": indigo.stats[ "triggerExecutions" ],
+		"googleCalls": sum( counts.get( name, 0 ) for name in GOOGLE_ENDPOINTS ),
+	}
+
+
+########################################
+# Trip sync
+########################################
+def benchmarkTripSync(p, server, days):
+	if( p.tripStore == None ):
+		p._openTripStore()
+	p.tripSyncHistoryDays = days
+	imei = standins.imeiFor( 0 )
+
+	server.resetCounts()
+	started = time.time()
+	trips = p._syncTrips( imei )
+	elapsed = time.time() - started
+	counts = server.resetCounts()
+
+	return {
+		"days": days,
+		"trips": trips,
+		"seconds": elapsed,
+		"requests": counts.get( "trips", 0 ),
+	}
+
+
+########################################
+# Token renewal
+########################################
+def benchmarkTokenRenewal(p, server, devList, renewals):
+	server.resetCounts()
+	latencies = []
+	for i in range( renewals ):
+		started = time.time()
+		renewed = p.renewAccessToken()
+		latencies.append( time.time() - started )
+		if( not renewed ):
+			break
+
+	# a poll that finds its token expired renews it before requesting
+	p.tokenManager.expiresAt = time.time() - 1
+	started = time.time()
+	p._pollFleet( devList )
+	pollSeconds = time.time() - started
+	counts = server.resetCounts()
+
+	return {
+		"renewals": len( latencies ),
+		"succeeded": renewed,
+		"latencyP50": percentile( latencies, 50 ),
+		"latencyMax": max( latencies ),
+		"pollAfterExpirySeconds": pollSeconds,
+		"oauthRequests": counts.get( "oauth", 0 ),
+	}
+
+
+########################################
+# Report
+########################################
+def report(results):
+	config = results[ "config" ]
+	print( "%d vehicles, latency %dms +/- %dms, error rate %.1f%%" % ( config[ "vehicles" ], config[ "latency_ms" ], config[ "jitter_ms" ], config[ "error_rate" ] * 100 ) )
+	print( "" )
+	print( "%-12s %8s %8s %8s %10s %10s %10s %10s" % ( "polling", "p50 ms", "p95 ms", "max ms", "API/cycle", "Google", "updates", "states" ) )
+	for r in results[ "polling" ]:
+		print( "%-12s %8.1f %8.1f %8.1f %10.1f %10.1f %10.1f %10.1f" % ( r[ "mode" ], r[ "latencyP50" ] * 1000, r[ "latencyP95" ] * 1000, r[ "latencyMax" ] * 1000, r[ "apiCallsPerCycle" ], r[ "googleCallsPerCycle" ], r[ "stateUpdatesPerCycle" ], r[ "statesWrittenPerCycle" ] ) )
+	w = results[ "webhooks" ]
+	print( "" )
+	print( "webhooks: %d in %.2fs (%.0f/s), %d coalesced, %d dropped, %d errors" % ( w[ "processed" ], w[ "processSeconds" ], w[ "webhooksPerSecond" ], w[ "coalesced" ], w[ "dropped" ], w[ "errors" ] ) )
+	print( "          %.2f state updates and %.1f states written per webhook, %d trigger executions, %d Google calls" % ( w[ "stateUpdatesPerWebhook" ], w[ "statesWrittenPerWebhook" ], w[ "triggerExecutions" ], w[ "googleCalls" ] ) )
+	t = results[ "tripSync" ]
+	print( "" )
+	print( "trip sync: %d days, %d trips in %d requests, %.2fs" % ( t[ "days" ], t[ "trips" ], t[ "requests" ], t[ "seconds" ] ) )
+	a = results[ "tokenRenewal" ]
+	print( "" )
+	print( "token renewal: %d%s, p50 %.1fms, max %.1fms; poll with an expired token %.1fms, %d oauth requests in all" % ( a[ "renewals" ], "" if a[ "succeeded" ] else " (failed)", a[ "latencyP50" ] * 1000, a[ "latencyMax" ] * 1000, a[ "pollAfterExpirySeconds" ] * 1000, a[ "oauthRequests" ] ) )
+
+
+def main():
+	parser = argparse.ArgumentParser( description="Offline benchmarks for the Bouncie plugin" )
+	parser.add_argument( "--vehicles", type=int, default=10 )
+	parser.add_argument( "--cycles", type=int, default=10, help="poll cycles per polling mode" )
+	parser.add_argument( "--latency-ms", type=int, default=50 )
+	parser.add_argument( "--jitter-ms", type=int, default=20 )
+	parser.add_argument( "--error-rate", type=float, default=0.0, help="fraction of requests answered with a 503" )
+	parser.add_argument( "--concurrency", type=int, default=4, help="per-vehicle polling concurrency" )
+	parser.add_argument( "--trip-data", type=int, default=50, help="tripData webhooks per vehicle" )
+	parser.add_argument( "--queue-size", type=int, default=5000 )
+	parser.add_argument( "--trip-days", type=int, default=30, help="days of trip history to sync" )
+	parser.add_argument( "--no-gps-store", action="store_true" )
+	parser.add_argument( "--json", help="also write the results to this file" )
+	parser.add_argument( "--verbose", action="store_true" )
+	args = parser.parse_args()
+
+	logging.basicConfig( level=logging.WARNING )
+
+	server = standins.StandInServer( standins.StandInConfig(
+		fleetSize=args.vehicles,
+		latency=args.latency_ms / 1000.0,
+		jitter=args.jitter_ms / 1000.0,
+		errorRate=args.error_rate,
+	) ).start()
+
+	p = None
+	try:
+		imeis = [ standins.imeiFor( i ) for i in range( args.vehicles ) ]
+		p, devList = createPlugin( args, server, imeis )
+		# every vehicle on a trip at once, delivered back to back
+		envelopes = [ hookJson for receivedTime, hookJson in webhooktraffic.synthesizeTrips( imeis, args.trip_data ) ]
+
+		results = {
+			"config": vars( args ),
+			"polling": [
+				benchmarkPolling( p, devList, server, args.cycles, fleet=True ),
+				benchmarkPolling( p, devList, server, args.cycles, fleet=False ),
+			],
+			"webhooks": benchmarkWebhooks( p, server, envelopes ),
+			"tripSync": benchmarkTripSync( p, server, args.trip_days ),
+			"tokenRenewal": benchmarkTokenRenewal( p, server, devList, 5 ),
+		}
+		report( results )
+
+		if( args.json ):
+			with open( args.json, "w" ) as f:
+				json.dump( results, f, indent=2, sort_keys=True )
+	finally:
+		if( p != None ):
+			p.shutdown()
+		server.stop()
+		indigo.server.cleanup()
+
+
+if __name__ == "__main__":
+	main()
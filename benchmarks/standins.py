@@ -0,0 +1,272 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Local HTTP stand-ins for api.bouncie.dev, auth.bouncie.com and maps.googleapis.com.
+#
+# One threaded server answers all three on 127.0.0.1, routed by path:
+#
+#   GET  /v1/vehicles[?imei=]               a fleet of fleetSize vehicles
+#   GET  /v1/trips?imei=&starts-after=...   a few polyline trips in the window
+#   POST /oauth/token                       a fresh access token
+#   GET  /maps/api/geocode/json             an address (or, for address=, a location)
+#   GET  /maps/api/distancematrix/json      a distance and duration to home
+#
+# Every request waits latency +/- jitter seconds, and fails with a 503 at errorRate,
+# before it is answered. Requests are counted per endpoint.
+
+import calendar
+import datetime
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+try:
+	from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+	from SocketServer import ThreadingMixIn
+	from urlparse import urlparse, parse_qs
+except ImportError:
+	from http.server import HTTPServer, BaseHTTPRequestHandler
+	from socketserver import ThreadingMixIn
+	from urllib.parse import urlparse, parse_qs
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "..", "Bouncie.indigoPlugin", "Contents", "Server Plugin" ) )
+
+import polyline
+
+
+HOME = ( 40.0, -75.0 )
+
+
+def imeiFor(index):
+	return "35200000%07d" % index
+
+
+class StandInConfig(object):
+
+	def __init__(self, fleetSize=10, latency=0.05, jitter=0.02, errorRate=0.0, seed=1):
+		self.fleetSize = fleetSize
+		self.latency = latency
+		self.jitter = jitter
+		self.errorRate = errorRate
+		self.seed = seed
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+	# keep-alive, like the real services
+	protocol_version = "HTTP/1.1"
+	# headers and body go out in separate writes; without this, Nagle and delayed
+	# ACKs add ~40ms to every response and swamp the latency being simulated
+	disable_nagle_algorithm = True
+
+
+	def log_message(self, format, *args):
+		pass
+
+
+	def do_GET(self):
+		self._handle( "GET" )
+
+
+	def do_POST(self):
+		length = int( self.headers.get( "Content-Length", 0 ) )
+		if( length > 0 ):
+			self.rfile.read( length )
+		self._handle( "POST" )
+
+
+	def _handle(self, method):
+		url = urlparse( self.path )
+		query = dict( ( k, v[0] ) for k, v in parse_qs( url.query ).items() )
+		routes = {
+			( "GET", "/v1/vehicles" ): ( "vehicles", self.server.vehicles ),
+			( "GET", "/v1/trips" ): ( "trips", self.server.trips ),
+			( "POST", "/oauth/token" ): ( "oauth", self.server.token ),
+			( "GET", "/maps/api/geocode/json" ): ( "geocode", self.server.geocode ),
+			( "GET", "/maps/api/distancematrix/json" ): ( "distancematrix", self.server.distanceMatrix ),
+		}
+		route = routes.get( ( method, url.path ) )
+		if( route == None ):
+			self._reply( 404, { "error": "not found" } )
+			return
+
+		name, handler = route
+		self.server.count( name )
+
+		config = self.server.config
+		delay = config.latency + random.uniform( -config.jitter, config.jitter )
+		if( delay > 0 ):
+			time.sleep( delay )
+		if( random.random() < config.errorRate ):
+			self.server.count( name + "-error" )
+			self._reply( 503, { "error": "service unavailable" } )
+			return
+
+		self._reply( 200, handler( query ) )
+
+
+	def _reply(self, status, data):
+		body = json.dumps( data ).encode( "utf-8" )
+		self.send_response( status )
+		self.send_header( "Content-Type", "application/json" )
+		self.send_header( "Content-Length", str( len( body ) ) )
+		self.end_headers()
+		self.wfile.write( body )
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+
+	daemon_threads = True
+
+	def __init__(self, config):
+		HTTPServer.__init__( self, ( "127.0.0.1", 0 ), _Handler )
+		self.config = config
+		self.rng = random.Random( config.seed )
+		self.lock = threading.Lock()
+		self.counts = {}
+		self.thread = None
+		# each vehicle drives around home; state changes a little on every request
+		self.fleet = [ self._newVehicle( i ) for i in range( config.fleetSize ) ]
+
+
+	@property
+	def baseUrl(self):
+		return "http://127.0.0.1:%d" % self.server_address[1]
+
+
+	def start(self):
+		self.thread = threading.Thread( target=self.serve_forever, name="StandInServer" )
+		self.thread.daemon = True
+		self.thread.start()
+		return self
+
+
+	def stop(self):
+		self.shutdown()
+		self.server_close()
+
+
+	def count(self, name):
+		with self.lock:
+			self.counts[ name ] = self.counts.get( name, 0 ) + 1
+
+
+	def resetCounts(self):
+		with self.lock:
+			counts = self.counts
+			self.counts = {}
+		return counts
+
+
+	def _newVehicle(self, index):
+		return {
+			"model": { "make": "GMC", "name": "Terrain", "year": 2012 },
+			"nickName": "Vehicle %d" % index,
+			"standardEngine": "2.4L",
+			"vin": "1GKALSEK%09d" % index,
+			"imei": imeiFor( index ),
+			"stats": {
+				"localTimezone": "-0500",
+				"lastUpdated": "",
+				"location": {
+					"lat": HOME[0] + self.rng.uniform( -0.2, 0.2 ),
+					"lon": HOME[1] + self.rng.uniform( -0.2, 0.2 ),
+					"heading": self.rng.randint( 0, 359 ),
+					"address": "%d Main St" % index,
+				},
+				"fuelLevel": self.rng.uniform( 10, 100 ),
+				"isRunning": self.rng.random() < 0.3,
+				"speed": 0,
+				"mil": { "milOn": False, "lastUpdated": "2020-01-01T12:00:00.000Z" },
+				"battery": { "status": "normal", "lastUpdated": "2020-01-01T12:00:00.000Z" },
+			},
+		}
+
+
+	def _advance(self, vehicle):
+		stats = vehicle[ "stats" ]
+		stats[ "lastUpdated" ] = datetime.datetime.utcnow().strftime( "%Y-%m-%dT%H:%M:%S.000Z" )
+		if( stats[ "isRunning" ] ):
+			stats[ "speed" ] = round( self.rng.uniform( 0, 70 ), 1 )
+			stats[ "location" ][ "lat" ] += self.rng.uniform( -0.001, 0.001 )
+			stats[ "location" ][ "lon" ] += self.rng.uniform( -0.001, 0.001 )
+			stats[ "fuelLevel" ] = max( 0, stats[ "fuelLevel" ] - 0.01 )
+		else:
+			stats[ "speed" ] = 0
+
+
+	def vehicles(self, query):
+		with self.lock:
+			fleet = self.fleet if "imei" not in query else [ v for v in self.fleet if v[ "imei" ] == query[ "imei" ] ]
+			for vehicle in fleet:
+				self._advance( vehicle )
+			return json.loads( json.dumps( fleet ) )
+
+
+	def trips(self, query):
+		# two trips a day in the window, each an hour of points a minute apart
+		start = datetime.datetime.strptime( query[ "starts-after" ], "%Y-%m-%dT%H:%M:%S.000Z" )
+		end = datetime.datetime.strptime( query[ "ends-before" ], "%Y-%m-%dT%H:%M:%S.000Z" )
+		trips = []
+		day = start.replace( hour=0, minute=0, second=0 )
+		while day < end:
+			for hour in ( 8, 17 ):
+				tripStart = day + datetime.timedelta( hours=hour )
+				tripEnd = tripStart + datetime.timedelta( hours=1 )
+				if( tripStart <= start or tripEnd >= end ):
+					continue
+				track = [ ( HOME[0] + i * 0.001, HOME[1] + i * 0.0005 ) for i in range( 60 ) ]
+				trips.append( {
+					"transactionId": "%s-%d" % ( query[ "imei" ], calendar.timegm( tripStart.timetuple() ) ),
+					"imei": query[ "imei" ],
+					"startTime": tripStart.strftime( "%Y-%m-%dT%H:%M:%S.000Z" ),
+					"endTime": tripEnd.strftime( "%Y-%m-%dT%H:%M:%S.000Z" ),
+					"distance": 4.2,
+					"averageSpeed": 25.0,
+					"maxSpeed": 55.0,
+					"gps": polyline.encode( track ),
+				} )
+			day += datetime.timedelta( days=1 )
+		return trips
+
+
+	def token(self, query):
+		return { "access_token": "standin-%d" % random.randint( 0, 1 << 30 ), "token_type": "Bearer", "expires_in": 3600 }
+
+
+	def geocode(self, query):
+		if( "address" in query ):
+			return { "status": "OK", "results": [ { "formatted_address": query[ "address" ], "geometry": { "location": { "lat": HOME[0], "lng": HOME[1] } } } ] }
+		return {
+			"status": "OK",
+			"results": [ {
+				"formatted_address": "123 Main St, West Chester, PA 19380, USA",
+				"address_components": [
+					{ "long_name": "123", "types": [ "street_number" ] },
+					{ "long_name": "Main Street", "types": [ "route" ] },
+				],
+			} ],
+		}
+
+
+	def distanceMatrix(self, query):
+		miles = self.rng.uniform( 0.5, 10 )
+		seconds = int( miles * 120 )
+		duration = { "text": "%d mins" % ( seconds // 60 ), "value": seconds }
+		element = {
+			"status": "OK",
+			"distance": { "text": "%.1f mi" % miles, "value": int( miles * 1609 ) },
+			"duration": duration,
+		}
+		if( "departure_time" in query ):
+			element[ "duration_in_traffic" ] = duration
+		return {
+			"status": "OK",
+			"destination_addresses": [ "West Chester, PA 19380, USA" ],
+			"origin_addresses": [ "180 Eagleview Blvd, Exton, PA 19341, USA" ],
+			"rows": [ { "elements": [ element ] } ],
+		}
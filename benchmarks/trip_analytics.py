@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Times tripanalytics over a synthetic history: splitting the point stream into trips
+# and analyzing every trip, with NumPy (when installed) and with the plain-loop
+# fallback.
+#
+#   python benchmarks/trip_analytics.py [--days N] [--trips-per-day N] [--minutes N]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "..", "Bouncie.indigoPlugin", "Contents", "Server Plugin" ) )
+
+import tripanalytics
+
+
+def syntheticHistory(days, tripsPerDay, minutes, seed=1):
+	# 1 second samples; trips are separated by a few hours parked
+	rng = random.Random( seed )
+	ts, lat, lon, speed = [], [], [], []
+	t = 1577836800000
+	for trip in range( days * tripsPerDay ):
+		t += rng.randint( 2, 6 ) * 3600 * 1000
+		la, lo, s = 40.0 + rng.random(), -75.0 + rng.random(), 0.0
+		for i in range( minutes * 60 ):
+			t += 1000
+			s = max( 0.0, min( 85.0, s + rng.gauss( 0.2, 3.0 ) ) )
+			la += s / 3600.0 / 69.0
+			lo += rng.gauss( 0, 0.00002 )
+			ts.append( t )
+			lat.append( la )
+			lon.append( lo )
+			speed.append( s if rng.random() > 0.02 else None )
+	return ts, lat, lon, speed
+
+
+def analyzeAll(ts, lat, lon, speed):
+	results = []
+	for start, end in tripanalytics.splitTrips( ts ):
+		results.append( tripanalytics.analyzeTrip( ts[ start:end ], lat[ start:end ], lon[ start:end ], speed[ start:end ] ) )
+	return results
+
+
+def main():
+	parser = argparse.ArgumentParser( description="Time trip analytics over a synthetic history" )
+	parser.add_argument( "--days", type=int, default=90 )
+	parser.add_argument( "--trips-per-day", type=int, default=3 )
+	parser.add_argument( "--minutes", type=int, default=20, help="length of each trip" )
+	args = parser.parse_args()
+
+	columns = syntheticHistory( args.days, args.trips_per_day, args.minutes )
+	print( "%d days, %d trips, %d points" % ( args.days, args.days * args.trips_per_day, len( columns[0] ) ) )
+
+	numpy = tripanalytics.numpy
+	backends = [ ( "numpy", numpy ), ( "python", None ) ] if numpy != None else [ ( "python", None ) ]
+	for name, module in backends:
+		tripanalytics.numpy = module
+		started = time.time()
+		results = analyzeAll( *columns )
+		elapsed = time.time() - started
+		miles = sum( r[ "distance" ] for r in results )
+		events = sum( r[ "hardAccelerations" ] + r[ "hardBrakes" ] for r in results )
+		print( "%-7s %8.2fs  %d trips, %.0f miles, %d hard events" % ( name, elapsed, len( results ), miles, events ) )
+	tripanalytics.numpy = numpy
+
+
+if __name__ == "__main__":
+	main()
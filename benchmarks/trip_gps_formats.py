@@ -0,0 +1,107 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Compares the 'geojson' and 'polyline' gps-format of a /trips response: bytes on the
+# wire (plain and gzipped) and the time to parse the response and decode the tracks.
+#
+#   python benchmarks/trip_gps_formats.py [--trips N] [--points N] [--repeat N]
+
+import argparse
+import gzip
+import io
+import json
+import math
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "..", "Bouncie.indigoPlugin", "Contents", "Server Plugin" ) )
+
+import polyline
+
+
+def syntheticTrack(points, seed):
+	# a wandering drive at roughly 1 second between samples
+	rng = random.Random( seed )
+	lat, lon = 40.0 + rng.random(), -75.0 + rng.random()
+	heading = rng.uniform( 0, 2 * math.pi )
+	track = []
+	for i in range( points ):
+		heading += rng.gauss( 0, 0.05 )
+		step = rng.uniform( 0.00005, 0.0003 )
+		lat += step * math.cos( heading )
+		lon += step * math.sin( heading )
+		track.append( ( round( lat, 6 ), round( lon, 6 ) ) )
+	return track
+
+
+def tripsResponse(tracks, gpsFormat):
+	trips = []
+	for i, track in enumerate( tracks ):
+		if( gpsFormat == "polyline" ):
+			gps = polyline.encode( track )
+		else:
+			gps = { "type": "LineString", "coordinates": [ [ lon, lat ] for lat, lon in track ] }
+		trips.append( {
+			"transactionId": "trip-%d" % i,
+			"imei": "123456789012345",
+			"startTime": "2020-04-28T22:13:17.000Z",
+			"endTime": "2020-04-28T23:13:17.000Z",
+			"distance": 12.3,
+			"gps": gps,
+		} )
+	return json.dumps( trips ).encode( "utf-8" )
+
+
+def gzipSize(body):
+	buf = io.BytesIO()
+	with gzip.GzipFile( fileobj=buf, mode="wb" ) as f:
+		f.write( body )
+	return len( buf.getvalue() )
+
+
+def parseAndDecode(body, gpsFormat):
+	total = 0
+	for trip in json.loads( body.decode( "utf-8" ) ):
+		total += len( polyline.decodeTripGps( trip[ "gps" ], gpsFormat ) ) // 2
+	return total
+
+
+def main():
+	parser = argparse.ArgumentParser( description="Compare geojson and polyline trip payloads" )
+	parser.add_argument( "--trips", type=int, default=20 )
+	parser.add_argument( "--points", type=int, default=2000, help="GPS points per trip" )
+	parser.add_argument( "--repeat", type=int, default=5 )
+	args = parser.parse_args()
+
+	tracks = [ syntheticTrack( args.points, seed ) for seed in range( args.trips ) ]
+
+	results = {}
+	for gpsFormat in ( "geojson", "polyline" ):
+		body = tripsResponse( tracks, gpsFormat )
+		decoded = parseAndDecode( body, gpsFormat )
+		assert decoded == args.trips * args.points
+		seconds = min( timeit.repeat( lambda: parseAndDecode( body, gpsFormat ), number=1, repeat=args.repeat ) )
+		results[ gpsFormat ] = ( len( body ), gzipSize( body ), seconds )
+
+	# polyline rounds to 5 decimal places (about 1 m), so compare at that precision
+	geo = polyline.decodeTripGps( json.loads( tripsResponse( tracks[:1], "geojson" ).decode( "utf-8" ) )[0][ "gps" ], "geojson" )
+	poly = polyline.decode( polyline.encode( tracks[0] ) )
+	maxError = max( abs( a - b ) for a, b in zip( geo, poly ) )
+
+	print( "%d trips x %d points, best of %d" % ( args.trips, args.points, args.repeat ) )
+	print( "%-10s %12s %12s %12s" % ( "format", "bytes", "gzip bytes", "parse+decode" ) )
+	for gpsFormat in ( "geojson", "polyline" ):
+		size, zipped, seconds = results[ gpsFormat ]
+		print( "%-10s %12d %12d %10.1fms" % ( gpsFormat, size, zipped, seconds * 1000 ) )
+	print( "polyline is %.1fx smaller (%.1fx gzipped); parse+decode takes %.2fx the geojson time; max coordinate difference %.6f deg" % (
+		results[ "geojson" ][0] / float( results[ "polyline" ][0] ),
+		results[ "geojson" ][1] / float( results[ "polyline" ][1] ),
+		results[ "polyline" ][2] / results[ "geojson" ][2],
+		maxError ) )
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,202 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Webhook load generator for the Bouncie plugin.
+#
+# Replays webhook traffic into webhook_handler, the way HTTPd 2 delivers it, and
+# reports end-to-end latency (from the handler receiving a webhook to its event
+# being processed) and throughput. The traffic is either a recording made with the
+# plugin's "Record webhooks for replay" option, or synthesized trips:
+#
+#   python2 benchmarks/webhook_replay.py synth --vehicles 200 --trip-data 100 --out trips.jsonl.gz
+#   python2 benchmarks/webhook_replay.py replay webhooks-20201015-081500.jsonl.gz --speed 10
+#   python2 benchmarks/webhook_replay.py replay --vehicles 200 --fast
+#
+# Replays keep the original spacing between webhooks, divided by --speed; --fast
+# delivers them back to back. The plugin runs under benchmarks/fakeindigo against
+# the stand-ins in standins.py, as in run_benchmarks.py.
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+HERE = os.path.dirname( os.path.abspath( __file__ ) )
+sys.path.insert( 0, HERE )
+
+import run_benchmarks
+from run_benchmarks import indigo, standins, percentile
+import webhooktraffic
+from webhookrecorder import readRecording, writeRecording
+
+
+########################################
+# Replay
+########################################
+def replay(p, server, records, speed=None, timeout=300):
+	# speed None delivers as fast as possible
+	queue = p.webhookQueue
+	latencies = []
+	latencyLock = threading.Lock()
+	processFn = queue.processFn
+
+	def timedProcessFn(events):
+		try:
+			processFn( events )
+		finally:
+			done = time.time()
+			with latencyLock:
+				latencies.extend( done - event[ "received" ] for event in events )
+
+	server.resetCounts()
+	indigo.resetStats()
+	before = queue.stats()
+	lateness = []
+	queue.processFn = timedProcessFn
+	try:
+		started = time.time()
+		first = records[0][0] if records else 0
+		for receivedTime, hookJson in records:
+			if( speed != None ):
+				wait = started + ( receivedTime - first ) / speed - time.time()
+				if( wait > 0 ):
+					time.sleep( wait )
+				else:
+					lateness.append( -wait )
+			indigo.server.broadcast( run_benchmarks.HTTPD_PLUGIN_ID, run_benchmarks.WEBHOOK_MESSAGE, hookJson )
+		delivered = time.time() - started
+		drained = run_benchmarks.waitForQueue( queue, before, timeout )
+		elapsed = time.time() - started
+	finally:
+		queue.processFn = processFn
+
+	stats = queue.stats()
+	counts = server.resetCounts()
+	processed = stats[ "processed" ] - before[ "processed" ]
+	return {
+		"webhooks": len( records ),
+		"recordedSeconds": records[-1][0] - first if records else 0.0,
+		"speed": speed,
+		"deliverSeconds": delivered,
+		"processSeconds": elapsed,
+		"drained": drained,
+		"offeredPerSecond": len( records ) / delivered if delivered > 0 else 0.0,
+		"webhooksPerSecond": processed / elapsed if elapsed > 0 else 0.0,
+		"latencyP50": percentile( latencies, 50 ),
+		"latencyP95": percentile( latencies, 95 ),
+		"latencyP99": percentile( latencies, 99 ),
+		"latencyMax": max( latencies ) if latencies else 0.0,
+		"lateDeliveries": len( lateness ),
+		"lateMax": max( lateness ) if lateness else 0.0,
+		"maxDepth": stats[ "maxDepth" ],
+		"processed": processed,
+		"coalesced": stats[ "coalesced" ] - before[ "coalesced" ],
+		"duplicates": stats[ "duplicates" ] - before[ "duplicates" ],
+		"dropped": stats[ "dropped" ] - before[ "dropped" ],
+		"errors": stats[ "errors" ] - before[ "errors" ],
+		"statesWritten": indigo.stats[ "statesWritten" ],
+		"triggerExecutions": indigo.stats[ "triggerExecutions" ],
+		"googleCalls": sum( counts.get( name, 0 ) for name in run_benchmarks.GOOGLE_ENDPOINTS ),
+	}
+
+
+def report(r):
+	pace = "as fast as possible" if r[ "speed" ] == None else "at %gx" % r[ "speed" ]
+	print( "%d webhooks (%.0fs recorded) replayed %s in %.2fs, %.0f/s offered" % ( r[ "webhooks" ], r[ "recordedSeconds" ], pace, r[ "deliverSeconds" ], r[ "offeredPerSecond" ] ) )
+	print( "processed %d in %.2fs (%.0f/s): %d coalesced, %d duplicates, %d dropped, %d errors, max queue depth %d%s" % ( r[ "processed" ], r[ "processSeconds" ], r[ "webhooksPerSecond" ], r[ "coalesced" ], r[ "duplicates" ], r[ "dropped" ], r[ "errors" ], r[ "maxDepth" ], "" if r[ "drained" ] else " (timed out waiting for the queue)" ) )
+	print( "latency ms: p50 %.1f, p95 %.1f, p99 %.1f, max %.1f" % ( r[ "latencyP50" ] * 1000, r[ "latencyP95" ] * 1000, r[ "latencyP99" ] * 1000, r[ "latencyMax" ] * 1000 ) )
+	if( r[ "lateDeliveries" ] ):
+		print( "%d webhooks delivered behind schedule, by up to %.1fms" % ( r[ "lateDeliveries" ], r[ "lateMax" ] * 1000 ) )
+	print( "%d states written, %d trigger executions, %d Google calls" % ( r[ "statesWritten" ], r[ "triggerExecutions" ], r[ "googleCalls" ] ) )
+
+
+########################################
+# Commands
+########################################
+def synthesize(args):
+	imeis = [ standins.imeiFor( i ) for i in range( args.vehicles ) ]
+	return webhooktraffic.synthesizeTrips( imeis, args.trip_data, args.interval, args.point_interval, args.spread, seed=args.seed )
+
+
+def synthCommand(args):
+	records = synthesize( args )
+	writeRecording( args.out, records )
+	print( "wrote %d webhooks for %d vehicles, %.0fs of traffic, to %s" % ( len( records ), args.vehicles, records[-1][0] - records[0][0], args.out ) )
+
+
+def replayCommand(args):
+	if( args.recording ):
+		records = list( readRecording( args.recording ) )
+	else:
+		records = synthesize( args )
+	if( len( records ) == 0 ):
+		print( "nothing to replay" )
+		return
+	imeis = webhooktraffic.recordingImeis( records )
+
+	server = standins.StandInServer( standins.StandInConfig(
+		fleetSize=len( imeis ),
+		latency=args.latency_ms / 1000.0,
+		jitter=args.jitter_ms / 1000.0,
+	) ).start()
+
+	p = None
+	try:
+		p, devList = run_benchmarks.createPlugin( args, server, imeis )
+		result = replay( p, server, records, None if args.fast else args.speed )
+		result[ "vehicles" ] = len( imeis )
+		report( result )
+		if( args.json ):
+			with open( args.json, "w" ) as f:
+				json.dump( result, f, indent=2, sort_keys=True )
+	finally:
+		if( p != None ):
+			p.shutdown()
+		server.stop()
+		indigo.server.cleanup()
+
+
+def addSynthArguments(parser):
+	parser.add_argument( "--vehicles", type=int, default=50, help="vehicles on a trip" )
+	parser.add_argument( "--trip-data", type=int, default=50, help="tripData webhooks per trip" )
+	parser.add_argument( "--interval", type=float, default=3.0, help="seconds between tripData webhooks" )
+	parser.add_argument( "--point-interval", type=float, default=1.0, help="seconds between points in a tripData webhook" )
+	parser.add_argument( "--spread", type=float, default=30.0, help="trips start within this many seconds" )
+	parser.add_argument( "--seed", type=int, default=1 )
+
+
+def main():
+	parser = argparse.ArgumentParser( description="Webhook record/replay load generator for the Bouncie plugin" )
+	commands = parser.add_subparsers( dest="command" )
+
+	synth = commands.add_parser( "synth", help="write synthesized trips to a recording" )
+	addSynthArguments( synth )
+	synth.add_argument( "--out", required=True, help="recording to write (.jsonl.gz)" )
+	synth.set_defaults( run=synthCommand )
+
+	replayParser = commands.add_parser( "replay", help="replay a recording, or synthesized trips, into the plugin" )
+	replayParser.add_argument( "recording", nargs="?", help="recording to replay; trips are synthesized without one" )
+	addSynthArguments( replayParser )
+	pace = replayParser.add_mutually_exclusive_group()
+	pace.add_argument( "--speed", type=float, default=1.0, help="multiple of the recorded pace (default 1, real time)" )
+	pace.add_argument( "--fast", action="store_true", help="deliver as fast as possible" )
+	replayParser.add_argument( "--latency-ms", type=int, default=50, help="stand-in latency for Google requests" )
+	replayParser.add_argument( "--jitter-ms", type=int, default=20 )
+	replayParser.add_argument( "--concurrency", type=int, default=4 )
+	replayParser.add_argument( "--queue-size", type=int, default=5000 )
+	replayParser.add_argument( "--no-gps-store", action="store_true" )
+	replayParser.add_argument( "--json", help="also write the results to this file" )
+	replayParser.add_argument( "--verbose", action="store_true" )
+	replayParser.set_defaults( run=replayCommand )
+
+	args = parser.parse_args()
+	logging.basicConfig( level=logging.WARNING )
+	args.run( args )
+
+
+if __name__ == "__main__":
+	main()
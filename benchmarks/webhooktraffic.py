@@ -0,0 +1,133 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+# Synthetic Bouncie webhook traffic, in the recording format of webhookrecorder.py:
+# a time-ordered list of ( receivedTime, hookJson ).
+#
+# Every vehicle drives one trip, starting somewhere in the first `spread` seconds:
+#
+#   tripStart, tripData every `interval` seconds with a point every `pointInterval`
+#   seconds, tripMetrics, tripEnd
+#
+# Speed is a random walk with the odd stop, so trips have idling, hard braking and
+# hard acceleration; the metrics and odometer in the last two events match the points.
+
+import json
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "..", "Bouncie.indigoPlugin", "Contents", "Server Plugin" ) )
+
+import geo
+import standins
+
+
+WEBHOOK_PATH = "/bouncie-webhook"
+
+
+def timestamp(seconds):
+	return time.strftime( "%Y-%m-%dT%H:%M:%S.000Z", time.gmtime( seconds ) )
+
+
+def envelope(payload):
+	# the hookJson HTTPd 2 broadcasts for a webhook POST
+	return json.dumps( {
+		"headers": { "content-type": "application/json", "user-agent": "Bouncie-Webhook" },
+		"request": { "path": WEBHOOK_PATH, "client": "127.0.0.1", "command": "POST" },
+		"payload": json.dumps( payload ),
+		"vars": {},
+	} )
+
+
+def payloadOf(hookJson):
+	return json.loads( json.loads( hookJson )[ "payload" ] )
+
+
+def recordingImeis(records):
+	# the imeis in a recording, in order of first appearance
+	imeis = []
+	for receivedTime, hookJson in records:
+		try:
+			imei = payloadOf( hookJson ).get( "imei" )
+		except Exception:
+			continue
+		if( imei != None and imei not in imeis ):
+			imeis.append( imei )
+	return imeis
+
+
+def _tripEvents(rng, imei, start, tripDataCount, interval, pointInterval):
+	# [ ( time, payload ) ] for one trip
+	transactionId = "%s-%d" % ( imei, int( start ) )
+	lat = standins.HOME[0] + rng.uniform( 0.05, 0.1 )
+	lon = standins.HOME[1] + rng.uniform( -0.05, 0.05 )
+	heading = rng.uniform( 0, 360 )
+	odometer = round( rng.uniform( 5000, 90000 ), 1 )
+
+	events = [ ( start, { "eventType": "tripStart", "imei": imei, "transactionId": transactionId, "start": { "timestamp": timestamp( start ), "timeZone": "-0500", "odometer": odometer } } ) ]
+
+	t = start
+	speed = 0.0
+	distance = 0.0
+	maxSpeed = 0.0
+	idle = 0.0
+	hardBrakes = 0
+	hardAccelerations = 0
+	for n in range( tripDataCount ):
+		points = []
+		for k in range( max( 1, int( round( interval / pointInterval ) ) ) ):
+			t += pointInterval
+			previous = speed
+			if( speed < 1 and rng.random() < 0.7 ):
+				# waiting at a light
+				speed = 0.0
+			elif( rng.random() < 0.03 ):
+				speed = max( 0.0, speed - rng.uniform( 20, 35 ) )
+			else:
+				speed = min( 75.0, max( 0.0, speed + rng.uniform( -6, 9 ) ) )
+			if( speed < 2 ):
+				idle += pointInterval
+			rate = ( speed - previous ) / pointInterval
+			if( rate >= 8 ):
+				hardAccelerations += 1
+			elif( rate <= -8 ):
+				hardBrakes += 1
+			maxSpeed = max( maxSpeed, speed )
+
+			heading = ( heading + rng.uniform( -15, 15 ) ) % 360
+			miles = speed * pointInterval / 3600.0
+			distance += miles
+			lat += miles / geo.EARTH_RADIUS_MILES * math.cos( math.radians( heading ) ) * 180 / math.pi
+			lon += miles / geo.EARTH_RADIUS_MILES * math.sin( math.radians( heading ) ) * 180 / math.pi / math.cos( math.radians( lat ) )
+			points.append( { "timestamp": timestamp( t ), "timezone": "-0500", "speed": round( speed, 1 ), "gps": { "lat": round( lat, 6 ), "lon": round( lon, 6 ), "obdMaxSpeed": round( speed, 1 ), "heading": int( heading ), "satelliteCount": rng.randint( 8, 14 ), "hdop": round( rng.uniform( 0.6, 1.5 ), 1 ) } } )
+		# the webhook goes out once its last point has been taken
+		events.append( ( t + rng.uniform( 0.2, 1.0 ), { "eventType": "tripData", "imei": imei, "transactionId": transactionId, "data": points } ) )
+
+	tripTime = t - start
+	events.append( ( t + 1.5, { "eventType": "tripMetrics", "imei": imei, "transactionId": transactionId, "metrics": {
+		"timestamp": timestamp( t ),
+		"tripTime": int( tripTime ),
+		"tripDistance": round( distance, 2 ),
+		"totalIdlingTime": int( idle ),
+		"maxSpeed": round( maxSpeed, 1 ),
+		"averageDriveSpeed": round( distance / ( ( tripTime - idle ) / 3600.0 ), 1 ) if tripTime > idle else 0.0,
+		"hardBrakingCounts": hardBrakes,
+		"hardAccelerationCounts": hardAccelerations,
+	} } ) )
+	events.append( ( t + 2.0, { "eventType": "tripEnd", "imei": imei, "transactionId": transactionId, "end": { "timestamp": timestamp( t + 1 ), "timeZone": "-0500", "odometer": round( odometer + distance, 1 ), "fuelConsumed": round( distance / 25.0, 3 ) } } ) )
+	return events
+
+
+def synthesizeTrips(imeis, tripDataCount=50, interval=3.0, pointInterval=1.0, spread=30.0, start=None, seed=1):
+	rng = random.Random( seed )
+	if( start == None ):
+		start = time.time()
+	events = []
+	for imei in imeis:
+		events.extend( _tripEvents( rng, imei, start + rng.uniform( 0, spread ), tripDataCount, interval, pointInterval ) )
+	events.sort( key=lambda event: event[0] )
+	return [ ( receivedTime, envelope( payload ) ) for receivedTime, payload in events ]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+####################
+
+# Unit tests for the plugin's helper modules, which don't need Indigo. Run with the
+# plugin's own Python 2.7:
+#
+#   python2 -m pytest tests
+
+import logging
+import os
+import sys
+
+import pytest
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "..", "Bouncie.indigoPlugin", "Contents", "Server Plugin" ) )
+
+
+class FakeClock(object):
+
+	# stands in for time.time wherever a module takes a clock
+
+	def __init__(self, now=1000.0):
+		self.now = now
+
+
+	def __call__(self):
+		return self.now
+
+
+	def advance(self, seconds):
+		self.now += seconds
+
+
+@pytest.fixture
+def clock():
+	return FakeClock()
+
+
+@pytest.fixture
+def logger():
+	return logging.getLogger( "bouncie.tests" )
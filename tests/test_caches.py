@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from caches import TTLCache, RefreshingValue
+
+
+def waitFor(condition, timeout=5.0):
+	deadline = time.time() + timeout
+	while not condition():
+		if( time.time() >= deadline ):
+			return False
+		time.sleep( 0.01 )
+	return True
+
+
+def test_entry_expires_after_ttl(clock):
+	cache = TTLCache( 10, 60, clock=clock )
+	cache.put( "a", 1 )
+	clock.advance( 60 )
+	assert cache.get( "a" ) == 1
+	assert cache.age( "a" ) == 60
+	clock.advance( 1 )
+	assert cache.get( "a" ) == None
+	assert cache.age( "a" ) == None
+	assert cache.stats()[ "hits" ] == 1
+	assert cache.stats()[ "misses" ] == 1
+
+
+def test_put_restarts_ttl(clock):
+	cache = TTLCache( 10, 60, clock=clock )
+	cache.put( "a", 1 )
+	clock.advance( 50 )
+	cache.put( "a", 2 )
+	clock.advance( 50 )
+	assert cache.get( "a" ) == 2
+
+
+def test_evicts_least_recently_used(clock):
+	cache = TTLCache( 2, 60, clock=clock )
+	cache.put( "a", 1 )
+	cache.put( "b", 2 )
+	cache.get( "a" )
+	cache.put( "c", 3 )
+	assert cache.get( "b" ) == None
+	assert cache.get( "a" ) == 1
+	assert cache.get( "c" ) == 3
+	assert cache.stats()[ "evictions" ] == 1
+
+
+def test_seen_remembers_keys_until_they_expire(clock):
+	cache = TTLCache( 10, 600, clock=clock )
+	assert not cache.seen( "hook" )
+	assert cache.seen( "hook" )
+	clock.advance( 601 )
+	assert not cache.seen( "hook" )
+
+
+def test_save_and_load_skip_expired_entries(clock, tmpdir):
+	path = str( tmpdir.join( "cache.json" ) )
+	cache = TTLCache( 10, 60, clock=clock )
+	cache.put( "old", 1 )
+	clock.advance( 30 )
+	cache.put( "new", 2 )
+	cache.save( path )
+
+	clock.advance( 40 )
+	restored = TTLCache( 10, 60, clock=clock )
+	assert restored.load( path ) == 1
+	assert restored.get( "old" ) == None
+	assert restored.get( "new" ) == 2
+	assert restored.age( "new" ) == 40
+
+
+def test_load_without_file(clock, tmpdir):
+	cache = TTLCache( 10, 60, clock=clock )
+	assert cache.load( str( tmpdir.join( "missing.json" ) ) ) == 0
+
+
+def test_refreshing_value_loads_once_on_first_get(clock, logger):
+	calls = []
+	value = RefreshingValue( lambda: calls.append( 1 ) or len( calls ), logger, 60, clock=clock )
+	assert value.get() == 1
+	assert value.get() == 1
+	assert len( calls ) == 1
+
+
+def test_refreshing_value_serves_stale_while_reloading(clock, logger):
+	release = threading.Event()
+	calls = []
+
+	def loader():
+		calls.append( 1 )
+		if( len( calls ) > 1 ):
+			release.wait( 5 )
+		return len( calls )
+
+	value = RefreshingValue( loader, logger, 60, clock=clock )
+	assert value.get() == 1
+	clock.advance( 60 )
+
+	# stale: the reload starts in the background and the cached value comes back
+	assert value.get() == 1
+	assert value.get() == 1
+	assert waitFor( lambda: len( calls ) == 2 )
+	release.set()
+	assert waitFor( lambda: not value.refreshing )
+	assert len( calls ) == 2
+	assert value.get() == 2
+
+
+def test_refreshing_value_keeps_value_when_reload_fails(clock, logger):
+	results = [ "fleet" ]
+
+	def loader():
+		if( len( results ) == 0 ):
+			raise IOError( "offline" )
+		return results.pop()
+
+	value = RefreshingValue( loader, logger, 60, clock=clock )
+	assert value.get() == "fleet"
+	clock.advance( 61 )
+	assert value.get() == "fleet"
+	assert waitFor( lambda: not value.refreshing )
+	assert value.get() == "fleet"
+
+
+def test_refreshing_value_set_skips_the_load(clock, logger):
+	def loader():
+		raise AssertionError( "should not load" )
+
+	value = RefreshingValue( loader, logger, 60, clock=clock )
+	value.set( "polled" )
+	assert value.get() == "polled"
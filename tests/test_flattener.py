@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+import flattener
+
+
+def states(flattened):
+	return [ ( state[ "key" ], state[ "value" ] ) for state in flattened ]
+
+
+def test_vehicle_states_in_spec_order():
+	vehicle = {
+		"imei": "123",
+		"vin": "1FT",
+		"nickName": "Truck",
+		"model": { "make": "FORD", "name": "F-150", "year": 2018 },
+		"stats": {
+			"location": { "lat": 41.9, "lon": -87.6, "heading": 90 },
+			"mil": { "milOn": False },
+			"isRunning": True,
+		},
+	}
+	assert states( flattener.flattenVehicle( vehicle ) ) == [
+		( "model-make", "FORD" ),
+		( "model-name", "F-150" ),
+		( "model-year", 2018 ),
+		( "nickname", "Truck" ),
+		( "vin", "1FT" ),
+		( "imei", "123" ),
+		( "stats-location-lat", 41.9 ),
+		( "stats-location-long", -87.6 ),
+		( "stats-location-heading", 90 ),
+		( "stats-isRunning", True ),
+		( "mil-milOn", False ),
+	]
+
+
+def test_missing_and_null_objects_are_skipped():
+	assert states( flattener.flattenVehicle( { "imei": "123", "model": None, "stats": "n/a" } ) ) == [ ( "imei", "123" ) ]
+	assert flattener.flattenVehicle( None ) == []
+
+
+def test_null_values_are_passed_through():
+	assert states( flattener.flattenVehicle( { "vin": None } ) ) == [ ( "vin", None ) ]
+
+
+def test_converters_apply_and_bad_values_are_skipped():
+	connect = { "connect": { "timestamp": "2020-10-15T08:15:00.000Z", "latitude": "41.9", "longitude": "east" } }
+	assert states( flattener.flattenWebhook( "connect", connect ) ) == [
+		( "connect-timestamp", "2020-10-15T08:15:00.000Z" ),
+		( "stats-location-lat", 41.9 ),
+	]
+
+
+def test_mil_values():
+	assert flattener.milOn( "ON" )
+	assert flattener.milOn( "on" )
+	assert not flattener.milOn( "OFF" )
+	assert flattener.milOn( True )
+	mil = { "mil": { "value": "ON", "codes": "P0420" } }
+	assert states( flattener.flattenWebhook( "mil", mil ) ) == [ ( "mil-milOn", True ), ( "mil-codes", "P0420" ) ]
+
+
+def test_trip_data_uses_the_newest_point_with_a_position():
+	payload = { "data": [
+		{ "timestamp": "2020-10-15T08:15:02.000Z", "speed": 30, "gps": { "lat": 41.2, "lon": -87.2, "heading": 10 } },
+		{ "timestamp": "2020-10-15T08:15:03.000Z", "speed": 31, "gps": { "lat": 41.3, "lon": -87.3, "heading": 20 } },
+		{ "timestamp": "2020-10-15T08:15:01.000Z", "speed": 29, "gps": { "lat": 41.1, "lon": -87.1, "heading": 0 } },
+		{ "timestamp": "2020-10-15T08:15:04.000Z", "speed": 32, "gps": { "lat": None, "lon": None } },
+	] }
+	assert states( flattener.flattenWebhook( "tripData", payload ) ) == [
+		( "stats-lastUpdated", "2020-10-15T08:15:03.000Z" ),
+		( "stats-speed", 31 ),
+		( "stats-location-lat", 41.3 ),
+		( "stats-location-long", -87.3 ),
+		( "stats-location-heading", 20 ),
+	]
+
+
+def test_trip_data_without_a_position_sets_nothing():
+	assert flattener.flattenWebhook( "tripData", { "data": [ { "speed": 0 } ] } ) == []
+	assert flattener.flattenWebhook( "tripData", {} ) == []
+
+
+def test_unknown_event_types_set_nothing():
+	assert flattener.flattenWebhook( "userUpdated", { "imei": "123" } ) == []
+
+
+def test_one_source_can_feed_several_states():
+	flatten = flattener.compileSpec( (
+		( "a.b", "first", None ),
+		( "a.b", "second", str ),
+		( "c", "third", None ),
+	) )
+	assert states( flatten( { "a": { "b": 1 }, "c": 2 } ) ) == [ ( "first", 1 ), ( "second", "1" ), ( "third", 2 ) ]
+
+
+def test_spec_paths_must_not_conflict():
+	with pytest.raises( ValueError ):
+		flattener.compileSpec( ( ( "a", "value", None ), ( "a.b", "nested", None ) ) )
+	with pytest.raises( ValueError ):
+		flattener.compileSpec( ( ( "a.b", "nested", None ), ( "a", "value", None ) ) )
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from gpsstore import GpsStore, pointRow, toEpochMillis
+
+
+NOW = 1602749700.0
+
+
+def point(seconds, lat=41.9, lon=-87.6, speed=30):
+	return {
+		"timestamp": time.strftime( "%Y-%m-%dT%H:%M:%S.000Z", time.gmtime( seconds ) ),
+		"speed": speed,
+		"gps": { "lat": lat, "lon": lon, "heading": 90, "satelliteCount": 11, "hdop": 0.9 },
+	}
+
+
+def makeStore(tmpdir, clock, **kwargs):
+	clock.now = NOW
+	return GpsStore( str( tmpdir.join( "gps.sqlite" ) ), clock=clock, **kwargs )
+
+
+def written(store, imei=None):
+	# rows on disk, without the flush countPoints does first
+	with store.lock:
+		if( imei == None ):
+			return store.conn.execute( "SELECT COUNT(*) FROM gps_points" ).fetchone()[0]
+		return store.conn.execute( "SELECT COUNT(*) FROM gps_points WHERE imei = ?", ( imei, ) ).fetchone()[0]
+
+
+def test_point_rows():
+	assert toEpochMillis( "2020-10-15T08:15:00.250Z" ) == 1602749700250
+	assert pointRow( "a", point( NOW ) ) == ( "a", int( NOW * 1000 ), 41.9, -87.6, 30, 90, 11, 0.9 )
+	assert pointRow( "a", { "timestamp": "2020-10-15T08:15:00.000Z", "gps": { "lat": None, "lon": -87.6 } } ) == None
+	assert pointRow( "a", { "timestamp": "yesterday", "gps": { "lat": 41.9, "lon": -87.6 } } ) == None
+	assert pointRow( "a", { "gps": { "lat": 41.9, "lon": -87.6 } } ) == None
+
+
+def test_points_are_buffered_until_a_batch_fills(tmpdir, clock):
+	store = makeStore( tmpdir, clock, batchSize=5 )
+	assert store.append( "a", [ point( NOW + i ) for i in range( 3 ) ] + [ { "speed": 0 } ] ) == 3
+	assert written( store ) == 0
+	store.append( "a", [ point( NOW + i ) for i in range( 3, 5 ) ] )
+	assert written( store ) == 5
+	assert store.stats()[ "flushes" ] == 1
+	assert store.stats()[ "buffered" ] == 0
+	store.close()
+
+
+def test_flush_if_due_waits_for_the_interval(tmpdir, clock):
+	store = makeStore( tmpdir, clock, flushInterval=5.0 )
+	store.append( "a", [ point( NOW ) ] )
+	clock.advance( 4 )
+	store.flushIfDue()
+	assert written( store ) == 0
+	clock.advance( 1 )
+	store.flushIfDue()
+	assert written( store ) == 1
+	store.close()
+
+
+def test_redelivered_points_are_ignored(tmpdir, clock):
+	store = makeStore( tmpdir, clock )
+	store.append( "a", [ point( NOW ), point( NOW + 1 ) ] )
+	store.append( "a", [ point( NOW + 1 ), point( NOW + 2 ) ] )
+	store.append( "b", [ point( NOW + 1 ) ] )
+	assert store.countPoints( "a" ) == 3
+	assert store.countPoints() == 4
+	store.close()
+
+
+def test_point_queries_are_ordered_and_bounded(tmpdir, clock):
+	store = makeStore( tmpdir, clock )
+	store.append( "a", [ point( NOW + i, lat=40 + i, speed=None if i == 2 else i ) for i in ( 3, 1, 2, 0 ) ] )
+	start = int( NOW * 1000 )
+	assert [ p[ "lat" ] for p in store.getPoints( "a", start + 1000, start + 3000 ) ] == [ 41, 42 ]
+	ts, lat, lon, speed = store.getPointColumns( "a" )
+	assert ts == [ start + 1000 * i for i in range( 4 ) ]
+	assert speed == [ 0, 1, None, 3 ]
+	assert store.getPointColumns( "b" ) == ( [], [], [], [] )
+	assert store.latestTimestamp( "a" ) == start + 3000
+	assert store.latestTimestamp( "b" ) == None
+	store.close()
+
+
+def test_prune_deletes_points_past_retention(tmpdir, clock):
+	store = makeStore( tmpdir, clock, retentionDays=30, pruneInterval=3600 )
+	day = 86400
+	store.append( "a", [ point( NOW - 31 * day ), point( NOW - 29 * day ), point( NOW ) ] )
+	store.flush()
+
+	# the first periodic pass prunes, later ones wait for pruneInterval
+	store.flushIfDue()
+	assert written( store ) == 2
+	store.append( "a", [ point( NOW - 40 * day ) ] )
+	store.flush()
+	clock.advance( 3599 )
+	store.flushIfDue()
+	assert written( store ) == 3
+	clock.advance( 1 )
+	store.flushIfDue()
+	assert written( store ) == 2
+	assert store.stats()[ "pruned" ] == 2
+	store.close()
+
+
+def test_retention_of_zero_keeps_everything(tmpdir, clock):
+	store = makeStore( tmpdir, clock, retentionDays=0 )
+	store.append( "a", [ point( NOW - 3650 * 86400 ), point( NOW ) ] )
+	store.flush()
+	assert store.prune() == 0
+	assert written( store ) == 2
+	store.close()
+
+
+def test_close_flushes_the_buffer(tmpdir, clock):
+	store = makeStore( tmpdir, clock )
+	store.append( "a", [ point( NOW ) ] )
+	store.close()
+	reopened = makeStore( tmpdir, clock )
+	assert reopened.countPoints( "a" ) == 1
+	reopened.close()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+
+from jsonstream import iterJsonArray
+
+
+TRIPS = [
+	{ "transactionId": "a-1", "distance": 2.5, "gps": "_p~iF~ps|U", "tags": [ "home", "work" ] },
+	{ "transactionId": "a-2", "distance": 12, "note": u"café → parc", "fuel": None },
+	[ 1, 2, [ 3 ] ],
+	-17.25,
+	"plain",
+	True,
+]
+
+
+def chunked(text, size):
+	return [ text[ i:i + size ] for i in range( 0, len( text ), size ) ]
+
+
+def test_whole_array_in_one_chunk():
+	assert list( iterJsonArray( [ json.dumps( TRIPS ) ] ) ) == TRIPS
+
+
+@pytest.mark.parametrize( "size", [ 1, 2, 3, 7, 64 ] )
+def test_any_chunking_gives_the_same_elements(size):
+	text = json.dumps( TRIPS, indent=2 )
+	assert list( iterJsonArray( chunked( text, size ) ) ) == TRIPS
+
+
+@pytest.mark.parametrize( "size", [ 1, 2, 5 ] )
+def test_multibyte_characters_split_across_byte_chunks(size):
+	data = json.dumps( TRIPS, ensure_ascii=False ).encode( "utf-8" )
+	assert list( iterJsonArray( chunked( data, size ) ) ) == TRIPS
+
+
+def test_numbers_are_not_cut_at_a_chunk_boundary():
+	assert list( iterJsonArray( [ "[12", "3.4", "5, 6", "7]" ] ) ) == [ 123.45, 67 ]
+	assert list( iterJsonArray( [ "[tr", "ue,", "fal", "se]" ] ) ) == [ True, False ]
+
+
+def test_elements_are_yielded_as_they_arrive():
+	def chunks():
+		yield '[{"a": 1}, '
+		yield '{"b": 2}'
+		raise AssertionError( "read past the second element" )
+
+	elements = iterJsonArray( chunks() )
+	assert next( elements ) == { "a": 1 }
+	assert next( elements ) == { "b": 2 }
+
+
+def test_empty_array_and_surrounding_whitespace():
+	assert list( iterJsonArray( [ "  \n", " [ ", "\t]", "\n" ] ) ) == []
+
+
+def test_rejects_anything_but_an_array():
+	with pytest.raises( ValueError ):
+		list( iterJsonArray( [ '{"trips": []}' ] ) )
+
+
+def test_rejects_a_truncated_array():
+	with pytest.raises( ValueError ):
+		list( iterJsonArray( [ '[{"a": 1}, {"b":' ] ) )
+
+
+def test_no_input_yields_nothing():
+	assert list( iterJsonArray( [] ) ) == []
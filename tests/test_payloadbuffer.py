@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from payloadbuffer import PayloadBuffer
+
+
+def test_keeps_the_newest_payloads_per_device_and_kind(clock):
+	buf = PayloadBuffer( 3, clock=clock )
+	for i in range( 5 ):
+		buf.put( 1, "vehicleJSON", '{"n": %d}' % i )
+		clock.advance( 1 )
+	buf.put( 2, "vehicleJSON", '{"n": 0}' )
+	assert [ entry[2] for entry in buf.entries( 1, "vehicleJSON" ) ] == [ '{"n": 2}', '{"n": 3}', '{"n": 4}' ]
+	assert buf.get( 1, "vehicleJSON" )[2] == '{"n": 4}'
+	assert buf.get( 2, "vehicleJSON" )[2] == '{"n": 0}'
+
+
+def test_repeated_payload_is_not_stored_again(clock):
+	buf = PayloadBuffer( 3, clock=clock )
+	first = buf.put( 1, "vehicleJSON", '{"n": 1}' )
+	buf.put( 1, "vehicleJSON", '{"n": 2}' )
+	for i in range( 5 ):
+		clock.advance( 1 )
+		entry = buf.put( 1, "vehicleJSON", '{"n": 2}' )
+	assert entry[0] == first[0]
+	assert [ entry[2] for entry in buf.entries( 1, "vehicleJSON" ) ] == [ '{"n": 1}', '{"n": 2}' ]
+
+	# only the newest entry counts; an older payload coming back is stored
+	buf.put( 1, "vehicleJSON", '{"n": 1}' )
+	assert [ entry[2] for entry in buf.entries( 1, "vehicleJSON" ) ] == [ '{"n": 1}', '{"n": 2}', '{"n": 1}' ]
+
+
+def test_get_by_digest(clock):
+	buf = PayloadBuffer( 3, clock=clock )
+	old = buf.put( 1, "webHookJSON-tripData", u'{"speed": 31}' )
+	buf.put( 1, "webHookJSON-tripData", u'{"speed": 32}' )
+	assert buf.get( 1, "webHookJSON-tripData", old[1] ) == old
+	assert buf.get( 1, "webHookJSON-tripData", "0" * 12 ) == None
+	assert buf.get( 1, "vehicleJSON" ) == None
+
+
+def test_log_skips_repeated_payloads(clock, tmpdir):
+	path = str( tmpdir.join( "payloads.log" ) )
+	buf = PayloadBuffer( 3, logPath=path, clock=clock )
+	buf.put( 1, "vehicleJSON", '{"n": 1}' )
+	buf.put( 1, "vehicleJSON", '{"n": 1}' )
+	buf.put( 1, "vehicleJSON", '{"n": 2}' )
+	buf.close()
+	with open( path ) as f:
+		logged = [ json.loads( line )[ "payload" ] for line in f ]
+	assert logged == [ '{"n": 1}', '{"n": 2}' ]
+
+
+def test_forget_and_resize(clock):
+	buf = PayloadBuffer( 3, clock=clock )
+	for i in range( 3 ):
+		buf.put( 1, "vehicleJSON", str( i ) )
+	buf.put( 1, "googleapis-geocode", "{}" )
+	buf.resize( 2 )
+	assert [ entry[2] for entry in buf.entries( 1, "vehicleJSON" ) ] == [ "1", "2" ]
+	assert buf.kinds( 1 ) == [ "googleapis-geocode", "vehicleJSON" ]
+	buf.forget( 1 )
+	assert buf.kinds( 1 ) == []
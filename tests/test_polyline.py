@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+import pytest
+
+import polyline
+
+
+# the example from Google's encoded polyline documentation
+GOOGLE_EXAMPLE = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+GOOGLE_POINTS = [ ( 38.5, -120.2 ), ( 40.7, -120.95 ), ( 43.252, -126.453 ) ]
+
+
+def assertPointsEqual(actual, expected, places=5):
+	assert len( actual ) == len( expected )
+	for ( lat, lon ), ( expectedLat, expectedLon ) in zip( actual, expected ):
+		assert round( lat - expectedLat, places ) == 0
+		assert round( lon - expectedLon, places ) == 0
+
+
+def test_decodes_the_documented_example():
+	assertPointsEqual( polyline.points( polyline.decode( GOOGLE_EXAMPLE ) ), GOOGLE_POINTS )
+
+
+def test_encodes_the_documented_example():
+	assert polyline.encode( GOOGLE_POINTS ) == GOOGLE_EXAMPLE
+
+
+def test_decode_accepts_text_and_bytes():
+	expected = list( polyline.decode( GOOGLE_EXAMPLE ) )
+	assert list( polyline.decode( u"_p~iF~ps|U_ulLnnqC_mqNvxq`@" ) ) == expected
+	assert list( polyline.decode( bytearray( b"_p~iF~ps|U_ulLnnqC_mqNvxq`@" ) ) ) == expected
+
+
+@pytest.mark.parametrize( "precision", [ 5, 6 ] )
+def test_round_trip(precision):
+	rng = random.Random( 7 )
+	lat = 41.88
+	lon = -87.63
+	track = []
+	for i in range( 500 ):
+		# a second or so apart, with the odd jump and repeated position
+		lat += rng.choice( [ 0.0, rng.uniform( -0.0005, 0.0005 ), rng.uniform( -0.5, 0.5 ) ] )
+		lon += rng.choice( [ 0.0, rng.uniform( -0.0005, 0.0005 ), rng.uniform( -0.5, 0.5 ) ] )
+		track.append( ( round( lat, precision ), round( lon, precision ) ) )
+
+	coords = polyline.decode( polyline.encode( track, precision ), precision )
+	assert len( coords ) == 2 * len( track )
+	assertPointsEqual( polyline.points( coords ), track, precision )
+
+
+def test_round_trip_across_hemispheres():
+	track = [ ( 0.0, 0.0 ), ( -33.86785, 151.20732 ), ( 64.14631, -21.94222 ), ( -90.0, 180.0 ), ( 90.0, -180.0 ) ]
+	assertPointsEqual( polyline.points( polyline.decode( polyline.encode( track ) ) ), track )
+
+
+def test_empty_track():
+	assert polyline.encode( [] ) == ""
+	assert len( polyline.decode( "" ) ) == 0
+
+
+@pytest.mark.parametrize( "encoded", [ "_p~iF", "_p~iF~ps|U_", "_p~iF~ps|U!!" ] )
+def test_rejects_malformed_polylines(encoded):
+	with pytest.raises( ValueError ):
+		polyline.decode( encoded )
+
+
+def test_geojson_positions_are_lon_lat():
+	gps = { "type": "LineString", "coordinates": [ [ -120.2, 38.5 ], [ -120.95, 40.7, 210.0 ] ] }
+	assert polyline.points( polyline.decodeGeoJson( gps ) ) == [ ( 38.5, -120.2 ), ( 40.7, -120.95 ) ]
+	assert polyline.points( polyline.decodeGeoJson( gps[ "coordinates" ] ) ) == [ ( 38.5, -120.2 ), ( 40.7, -120.95 ) ]
+	assert len( polyline.decodeGeoJson( { "type": "LineString" } ) ) == 0
+
+
+def test_both_trip_formats_decode_alike():
+	geojson = { "type": "LineString", "coordinates": [ [ lon, lat ] for lat, lon in GOOGLE_POINTS ] }
+	fromPolyline = polyline.decodeTripGps( GOOGLE_EXAMPLE, "polyline" )
+	fromGeoJson = polyline.decodeTripGps( geojson, "geojson" )
+	assertPointsEqual( polyline.points( fromPolyline ), polyline.points( fromGeoJson ) )
+	assert len( polyline.decodeTripGps( None, "polyline" ) ) == 0
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+from resilience import RetryPolicy, CircuitBreaker
+
+
+def makeBreaker(clock, logger):
+	return CircuitBreaker( "trips", logger, failureThreshold=3, resetTimeout=60, clock=clock )
+
+
+def test_retryable_status_codes():
+	policy = RetryPolicy()
+	assert policy.isRetryable( None )
+	assert policy.isRetryable( 429 )
+	assert policy.isRetryable( 503 )
+	assert not policy.isRetryable( 400 )
+	assert not policy.isRetryable( 401 )
+	assert not policy.isRetryable( 404 )
+
+
+def test_retry_delay_is_capped_exponential_jitter():
+	policy = RetryPolicy( attempts=6, baseDelay=0.5, maxDelay=4.0 )
+	random.seed( 1 )
+	for attempt, cap in ( ( 1, 0.5 ), ( 2, 1.0 ), ( 3, 2.0 ), ( 4, 4.0 ), ( 5, 4.0 ) ):
+		delays = [ policy.delay( attempt ) for i in range( 200 ) ]
+		assert 0 <= min( delays )
+		assert max( delays ) <= cap
+		assert max( delays ) > cap / 2
+
+
+def test_opens_after_consecutive_failures(clock, logger):
+	breaker = makeBreaker( clock, logger )
+	breaker.recordFailure()
+	breaker.recordFailure()
+	assert breaker.state == CircuitBreaker.CLOSED
+	assert breaker.allow()
+	breaker.recordFailure()
+	assert breaker.state == CircuitBreaker.OPEN
+	assert not breaker.allow()
+	assert breaker.rejected == 1
+
+
+def test_success_resets_the_failure_count(clock, logger):
+	breaker = makeBreaker( clock, logger )
+	breaker.recordFailure()
+	breaker.recordFailure()
+	breaker.recordSuccess()
+	breaker.recordFailure()
+	breaker.recordFailure()
+	assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_lets_one_probe_through(clock, logger):
+	breaker = makeBreaker( clock, logger )
+	for i in range( 3 ):
+		breaker.recordFailure()
+	clock.advance( 59 )
+	assert not breaker.allow()
+	clock.advance( 1 )
+	assert breaker.allow()
+	assert breaker.state == CircuitBreaker.HALF_OPEN
+	assert not breaker.allow()
+
+
+def test_successful_probe_closes_the_circuit(clock, logger):
+	breaker = makeBreaker( clock, logger )
+	for i in range( 3 ):
+		breaker.recordFailure()
+	clock.advance( 60 )
+	assert breaker.allow()
+	breaker.recordSuccess()
+	assert breaker.state == CircuitBreaker.CLOSED
+	assert breaker.failures == 0
+	assert breaker.allow()
+	assert breaker.allow()
+
+
+def test_failed_probe_reopens_for_another_timeout(clock, logger):
+	breaker = makeBreaker( clock, logger )
+	for i in range( 3 ):
+		breaker.recordFailure()
+	clock.advance( 60 )
+	assert breaker.allow()
+	breaker.recordFailure()
+	assert breaker.state == CircuitBreaker.OPEN
+	assert breaker.openedAt == clock()
+	clock.advance( 30 )
+	assert not breaker.allow()
+	clock.advance( 30 )
+	assert breaker.allow()
+
+
+def test_release_frees_the_probe_without_counting(clock, logger):
+	breaker = makeBreaker( clock, logger )
+	for i in range( 3 ):
+		breaker.recordFailure()
+	clock.advance( 60 )
+	assert breaker.allow()
+	breaker.release()
+	assert breaker.state == CircuitBreaker.HALF_OPEN
+	assert breaker.failures == 3
+	# the slot is free for the next request
+	assert breaker.allow()
+	assert not breaker.allow()
+
+
+def test_release_leaves_a_closed_circuit_alone(clock, logger):
+	breaker = makeBreaker( clock, logger )
+	breaker.recordFailure()
+	breaker.release()
+	assert breaker.state == CircuitBreaker.CLOSED
+	assert breaker.failures == 1
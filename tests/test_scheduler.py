@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+from scheduler import PollScheduler
+
+
+def test_new_devices_are_due_immediately():
+	scheduler = PollScheduler( 10, 60, 900 )
+	scheduler.add( "car", now=1000 )
+	assert "car" in scheduler
+	assert scheduler.nextDue() == 1000
+	assert scheduler.popDue( now=1000 ) == [ "car" ]
+	assert scheduler.popDue( now=1000 ) == []
+
+
+def test_popdue_requeues_at_the_current_interval():
+	scheduler = PollScheduler( 10, 60, 900 )
+	scheduler.add( "car", now=1000 )
+	scheduler.popDue( now=1000 )
+	assert scheduler.nextDue() == 1010
+	assert scheduler.popDue( now=1009 ) == []
+	assert scheduler.popDue( now=1010 ) == [ "car" ]
+
+
+def test_parked_backoff_doubles_up_to_the_maximum():
+	scheduler = PollScheduler( 10, 60, 900 )
+	scheduler.add( "car", now=0 )
+	intervals = []
+	now = 0
+	for i in range( 6 ):
+		scheduler.reschedule( "car", False, now=now )
+		intervals.append( scheduler.interval( "car" ) )
+		now = scheduler.nextDue()
+	assert intervals == [ 60, 120, 240, 480, 900, 900 ]
+
+
+def test_activity_returns_to_the_active_interval():
+	scheduler = PollScheduler( 10, 60, 900 )
+	scheduler.add( "car", now=0 )
+	for i in range( 4 ):
+		scheduler.reschedule( "car", False, now=0 )
+	assert scheduler.interval( "car" ) == 480
+	scheduler.reschedule( "car", True, now=100 )
+	assert scheduler.interval( "car" ) == 10
+	assert scheduler.nextDue() == 110
+
+
+def test_wake_resets_backoff_and_polls_now():
+	scheduler = PollScheduler( 10, 60, 900 )
+	scheduler.add( "car", now=0 )
+	for i in range( 5 ):
+		scheduler.reschedule( "car", False, now=0 )
+	assert scheduler.interval( "car" ) == 900
+
+	scheduler.wake( "car", now=50 )
+	assert scheduler.interval( "car" ) == 10
+	assert scheduler.nextDue() == 50
+	# the superseded entry at 900 is not returned again
+	assert scheduler.popDue( now=1000 ) == [ "car" ]
+	assert scheduler.nextDue() == 1010
+
+	# parked again, the backoff starts over
+	scheduler.reschedule( "car", False, now=1000 )
+	assert scheduler.interval( "car" ) == 60
+
+
+def test_unknown_and_removed_devices_are_ignored():
+	scheduler = PollScheduler( 10, 60, 900 )
+	scheduler.wake( "ghost", now=0 )
+	scheduler.reschedule( "ghost", True, now=0 )
+	assert scheduler.nextDue() == None
+
+	scheduler.add( "car", now=0 )
+	scheduler.remove( "car" )
+	assert "car" not in scheduler
+	assert scheduler.popDue( now=100 ) == []
+	assert scheduler.nextDue() == None
+
+
+def test_set_intervals_clamps_existing_devices():
+	scheduler = PollScheduler( 10, 60, 900 )
+	scheduler.add( "car", now=0 )
+	for i in range( 5 ):
+		scheduler.reschedule( "car", False, now=0 )
+	scheduler.setIntervals( 30, 60, 300 )
+	assert scheduler.interval( "car" ) == 300
+
+	scheduler.wake( "car", now=0 )
+	assert scheduler.interval( "car" ) == 30
+
+
+def test_popdue_orders_devices_by_due_time():
+	scheduler = PollScheduler( 10, 60, 900 )
+	scheduler.add( "a", now=5 )
+	scheduler.add( "b", now=1 )
+	scheduler.add( "c", now=3 )
+	assert scheduler.popDue( now=5 ) == [ "b", "c", "a" ]
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+import pytest
+
+from statewriter import StateWriter
+
+
+class FakeDevice(object):
+
+	# records each updateStatesOnServer call, and applies it like the server would
+
+	def __init__(self, id, states=None):
+		self.id = id
+		self.states = dict( states or {} )
+		self.updates = []
+		self.fail = False
+
+
+	def updateStatesOnServer(self, keyValueList):
+		if( self.fail ):
+			raise IOError( "server went away" )
+		self.updates.append( [ ( item['key'], item['value'] ) for item in keyValueList ] )
+		for item in keyValueList:
+			self.states[ item['key'] ] = item['value']
+
+
+def runOnThread(fn):
+	t = threading.Thread( target=fn )
+	t.start()
+	t.join( 5 )
+
+
+def test_one_call_per_flush_in_set_order(logger):
+	writer = StateWriter( logger )
+	dev = FakeDevice( 1 )
+	writer.set( dev, "speed", 30 )
+	writer.setList( dev, [ { 'key': "lat", 'value': 41.9 }, { 'key': "lon", 'value': -87.6 } ] )
+	writer.set( dev, "speed", 31 )
+	assert dev.updates == []
+	assert writer.flush( dev ) == 3
+	assert dev.updates == [ [ ( "speed", 31 ), ( "lat", 41.9 ), ( "lon", -87.6 ) ] ]
+	assert writer.flush( dev ) == 0
+	assert len( dev.updates ) == 1
+
+
+def test_unchanged_values_are_not_sent_again(logger):
+	writer = StateWriter( logger )
+	dev = FakeDevice( 1 )
+	writer.set( dev, "speed", 30 )
+	writer.set( dev, "isRunning", True )
+	writer.flush( dev )
+
+	writer.set( dev, "speed", 30 )
+	writer.set( dev, "isRunning", True )
+	assert writer.flush( dev ) == 0
+	writer.set( dev, "speed", 0 )
+	writer.set( dev, "isRunning", True )
+	assert writer.flush( dev ) == 1
+	assert dev.updates[-1] == [ ( "speed", 0 ) ]
+	assert writer.written == 3
+	assert writer.skipped == 3
+
+
+def test_first_flush_compares_with_the_server_states(logger):
+	writer = StateWriter( logger )
+	# states come back from the server as text
+	dev = FakeDevice( 1, { "speed": u"30", "vin": u"1FT" } )
+	writer.set( dev, "speed", 30 )
+	writer.set( dev, "vin", "1FT" )
+	writer.set( dev, "nickname", "Truck" )
+	assert writer.flush( dev ) == 1
+	assert dev.updates == [ [ ( "nickname", "Truck" ) ] ]
+
+
+def test_batches_belong_to_the_thread_that_built_them(logger):
+	writer = StateWriter( logger )
+	dev = FakeDevice( 1 )
+	writer.set( dev, "speed", 30 )
+	seen = []
+
+	def other():
+		writer.set( dev, "battery-status", "normal" )
+		seen.append( writer.get( dev, "speed" ) )
+		seen.append( writer.flush( dev ) )
+	runOnThread( other )
+
+	assert seen == [ None, 1 ]
+	assert dev.updates == [ [ ( "battery-status", "normal" ) ] ]
+	assert writer.get( dev, "speed" ) == 30
+	assert writer.flush( dev ) == 1
+	assert dev.updates[-1] == [ ( "speed", 30 ) ]
+
+
+def test_batches_are_per_device(logger):
+	writer = StateWriter( logger )
+	car = FakeDevice( 1 )
+	truck = FakeDevice( 2 )
+	writer.set( car, "speed", 30 )
+	writer.set( truck, "speed", 50 )
+	writer.flush( truck )
+	assert car.updates == []
+	assert truck.updates == [ [ ( "speed", 50 ) ] ]
+
+
+def test_get_prefers_pending_then_pushed_then_server(logger):
+	writer = StateWriter( logger )
+	dev = FakeDevice( 1, { "speed": u"10" } )
+	assert writer.get( dev, "speed" ) == u"10"
+	assert writer.get( dev, "missing", "default" ) == "default"
+	writer.set( dev, "speed", 20 )
+	assert writer.get( dev, "speed" ) == 20
+	writer.flush( dev )
+	dev.states[ "speed" ] = u"stale"
+	assert writer.get( dev, "speed" ) == 20
+
+
+def test_failed_flush_is_sent_again(logger):
+	writer = StateWriter( logger )
+	dev = FakeDevice( 1 )
+	writer.set( dev, "speed", 30 )
+	writer.flush( dev )
+
+	dev.fail = True
+	writer.set( dev, "speed", 40 )
+	writer.set( dev, "lat", 41.9 )
+	with pytest.raises( IOError ):
+		writer.flush( dev )
+
+	# nothing was marked as pushed, so the same values go out next time
+	dev.fail = False
+	writer.set( dev, "speed", 40 )
+	writer.set( dev, "lat", 41.9 )
+	assert writer.flush( dev ) == 2
+	assert dev.updates[-1] == [ ( "speed", 40 ), ( "lat", 41.9 ) ]
+
+
+def test_forget_drops_pending_and_pushed_values(logger):
+	writer = StateWriter( logger )
+	dev = FakeDevice( 1 )
+	writer.set( dev, "speed", 30 )
+	writer.flush( dev )
+	writer.set( dev, "lat", 41.9 )
+	writer.forget( dev.id )
+	assert writer.flush( dev ) == 0
+
+	# without lastPushed the server's states decide again
+	dev.states[ "speed" ] = u"25"
+	writer.set( dev, "speed", 30 )
+	assert writer.flush( dev ) == 1
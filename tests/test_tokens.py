@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+import time
+
+from tokens import TokenManager
+
+
+def tokenJson(token, expiresIn=3600):
+	return json.dumps( { "access_token": token, "expires_in": expiresIn } )
+
+
+class Renewer(object):
+
+	# renewFn for a TokenManager: hands out token-1, token-2, ... and can be held
+	# inside the renewal to line up concurrent callers
+
+	def __init__(self, clock, block=False):
+		self.clock = clock
+		self.manager = None
+		self.calls = 0
+		self.entered = threading.Event()
+		self.release = threading.Event()
+		if( not block ):
+			self.release.set()
+
+
+	def __call__(self):
+		self.calls += 1
+		self.entered.set()
+		self.release.wait( 5 )
+		return self.manager.load( tokenJson( "token-%d" % self.calls ), self.clock() )
+
+
+def makeManager(clock, logger, block=False):
+	renewer = Renewer( clock, block )
+	manager = TokenManager( renewer, logger, refreshAhead=300, clock=clock )
+	renewer.manager = manager
+	return manager, renewer
+
+
+def waitFor(condition, timeout=5.0):
+	deadline = time.time() + timeout
+	while not condition():
+		if( time.time() >= deadline ):
+			return False
+		time.sleep( 0.01 )
+	return True
+
+
+def test_load_parses_token_and_expiry(clock, logger):
+	manager, renewer = makeManager( clock, logger )
+	assert manager.load( tokenJson( "abc", 3600 ), 500 )
+	assert manager.token == "abc"
+	assert manager.expiresAt == 4100
+	assert not manager.load( "not json" )
+	assert not manager.load( json.dumps( { "error": "invalid_grant" } ) )
+	assert manager.token == "abc"
+
+
+def test_load_without_obtained_time_has_no_expiry(clock, logger):
+	manager, renewer = makeManager( clock, logger )
+	manager.load( tokenJson( "abc" ) )
+	clock.advance( 10 ** 6 )
+	assert manager.getToken() == "abc"
+	assert renewer.calls == 0
+
+
+def test_first_call_renews_synchronously(clock, logger):
+	manager, renewer = makeManager( clock, logger )
+	assert manager.getToken() == "token-1"
+	assert manager.getToken() == "token-1"
+	assert renewer.calls == 1
+
+
+def test_renews_in_background_ahead_of_expiry(clock, logger):
+	manager, renewer = makeManager( clock, logger, block=True )
+	manager.load( tokenJson( "current", 3600 ), clock() )
+	clock.advance( 3600 - 300 )
+
+	# inside the refresh-ahead window: callers keep the current token and only one renewal starts
+	assert manager.getToken() == "current"
+	assert renewer.entered.wait( 5 )
+	assert manager.getToken() == "current"
+	assert manager.getToken() == "current"
+	renewer.release.set()
+	assert waitFor( lambda: not manager.refreshing )
+	assert renewer.calls == 1
+	assert manager.getToken() == "token-1"
+
+
+def test_concurrent_callers_share_one_renewal_when_expired(clock, logger):
+	manager, renewer = makeManager( clock, logger, block=True )
+	manager.load( tokenJson( "expired", 3600 ), clock() )
+	clock.advance( 3600 )
+
+	results = []
+	resultsLock = threading.Lock()
+
+	def caller():
+		token = manager.getToken()
+		with resultsLock:
+			results.append( token )
+
+	threads = [ threading.Thread( target=caller ) ]
+	threads[0].start()
+	assert renewer.entered.wait( 5 )
+	for i in range( 7 ):
+		t = threading.Thread( target=caller )
+		t.start()
+		threads.append( t )
+	renewer.release.set()
+	for t in threads:
+		t.join( 5 )
+
+	assert renewer.calls == 1
+	assert results == [ "token-1" ] * 8
+
+
+def test_invalidate_renews_the_rejected_token(clock, logger):
+	manager, renewer = makeManager( clock, logger )
+	manager.load( tokenJson( "abc" ), clock() )
+	manager.invalidate( "abc" )
+	assert renewer.calls == 1
+	assert manager.getToken() == "token-1"
+
+
+def test_invalidate_of_an_already_replaced_token_does_nothing(clock, logger):
+	manager, renewer = makeManager( clock, logger )
+	manager.load( tokenJson( "abc" ), clock() )
+	manager.invalidate( "abc" )
+	# a second request that failed with the old token
+	manager.invalidate( "abc" )
+	assert renewer.calls == 1
+
+
+def test_failed_renewals_are_counted(clock, logger):
+	def failing():
+		raise IOError( "offline" )
+
+	manager = TokenManager( failing, logger, clock=clock )
+	assert manager.getToken() == None
+	manager.renewFn = lambda: False
+	assert manager.getToken() == None
+	assert manager.renewals == 2
+	assert manager.renewalFailures == 2
+	assert not manager.refreshing
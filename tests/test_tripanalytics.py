@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+import pytest
+
+import tripanalytics
+
+
+def samples(seed=3, count=600):
+	# a seeded drive, one sample a second: stops, hard starts and stops, a few
+	# missing speeds, a repeated timestamp and a gap between two trips
+	rng = random.Random( seed )
+	ts = []
+	lat = []
+	lon = []
+	speed = []
+	t = 1602749700000
+	position = [ 41.88, -87.63 ]
+	mph = 0.0
+	for i in range( count ):
+		if( i == count // 2 ):
+			t += 900 * 1000
+		elif( i % 97 != 0 ):
+			t += 1000
+		if( rng.random() < 0.05 ):
+			mph = 0.0 if rng.random() < 0.5 else min( 75.0, mph + 12 )
+		else:
+			mph = min( 75.0, max( 0.0, mph + rng.uniform( -5, 6 ) ) )
+		position[0] += mph / 3600.0 / 69.0 * rng.uniform( 0.5, 1.0 )
+		position[1] += mph / 3600.0 / 51.0 * rng.uniform( -1.0, 1.0 )
+		ts.append( t )
+		lat.append( position[0] )
+		lon.append( position[1] )
+		speed.append( None if rng.random() < 0.03 else round( mph, 1 ) )
+	return ts, lat, lon, speed
+
+
+def assertSameStats(actual, expected):
+	assert sorted( actual ) == sorted( expected )
+	for key, value in expected.items():
+		if( isinstance( value, list ) ):
+			assert actual[ key ] == pytest.approx( value, rel=1e-9, abs=1e-9 ), key
+		else:
+			assert actual[ key ] == pytest.approx( value, rel=1e-9, abs=1e-9 ), key
+
+
+def test_numpy_and_plain_paths_agree():
+	numpy = pytest.importorskip( "numpy" )
+	assert tripanalytics.numpy is numpy
+
+	ts, lat, lon, speed = samples()
+	for args in ( ( ts, lat, lon, speed ), ( ts, lat, lon, [ None ] * len( ts ) ), ( ts[:2], lat[:2], lon[:2], speed[:2] ), ( ts[:1], lat[:1], lon[:1], speed[:1] ) ):
+		assertSameStats( tripanalytics._analyzeArrays( *( args + ( tripanalytics.SPEED_BANDS, ) ) ), tripanalytics._analyzeLists( *( args + ( tripanalytics.SPEED_BANDS, ) ) ) )
+
+
+@pytest.mark.parametrize( "useNumpy", [ False, True ] )
+def test_split_trips_at_gaps(monkeypatch, useNumpy):
+	if( useNumpy ):
+		pytest.importorskip( "numpy" )
+	else:
+		monkeypatch.setattr( tripanalytics, "numpy", None )
+	ts, lat, lon, speed = samples()
+	assert tripanalytics.splitTrips( ts ) == [ ( 0, 300 ), ( 300, 600 ) ]
+	assert tripanalytics.splitTrips( [] ) == []
+
+
+@pytest.mark.parametrize( "useNumpy", [ False, True ] )
+def test_known_trip(monkeypatch, useNumpy):
+	if( useNumpy ):
+		pytest.importorskip( "numpy" )
+	else:
+		monkeypatch.setattr( tripanalytics, "numpy", None )
+
+	# a second apart along a meridian: idle, a hard start, cruise, a hard stop
+	speeds = [ 0, 0, 10, 20, 30, 30, 30, 15, 0, 0 ]
+	ts = [ 1000 * i for i in range( len( speeds ) ) ]
+	lat = [ 40.0 + 0.0001 * i for i in range( len( speeds ) ) ]
+	lon = [ -75.0 ] * len( speeds )
+	result = tripanalytics.analyzeTrip( ts, lat, lon, speeds )
+
+	assert result[ "points" ] == 10
+	assert result[ "duration" ] == 9.0
+	# interval speeds 0, 5, 15, 25, 30, 30, 22.5, 7.5, 0
+	assert result[ "movingTime" ] == 7.0
+	assert result[ "idleTime" ] == 2.0
+	assert result[ "maxSpeed" ] == 30
+	assert result[ "hardAccelerations" ] == 1
+	assert result[ "hardBrakes" ] == 1
+	assert result[ "speedBands" ] == [ ( "0-25", 6.0 ), ( "25-45", 3.0 ), ( "45-65", 0.0 ), ( "65+", 0.0 ) ]
+	assert result[ "distance" ] == pytest.approx( 9 * 0.0001 * 69.09, rel=1e-3 )
+	assert result[ "averageSpeed" ] == pytest.approx( result[ "distance" ] / ( 7.0 / 3600 ) )
+
+
+def test_empty_trip():
+	assert tripanalytics.analyzeTrip( [], [], [] ) == None
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import sqlite3
+
+import polyline
+from tripstore import TripStore, tripKey
+
+
+GPS = "_p~iF~ps|U_ulLnnqC"
+
+
+def trip(transactionId, startTime, endTime, **fields):
+	result = { "transactionId": transactionId, "imei": "a", "startTime": startTime, "endTime": endTime, "distance": 1.5, "gps": GPS }
+	result.update( fields )
+	return result
+
+
+def makeStore(tmpdir):
+	return TripStore( str( tmpdir.join( "trips.sqlite" ) ) )
+
+
+def test_upsert_returns_the_high_water_mark(tmpdir):
+	store = makeStore( tmpdir )
+	trips = [
+		trip( "t2", "2020-10-15T09:00:00.000Z", "2020-10-15T09:30:00.000Z" ),
+		trip( "t1", "2020-10-15T08:00:00.000Z", "2020-10-15T08:20:00.000Z" ),
+		trip( "t3", "2020-10-15T10:00:00.000Z", None ),
+	]
+	assert store.upsertTrips( "a", trips, "polyline" ) == "2020-10-15T09:30:00.000Z"
+	assert store.upsertTrips( "a", [], "polyline" ) == None
+	store.close()
+
+
+def test_overlapping_windows_are_harmless(tmpdir):
+	store = makeStore( tmpdir )
+	store.upsertTrips( "a", [ trip( "t1", "2020-10-15T08:00:00.000Z", "2020-10-15T08:20:00.000Z" ) ], "polyline" )
+	store.upsertTrips( "a", [ trip( "t1", "2020-10-15T08:00:00.000Z", "2020-10-15T08:20:00.000Z", distance=1.6 ), trip( "t2", "2020-10-15T09:00:00.000Z", "2020-10-15T09:30:00.000Z" ) ], "polyline" )
+	trips = store.getTrips( "a" )
+	assert [ ( t[ "transactionId" ], t[ "distance" ] ) for t in trips ] == [ ( "t1", 1.6 ), ( "t2", 1.5 ) ]
+	assert polyline.points( trips[0][ "gps" ] ) == polyline.points( polyline.decode( GPS ) )
+	store.close()
+
+
+def test_trips_without_a_transaction_id_are_stored_once(tmpdir):
+	store = makeStore( tmpdir )
+	noId = trip( None, "2020-10-15T08:00:00.000Z", "2020-10-15T08:20:00.000Z" )
+	noIdOrStart = trip( None, None, "2020-10-15T11:00:00.000Z" )
+	for sync in range( 3 ):
+		assert store.upsertTrips( "a", [ noId, noIdOrStart ], "polyline" ) == "2020-10-15T08:20:00.000Z"
+	assert store.countTrips( "a" ) == 1
+	assert tripKey( "a", noId ) == "a/2020-10-15T08:00:00.000Z"
+	assert tripKey( "a", noIdOrStart ) == None
+	assert store.upsertTrips( "a", [ noIdOrStart ], "polyline" ) == None
+	store.close()
+
+
+def test_trips_are_filtered_by_imei_and_start_time(tmpdir):
+	store = makeStore( tmpdir )
+	store.upsertTrips( "a", [
+		trip( "t1", "2020-10-15T08:00:00.000Z", "2020-10-15T08:20:00.000Z" ),
+		trip( "t2", "2020-10-15T09:00:00.000Z", "2020-10-15T09:30:00.000Z" ),
+		trip( "t3", "2020-10-15T10:00:00.000Z", "2020-10-15T10:30:00.000Z", imei="b" ),
+	], "polyline" )
+	assert [ t[ "transactionId" ] for t in store.getTrips( "a", "2020-10-15T08:30:00.000Z" ) ] == [ "t2" ]
+	assert [ t[ "transactionId" ] for t in store.getTrips( "a", endTime="2020-10-15T08:30:00.000Z" ) ] == [ "t1" ]
+	assert store.countTrips( "b" ) == 1
+	assert store.countTrips() == 3
+	store.close()
+
+
+def test_geojson_tracks_round_trip(tmpdir):
+	store = makeStore( tmpdir )
+	geojson = { "type": "LineString", "coordinates": [ [ -120.2, 38.5 ], [ -120.95, 40.7 ] ] }
+	store.upsertTrips( "a", [ trip( "t1", "2020-10-15T08:00:00.000Z", "2020-10-15T08:20:00.000Z", gps=geojson ) ], "geojson" )
+	assert polyline.points( store.getTrips( "a" )[0][ "gps" ] ) == [ ( 38.5, -120.2 ), ( 40.7, -120.95 ) ]
+	store.close()
+
+
+def test_sync_state_round_trip(tmpdir):
+	store = makeStore( tmpdir )
+	assert store.getSyncState( "a" ) == ( None, None )
+	store.setSyncState( "a", None, "2020-10-10T00:00:00.000Z" )
+	assert store.getSyncState( "a" ) == ( None, "2020-10-10T00:00:00.000Z" )
+	store.setSyncState( "a", "2020-10-15T09:30:00.000Z", "2020-10-15T12:00:00.000Z" )
+	store.close()
+
+	reopened = makeStore( tmpdir )
+	assert reopened.getSyncState( "a" ) == ( "2020-10-15T09:30:00.000Z", "2020-10-15T12:00:00.000Z" )
+	assert reopened.getSyncState( "b" ) == ( None, None )
+	reopened.close()
+
+
+def test_old_stores_lose_their_null_key_copies(tmpdir):
+	path = str( tmpdir.join( "trips.sqlite" ) )
+	conn = sqlite3.connect( path )
+	conn.execute( "CREATE TABLE trips ( transactionId TEXT PRIMARY KEY, imei TEXT NOT NULL, startTime TEXT, endTime TEXT, distance REAL, averageSpeed REAL, maxSpeed REAL, hardBrakingCount INTEGER, hardAccelerationCount INTEGER, totalIdleDuration REAL, fuelConsumed REAL, startOdometer REAL, endOdometer REAL, timeZone TEXT, gpsFormat TEXT, gps TEXT, json TEXT )" )
+	for i in range( 3 ):
+		conn.execute( "INSERT INTO trips ( transactionId, imei, startTime, json ) VALUES ( NULL, 'a', '2020-10-15T08:00:00.000Z', '{}' )" )
+	conn.execute( "INSERT INTO trips ( transactionId, imei, startTime, json ) VALUES ( NULL, 'a', NULL, '{}' )" )
+	conn.commit()
+	conn.close()
+
+	store = TripStore( path )
+	assert store.countTrips() == 1
+	store.upsertTrips( "a", [ trip( None, "2020-10-15T08:00:00.000Z", "2020-10-15T08:20:00.000Z" ) ], "polyline" )
+	assert store.countTrips() == 1
+	store.close()
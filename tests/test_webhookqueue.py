@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from caches import TTLCache
+from webhookqueue import WebhookQueue, dedupKey, coalesceTripData
+
+
+def hook(payload):
+	# the hookJson HTTPd 2 broadcasts
+	return json.dumps( { "payload": json.dumps( payload ) } )
+
+
+def tripData(imei, timestamp, transactionId="t1"):
+	return { "eventType": "tripData", "imei": imei, "transactionId": transactionId, "data": [ { "timestamp": timestamp, "speed": 30 } ] }
+
+
+def event(payload):
+	return { "received": 0, "hookData": {}, "payload": payload }
+
+
+def run(queue, payloads):
+	# everything is queued before the worker starts, so it is handled as one batch
+	for payload in payloads:
+		queue.put( hook( payload ) if isinstance( payload, dict ) else payload )
+	queue.start()
+	queue.stop()
+
+
+def test_full_queue_drops_new_webhooks(logger):
+	queue = WebhookQueue( lambda events: None, logger, maxSize=2 )
+	assert queue.put( hook( { "eventType": "connect" } ) )
+	assert queue.put( hook( { "eventType": "connect" } ) )
+	assert not queue.put( hook( { "eventType": "connect" } ) )
+	stats = queue.stats()
+	assert ( stats[ "received" ], stats[ "dropped" ], stats[ "depth" ], stats[ "maxDepth" ] ) == ( 3, 1, 2, 2 )
+
+
+def test_queued_webhooks_are_processed_before_stopping(logger):
+	groups = []
+	queue = WebhookQueue( groups.append, logger, maxSize=10 )
+	run( queue, [ { "eventType": "connect", "imei": "a" }, { "eventType": "battery", "imei": "b" } ] )
+	assert [ [ e[ "payload" ][ "eventType" ] for e in group ] for group in groups ] == [ [ "connect" ], [ "battery" ] ]
+	assert queue.stats()[ "processed" ] == 2
+
+
+def test_duplicates_are_dropped_before_processing(clock, logger):
+	groups = []
+	queue = WebhookQueue( groups.append, logger, dedupCache=TTLCache( 100, 600, clock=clock ) )
+	start = { "eventType": "tripStart", "imei": "a", "transactionId": "t1", "start": { "timestamp": "2020-10-15T08:00:00.000Z" } }
+	run( queue, [ start, start, tripData( "a", "2020-10-15T08:00:03.000Z" ), tripData( "a", "2020-10-15T08:00:03.000Z" ) ] )
+	assert queue.stats()[ "duplicates" ] == 2
+	assert sum( len( group ) for group in groups ) == 2
+
+
+def test_unparseable_webhooks_are_counted_and_skipped(logger):
+	groups = []
+	queue = WebhookQueue( groups.append, logger )
+	run( queue, [ "not json", json.dumps( { "payload": "{" } ), { "eventType": "connect", "imei": "a" } ] )
+	assert queue.stats()[ "errors" ] == 2
+	assert len( groups ) == 1
+
+
+def test_processing_errors_dont_stop_the_queue(logger):
+	def processFn(events):
+		if( events[0][ "payload" ][ "imei" ] == "bad" ):
+			raise ValueError( "bad webhook" )
+
+	queue = WebhookQueue( processFn, logger )
+	run( queue, [ { "eventType": "connect", "imei": "bad" }, { "eventType": "connect", "imei": "good" } ] )
+	stats = queue.stats()
+	assert ( stats[ "errors" ], stats[ "processed" ] ) == ( 1, 2 )
+
+
+def test_dedup_key_uses_transaction_and_event_timestamp():
+	assert dedupKey( tripData( "a", "08:00:03" ) ) == ( "a", "tripData", "t1", "08:00:03" )
+	assert dedupKey( { "eventType": "battery", "imei": "a", "battery": { "value": "low", "timestamp": "08:00" } } ) == ( "a", "battery", None, "08:00" )
+	assert dedupKey( { "eventType": "tripEnd", "imei": "a", "transactionId": "t1" } ) == ( "a", "tripEnd", "t1", None )
+	assert dedupKey( { "eventType": "userUpdated", "imei": "a" } ) == None
+
+
+def test_consecutive_trip_data_for_an_imei_is_merged():
+	events = [ event( tripData( "a", "1" ) ), event( tripData( "b", "1" ) ), event( tripData( "a", "2" ) ), event( tripData( "a", "3" ) ), event( tripData( "b", "2" ) ) ]
+	groups = coalesceTripData( events )
+	assert [ [ ( e[ "payload" ][ "imei" ], e[ "payload" ][ "data" ][0][ "timestamp" ] ) for e in group ] for group in groups ] == [
+		[ ( "a", "1" ), ( "a", "2" ), ( "a", "3" ) ],
+		[ ( "b", "1" ), ( "b", "2" ) ],
+	]
+
+
+def test_other_events_break_a_trip_data_run():
+	end = { "eventType": "tripEnd", "imei": "a", "transactionId": "t1" }
+	events = [ event( tripData( "a", "1" ) ), event( end ), event( tripData( "a", "2" ) ), event( tripData( "a", "3" ) ) ]
+	groups = coalesceTripData( events )
+	assert [ len( group ) for group in groups ] == [ 1, 1, 2 ]
+	assert groups[1][0][ "payload" ] is end
+
+
+def test_coalesced_events_are_counted(logger):
+	groups = []
+	queue = WebhookQueue( groups.append, logger )
+	run( queue, [ tripData( "a", str( i ) ) for i in range( 5 ) ] )
+	assert len( groups ) == 1
+	assert queue.stats()[ "coalesced" ] == 4
+	assert queue.stats()[ "processed" ] == 5